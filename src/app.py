@@ -1,8 +1,16 @@
 # Flask server
+import os
 import random
+from concurrent.futures import ThreadPoolExecutor
 
-from flask import Flask, request
-from pythonosc import udp_client
+import numpy as np
+from flask import Flask, Response, jsonify, request
+
+from dataset import WEIGHTINGS
+from function import LogRegUserPreferenceFunc, SGDUserPreferenceFunc
+from osc import OSCTransport
+from population import Population
+from session import ConflictError, SessionManager
 
 app = Flask(__name__)
 
@@ -10,7 +18,173 @@ app = Flask(__name__)
 IP = "127.0.0.1"
 PORT = 57120
 
-client = udp_client.SimpleUDPClient(IP, PORT)
+client = OSCTransport(IP, PORT)
+
+# Sessions are held here, server-side, with idle ones evicted to disk past the
+# memory budget. Advancing runs on the worker pool, so a slow advance only holds
+# up its own session.
+SESSION_MEMORY_BUDGET = 256 * 2 ** 20  # Bytes
+sessions = SessionManager(memory_budget=SESSION_MEMORY_BUDGET)
+workers = ThreadPoolExecutor(max_workers=os.cpu_count())
+MAX_POP_SIZE = 1000  # Per session, so one request can't exhaust the memory
+
+# Populations come back either as packed JSON (columns, with timing as one
+# 16-bit mask per chromosome; bit j is step j) or, with ?format=binary, as raw
+# Population records (see population.RECORD_DTYPE).
+
+
+def error(status, message):
+    return jsonify({"error": message}), status
+
+
+def get_session(session_id):
+    try:
+        return sessions.get(session_id)
+    except KeyError:
+        return None
+
+
+def packed_population(population) -> dict:
+    population = _as_population(population)
+    return {
+        "instrument": population.instrument.tolist(),
+        "expression": population.expression.ravel().tolist(),
+        "timing": population.timing_bits.tolist(),
+    }
+
+
+def _as_population(population) -> Population:
+    if isinstance(population, Population):
+        return population
+    return Population.from_array(population)
+
+
+@app.route("/sessions", methods=["POST"])
+def create_session():
+    options = request.get_json(silent=True) or {}
+    weighting = options.get("weighting")
+    if weighting is not None and weighting not in WEIGHTINGS:
+        return error(400, f"Unknown weighting, expected one of {list(WEIGHTINGS)}")
+
+    try:
+        pop_size = int(options.get("pop_size", 20))
+    except (ValueError, TypeError):
+        return error(400, "pop_size must be an integer")
+    if not 1 <= pop_size <= MAX_POP_SIZE:
+        return error(400, f"pop_size must be between 1 and {MAX_POP_SIZE}")
+    seed = options.get("seed")
+    if seed is not None and (type(seed) is not int or seed < 0):
+        return error(400, "seed must be a non-negative integer")
+
+    online = options.get("online", False)
+    session = sessions.create(
+        function=SGDUserPreferenceFunc if online else LogRegUserPreferenceFunc,
+        pop_size=pop_size,
+        weighting=WEIGHTINGS[weighting]() if weighting else None,
+        seed=seed,
+    )
+    return jsonify(session.status()), 201
+
+
+@app.route("/sessions/<session_id>", methods=["GET"])
+def session_status(session_id):
+    session = get_session(session_id)
+    if session is None:
+        return error(404, "No such session")
+    return jsonify(session.status())
+
+
+@app.route("/sessions/<session_id>", methods=["DELETE"])
+def delete_session(session_id):
+    try:
+        sessions.delete(session_id)
+    except KeyError:
+        return error(404, "No such session")
+    return "", 204
+
+
+@app.route("/sessions/<session_id>/population", methods=["GET"])
+def get_population(session_id):
+    session = get_session(session_id)
+    if session is None:
+        return error(404, "No such session")
+    generation, population = session.current()
+
+    if request.args.get("format") == "binary":
+        return Response(
+            _as_population(population).to_bytes(),
+            mimetype="application/octet-stream",
+            headers={
+                "X-Generation": str(generation),
+                "X-Pop-Size": str(len(population)),
+            },
+        )
+    return jsonify({"generation": generation, **packed_population(population)})
+
+
+@app.route("/sessions/<session_id>/ratings", methods=["POST"])
+def rate(session_id):
+    """Body: {"generation": g, "ratings": [[index, label], ...]}, label 1 for
+    like and 0 for dislike.
+    """
+    session = get_session(session_id)
+    if session is None:
+        return error(404, "No such session")
+    body = request.get_json(silent=True)
+    if not body or "generation" not in body or "ratings" not in body:
+        return error(400, "Expected generation and ratings")
+
+    try:
+        n_ratings = session.rate(int(body["generation"]), body["ratings"])
+    except (ValueError, TypeError) as e:
+        return error(400, str(e))
+    except ConflictError as e:
+        return error(409, str(e))
+    return jsonify({"n_ratings": n_ratings})
+
+
+@app.route("/sessions/<session_id>/advance", methods=["POST"])
+def advance(session_id):
+    """Starts advancing a generation and returns right away (202). Poll the
+    session until "advancing" is false, then fetch the new population (or, if
+    the advance failed, read "error").
+    """
+    session = get_session(session_id)
+    if session is None:
+        return error(404, "No such session")
+    if session.begin_advance():
+        workers.submit(session.advance)
+    return (
+        jsonify(session.status()),
+        202,
+        {"Location": f"/sessions/{session_id}"},
+    )
+
+
+@app.route("/sessions/<session_id>/history", methods=["GET"])
+def history(session_id):
+    """Best and mean evaluation and diversity (see stats.py) of the recent
+    generations, and, with ?populations=1, the populations themselves (packed).
+    """
+    session = get_session(session_id)
+    if session is None:
+        return error(404, "No such session")
+    h = session.recent_history()
+    records = session.statistics()
+    records = records[np.isin(records["generation"], h.generations)]
+
+    # Sessions record every population with its evaluation, so these line up
+    result = {
+        "generations": h.generations,
+        "best": [float(np.min(evals)) for evals in h.evals],
+        "mean": [float(np.mean(evals)) for evals in h.evals],
+        "hamming_diversity": records["hamming_diversity"].tolist(),
+        "euclidean_diversity": records["euclidean_diversity"].tolist(),
+        "duplicate_rate": records["duplicate_rate"].tolist(),
+    }
+    if request.args.get("populations"):
+        result["populations"] = [packed_population(p) for p in h.populations]
+    return jsonify(result)
 
 
 @app.route("/")
@@ -0,0 +1,278 @@
+"""
+benchmark.py
+author: garrick
+
+Benchmarks for the genetic algorithm core and the surrogate hot paths:
+
+  ga/<dynamics>/<pop_size>: seconds per generation of genetic_algorithm
+  op/<operator>/<size>: seconds per call of a single operator
+  surrogate/<fit|eval>/<n_samples>: LogRegUserPreferenceFunc latency against
+    dataset size
+
+Run them and save the results as JSON, then compare two runs to flag
+regressions:
+
+  python benchmark.py run -o before.json
+  python benchmark.py run -o after.json
+  python benchmark.py compare before.json after.json
+
+compare exits with status 1 if anything got slower by more than the threshold,
+so it can gate CI.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from function import (
+    BoothsFunc,
+    LogRegUserPreferenceFunc,
+    RosenbrocksFunc,
+    UniformRandomFunc,
+)
+from genetic import (
+    batch_crossover,
+    batch_init_chromosome,
+    batch_mutate,
+    batch_roulette_wheel_selection,
+    batch_stochastic_universal_sampling,
+    batch_tournament_selection,
+    batch_truncation_selection,
+    booths_batch_problem,
+    booths_problem,
+    crossover,
+    genetic_algorithm_iter,
+    init_chromosome,
+    music_batch_dynamics,
+    music_dynamics,
+    mutate,
+    rosenbrock_batch_problem,
+    rosenbrock_problem,
+    roulette_wheel_selection,
+)
+
+POP_SIZES = [20, 1_000, 100_000, 1_000_000]
+QUICK_POP_SIZES = [20, 1_000]
+MAX_SCALAR_POP_SIZE = 10_000  # Per-chromosome dynamics are too slow beyond this
+DATASET_SIZES = [10, 100, 1_000, 10_000]
+OP_SIZE = 10_000  # Population size for the batch operator benchmarks
+
+# name: (function, dynamics, whether it works on a whole population at once)
+PROBLEMS = {
+    "music_dynamics": (UniformRandomFunc, music_dynamics, False),
+    "music_batch_dynamics": (UniformRandomFunc, music_batch_dynamics, True),
+    "rosenbrock_problem": (RosenbrocksFunc, rosenbrock_problem, False),
+    "rosenbrock_batch_problem": (RosenbrocksFunc, rosenbrock_batch_problem, True),
+    "booths_problem": (BoothsFunc, booths_problem, False),
+    "booths_batch_problem": (BoothsFunc, booths_batch_problem, True),
+}
+
+
+def time_it(fn, min_time=0.2, max_repeats=1000) -> dict:
+    """Calls fn() repeatedly for at least min_time seconds (and at least
+    once).
+
+    Returns:
+      (dict): median, min and mean seconds per call, and the number of calls
+    """
+    times = []
+    start = time.perf_counter()
+    while len(times) < max_repeats:
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+        if time.perf_counter() - start >= min_time:
+            break
+    return {
+        "seconds": float(np.median(times)),
+        "min": float(np.min(times)),
+        "mean": float(np.mean(times)),
+        "repeats": len(times),
+    }
+
+
+def bench_generations(pop_sizes, min_time=1.0, rng=None) -> dict:
+    """Seconds per generation of genetic_algorithm for every problem and
+    population size. Initialization isn't counted.
+    """
+    rng = np.random.default_rng(rng)
+    results = {}
+    for name, (function, dynamics, batch) in PROBLEMS.items():
+        for pop_size in pop_sizes:
+            if not batch and pop_size > MAX_SCALAR_POP_SIZE:
+                continue
+            run = genetic_algorithm_iter(
+                function, dynamics, max_iters=10 ** 9, pop_size=pop_size, rng=rng
+            )
+            next(run)  # Initializes, along with the first generation
+            result = time_it(lambda: next(run), min_time=min_time)
+            result["generations_per_second"] = 1 / result["seconds"]
+            results[f"ga/{name}/{pop_size}"] = result
+            run.close()
+    return results
+
+
+def bench_operators(size=OP_SIZE, min_time=0.2, rng=None) -> dict:
+    """Seconds per call of the scalar operators (one chromosome at a time) and
+    the batch operators (size chromosomes at a time).
+    """
+    rng = np.random.default_rng(rng)
+    c1, c2 = init_chromosome(rng=rng), init_chromosome(rng=rng)
+    y = rng.random(size)
+    P1 = batch_init_chromosome(size, rng=rng)
+    P2 = batch_init_chromosome(size, rng=rng)
+
+    benchmarks = {
+        "op/crossover/1": lambda: crossover(c1, c2, rng=rng),
+        "op/mutate/1": lambda: mutate(c1.copy(), rng=rng),
+        "op/roulette_wheel_selection/1": (
+            lambda: roulette_wheel_selection(y[:20], rng=rng)
+        ),
+        f"op/batch_crossover/{size}": lambda: batch_crossover(P1, P2, rng=rng),
+        f"op/batch_mutate/{size}": lambda: batch_mutate(P1.copy(), rng=rng),
+    }
+    for selection in [
+        batch_roulette_wheel_selection,
+        batch_stochastic_universal_sampling,
+        batch_truncation_selection,
+        batch_tournament_selection,
+    ]:
+        benchmarks[f"op/{selection.__name__}/{size}"] = (
+            lambda selection=selection: selection(y, size, rng=rng)
+        )
+
+    return {
+        name: time_it(fn, min_time=min_time) for name, fn in benchmarks.items()
+    }
+
+
+def bench_surrogate(dataset_sizes, eval_size=1_000, min_time=0.5, rng=None) -> dict:
+    """Seconds per LogRegUserPreferenceFunc fit on n_samples ratings, and per
+    eval of eval_size chromosomes with a model fit on n_samples ratings.
+    """
+    rng = np.random.default_rng(rng)
+    X_eval = batch_init_chromosome(eval_size, rng=rng)
+    results = {}
+    for n_samples in dataset_sizes:
+        X = batch_init_chromosome(n_samples, rng=rng)
+        labels = np.arange(n_samples) % 2  # Guarantees both labels
+        f = LogRegUserPreferenceFunc()
+        results[f"surrogate/fit/{n_samples}"] = time_it(
+            lambda: f.fit(X, labels), min_time=min_time
+        )
+        results[f"surrogate/eval/{n_samples}"] = time_it(
+            lambda: f(X_eval), min_time=min_time
+        )
+    return results
+
+
+def metadata() -> dict:
+    import sklearn
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+    }
+
+
+def run(quick=False, pop_sizes=None, seed=222) -> dict:
+    """Runs every benchmark.
+
+    Args:
+      quick (bool): only small population and dataset sizes, and shorter
+        timings, e.g. for a smoke test
+      pop_sizes (list): overrides the population sizes of the ga/ benchmarks
+
+    Returns:
+      (dict): {"meta": ..., "results": {name: timings}}
+    """
+    scale = 0.25 if quick else 1
+    pop_sizes = pop_sizes or (QUICK_POP_SIZES if quick else POP_SIZES)
+    dataset_sizes = DATASET_SIZES[:2] if quick else DATASET_SIZES
+
+    results = {}
+    results.update(bench_generations(pop_sizes, min_time=1.0 * scale, rng=seed))
+    results.update(bench_operators(min_time=0.2 * scale, rng=seed))
+    results.update(bench_surrogate(dataset_sizes, min_time=0.5 * scale, rng=seed))
+    return {"meta": metadata(), "results": results}
+
+
+def compare(baseline: dict, current: dict, threshold=0.1) -> list:
+    """Compares the median timings of two runs.
+
+    Args:
+      baseline, current (dict): results of run()
+      threshold (float): relative slowdown beyond which a benchmark counts as
+        a regression, e.g. 0.1 for 10%
+
+    Returns:
+      (list): (name, baseline seconds, current seconds, ratio, regressed) for
+        every benchmark in both runs, ratio being current / baseline
+    """
+    rows = []
+    for name, before in baseline["results"].items():
+        after = current["results"].get(name)
+        if after is None:
+            continue
+        ratio = after["seconds"] / before["seconds"]
+        rows.append(
+            (name, before["seconds"], after["seconds"], ratio, ratio > 1 + threshold)
+        )
+    return rows
+
+
+def print_comparison(rows) -> None:
+    width = max([len(row[0]) for row in rows] + [9])
+    print(f"{'benchmark':<{width}}  {'before':>10}  {'after':>10}  {'ratio':>6}")
+    for name, before, after, ratio, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<{width}}  {before:10.3g}  {after:10.3g}  {ratio:6.2f}{flag}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="genalg-sequencer benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("-o", "--output", help="JSON file to save results to")
+    run_parser.add_argument("--quick", action="store_true", help="small sizes only")
+    run_parser.add_argument("--pop-sizes", type=int, nargs="+")
+    run_parser.add_argument("--seed", type=int, default=222)
+
+    compare_parser = commands.add_parser("compare", help="compare two runs")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative slowdown counted as a regression (default: 0.1)",
+    )
+    args = parser.parse_args()
+
+    if args.command == "run":
+        report = run(quick=args.quick, pop_sizes=args.pop_sizes, seed=args.seed)
+        for name, result in report["results"].items():
+            print(f"{name}: {result['seconds']:.3g}s")
+        if args.output:
+            with open(args.output, "w") as fp:
+                json.dump(report, fp, indent=2)
+    else:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        with open(args.current) as fp:
+            current = json.load(fp)
+        rows = compare(baseline, current, args.threshold)
+        print_comparison(rows)
+        n_regressed = sum(row[4] for row in rows)
+        if n_regressed:
+            print(f"{n_regressed} regression(s) beyond {args.threshold:.0%}")
+            sys.exit(1)
@@ -0,0 +1,142 @@
+"""
+checkpoint.py
+author: garrick
+
+Checkpointing for long genetic algorithm runs and REPL sessions. A checkpoint
+directory holds:
+
+  state.pkl: everything needed to pick up where we left off (current
+    population, generation, objective function, random state, ...). Replaced
+    atomically on every save, so it's never half written.
+  archive_<start>.pkl: the generations produced since the previous save. Only
+    new generations are written each time, in the background, so a large
+    archive doesn't slow down the generation loop.
+"""
+import glob
+import os
+import pickle
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+STATE_FILE = "state.pkl"
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Writes data to a temporary file next to path, then renames it into
+    place, so readers see either the old file or the new one.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class Checkpointer:
+    def __init__(self, directory: str, every: int = 10) -> None:
+        """
+        Args:
+          directory (str): where to keep the checkpoint; created if needed
+          every (int): generations between saves (see due())
+
+        Call load() before recording anything to resume from an existing 
+        checkpoint; otherwise it's overwritten.
+        """
+        self.directory = directory
+        self.every = every
+        os.makedirs(directory, exist_ok=True)
+        self.pending = []  # Generations not yet archived
+        self.n_archived = 0
+        self.writer = ThreadPoolExecutor(max_workers=1)  # Keeps writes in order
+        self.last_write = None
+
+    def record(self, generation) -> None:
+        """Buffer a generation (e.g. a GenAlgGeneration) for the archive."""
+        self.pending.append(generation)
+
+    def due(self, iter) -> bool:
+        return iter % self.every == 0
+
+    def save(self, state: dict) -> None:
+        """Saves state and archives any recorded generations. state is pickled
+        right away, so the caller is free to keep modifying it; the archive is
+        written in the background (generations shouldn't be modified after
+        they're recorded).
+        """
+        pending, self.pending = self.pending, []
+        start = self.n_archived
+        self.n_archived += len(pending)
+        payload = {"state": state, "n_archived": self.n_archived}
+        state_bytes = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self.wait()  # Surface errors from the previous write
+        self.last_write = self.writer.submit(self._write, state_bytes, start, pending)
+
+    def _write(self, state_bytes, start, pending) -> None:
+        # The archive goes first, so the state never refers to generations that
+        # aren't on disk yet
+        if pending:
+            data = pickle.dumps(pending, protocol=pickle.HIGHEST_PROTOCOL)
+            atomic_write(self._archive_file(start), data)
+        atomic_write(os.path.join(self.directory, STATE_FILE), state_bytes)
+
+    def _archive_file(self, start):
+        return os.path.join(self.directory, f"archive_{start:09d}.pkl")
+
+    def _archive_files(self) -> list:
+        """(start, path) of every archive file on disk, by start."""
+        paths = glob.glob(os.path.join(self.directory, "archive_*.pkl"))
+        starts = [int(os.path.basename(path)[len("archive_") : -4]) for path in paths]
+        return sorted(zip(starts, paths))
+
+    def wait(self) -> None:
+        """Blocks until outstanding writes are on disk."""
+        if self.last_write is not None:
+            self.last_write.result()
+
+    def load(self):
+        """
+        Returns:
+          (dict): the last saved state, or None if there's no checkpoint
+        """
+        self.wait()
+        path = os.path.join(self.directory, STATE_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as fp:
+            payload = pickle.load(fp)
+        # Anything archived after this state was saved is discarded, since the
+        # run resumes from here
+        self.n_archived = payload["n_archived"]
+        for start, path in self._archive_files():
+            if start >= self.n_archived:
+                os.remove(path)
+        return payload["state"]
+
+    def archive(self):
+        """Yields archived generations in order. Only the chain of archive
+        files each starting where the last one ended counts; any others are
+        left over from an earlier run.
+        """
+        self.wait()
+        n = 0
+        for start, path in self._archive_files():
+            if n >= self.n_archived or start > n:
+                return
+            if start < n:
+                continue  # Overlaps what's been yielded
+            with open(path, "rb") as fp:
+                for generation in pickle.load(fp):
+                    if n >= self.n_archived:
+                        return
+                    yield generation
+                    n += 1
+
+    def close(self) -> None:
+        self.wait()
+        self.writer.shutdown()
@@ -0,0 +1,185 @@
+"""
+dataset.py
+author: garrick
+
+Labelled design points gathered from the user (likes and dislikes), kept in
+preallocated arrays rather than a list of tuples.
+
+Each sample also has a weight for fitting, so that recent ratings can matter
+more than old ones. A Weighting scheme decays the weights in place as samples
+and generations come in, and samples whose weight falls below min_weight are
+evicted, keeping the training set (and fit time) bounded in long sessions.
+"""
+import numpy as np
+
+
+class Weighting:
+    def __init__(self) -> None:
+        pass
+
+    def on_append(self, weights: np.ndarray) -> None:
+        """Called before a sample is appended, with a view of the existing
+        weights (oldest first) to update in place.
+        """
+        pass
+
+    def on_generation(self, weights: np.ndarray) -> None:
+        """Called when the algorithm advances a generation."""
+        pass
+
+
+class ExponentialDecay(Weighting):
+    def __init__(self, half_life: float = 50) -> None:
+        """A sample's weight halves with every half_life newer samples."""
+        super().__init__()
+        self.decay = 0.5 ** (1 / half_life)
+
+    def on_append(self, weights: np.ndarray) -> None:
+        weights *= self.decay
+
+
+class PerGenerationDecay(Weighting):
+    def __init__(self, decay: float = 0.8) -> None:
+        """A sample's weight is multiplied by decay every generation."""
+        super().__init__()
+        self.decay = decay
+
+    def on_generation(self, weights: np.ndarray) -> None:
+        weights *= self.decay
+
+
+class SlidingWindow(Weighting):
+    def __init__(self, size: int = 200) -> None:
+        """Only the size most recent samples have (full) weight."""
+        super().__init__()
+        self.size = size
+
+    def on_append(self, weights: np.ndarray) -> None:
+        # With the new sample, the oldest of the last size falls out
+        if len(weights) >= self.size:
+            weights[len(weights) - self.size] = 0
+
+
+WEIGHTINGS = {
+    "exponential": ExponentialDecay,
+    "generation": PerGenerationDecay,
+    "window": SlidingWindow,
+}
+
+
+class Dataset:
+    def __init__(
+        self, dim=None, capacity=64, weighting: Weighting = None, min_weight=1e-3
+    ) -> None:
+        """Design points, their labels and weights, stored in arrays that
+        double in size when full, so appending is amortized O(1) and X, labels
+        and weights are views.
+
+        Args:
+          dim (int): dimension of the design points; inferred from the first
+            point appended if not given
+          capacity (int): initial number of points to allocate room for
+          weighting (Weighting): how weights decay; None keeps them all at 1
+          min_weight (float): samples weighted less than this are evicted
+        """
+        self.capacity = capacity
+        self.n = 0
+        self.n_evicted = 0
+        self._X = None if dim is None else np.empty((capacity, dim))
+        self._labels = np.empty(capacity, dtype=np.int64)
+        self._weights = np.empty(capacity)
+        self.weighting = weighting or Weighting()
+        self.min_weight = min_weight
+
+    def _grow(self, capacity) -> None:
+        self._X = np.resize(self._X, (capacity, self._X.shape[1]))
+        self._labels = np.resize(self._labels, capacity)
+        self._weights = np.resize(self._weights, capacity)
+        self.capacity = capacity
+
+    def append(self, x: np.ndarray, label: int) -> None:
+        x = np.asarray(x)
+        if self._X is None:
+            self._X = np.empty((self.capacity, len(x)))
+        if self.n == self.capacity:
+            self._grow(2 * self.capacity)
+
+        self.weighting.on_append(self.weights)
+        self._X[self.n] = x
+        self._labels[self.n] = label
+        self._weights[self.n] = 1.0
+        self.n += 1
+        self.evict()
+
+    def advance_generation(self) -> None:
+        self.weighting.on_generation(self.weights)
+        self.evict()
+
+    def evict(self) -> None:
+        """Drops samples weighted below min_weight. Weights only ever decay
+        with age, so these are always the oldest samples.
+        """
+        above = self.weights >= self.min_weight
+        n_evict = int(np.argmax(above)) if above.any() else self.n
+        if n_evict == 0:
+            return
+
+        keep = slice(n_evict, self.n)
+        n_keep = self.n - n_evict
+        self._X[:n_keep] = self._X[keep]
+        self._labels[:n_keep] = self._labels[keep]
+        self._weights[:n_keep] = self._weights[keep]
+        self.n = n_keep
+        self.n_evicted += n_evict
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the arrays, including unused capacity."""
+        arrays = (self._X, self._labels, self._weights)
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    @property
+    def n_appended(self) -> int:
+        """Number of samples ever appended, including evicted ones."""
+        return self.n + self.n_evicted
+
+    @property
+    def X(self) -> np.ndarray:
+        """
+        Returns:
+          (np.ndarray): view of the design points, shape (n, dim)
+        """
+        if self._X is None:
+            return np.empty((0, 0))
+        return self._X[: self.n]
+
+    @property
+    def labels(self) -> np.ndarray:
+        """
+        Returns:
+          (np.ndarray): view of the labels (0 for dislike, 1 for like), shape (n,)
+        """
+        return self._labels[: self.n]
+
+    @property
+    def weights(self) -> np.ndarray:
+        """
+        Returns:
+          (np.ndarray): view of the sample weights, shape (n,)
+        """
+        return self._weights[: self.n]
+
+    def since(self, mark: int):
+        """
+        Args:
+          mark (int): a previous value of n_appended
+
+        Returns:
+          (tuple): views of the design points, labels and weights appended
+            since mark, e.g. those not yet seen by an online surrogate
+        """
+        start = max(mark - self.n_evicted, 0)
+        return self.X[start:], self.labels[start:], self.weights[start:]
+
+    def __len__(self) -> int:
+        return self.n
@@ -0,0 +1,350 @@
+"""
+diversity.py
+author: garrick
+
+Distances between music chromosomes, and the population-level operations built
+on them (diversity, fitness sharing, crowding, deduplication), for populations
+far too large for an (n, n) distance matrix.
+
+The distance between two chromosomes combines their gene groups:
+
+  ||expression_i - expression_j|| (Euclidean)
+    + timing_weight * (fraction of timing steps that differ)
+    + instrument_weight * (1 if the instruments differ else 0)
+
+Timing is compared bit-packed (see population.py): the Hamming distance is the
+popcount of the XOR, looked up in a table. Euclidean distances are computed a
+block of rows at a time through matrix products. Population-wide quantities
+are either exact identities (mean_hamming_distance, rms_euclidean_distance),
+estimated from sampled pairs, or restricted to candidates that share a
+locality-sensitive hash bucket, so they stay about linear in pop_size.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from genetic import EXPRESSION_DIM, TIMING_DIM
+from population import Population, pack_timing, unpack_timing
+from rng import get_rng
+
+# Number of set bits of every uint16
+POPCOUNT = (
+    np.unpackbits(np.arange(1 << 16, dtype="<u2").view(np.uint8))
+    .reshape(-1, 16)
+    .sum(axis=1)
+    .astype(np.uint8)
+)
+BLOCK_BYTES = 64 * 2 ** 20  # Memory of a block of pairwise distances
+EXACT_LIMIT = 2048  # Populations up to this size get exact niche counts
+BUCKET_SIZE = 256  # Typical LSH bucket size niche_counts() aims for
+
+# A population's genes, column by column
+Columns = namedtuple("Columns", ["instrument", "expression", "timing_bits"])
+
+
+def columns(population) -> Columns:
+    """
+    Args:
+      population: a Population, or a (pop_size, CHROMOSOME_DIM) array
+    """
+    if isinstance(population, Columns):
+        return population
+    if isinstance(population, Population):
+        return Columns(
+            population.instrument, population.expression, population.timing_bits
+        )
+    population = np.asarray(population)
+    return Columns(
+        population[:, 0].astype(np.int64),
+        population[:, 1 : EXPRESSION_DIM + 1],
+        pack_timing(population[:, EXPRESSION_DIM + 1 :]),
+    )
+
+
+def _take(cols: Columns, idxs) -> Columns:
+    return Columns(*(a[idxs] for a in cols))
+
+
+def popcount(bits: np.ndarray) -> np.ndarray:
+    return POPCOUNT[bits]
+
+
+def hamming_distances(A: np.ndarray, B: np.ndarray = None) -> np.ndarray:
+    """
+    Args:
+      A, B (np.ndarray): bit-packed timing, shapes (n,) and (m,) (default: A)
+
+    Returns:
+      (np.ndarray): (n, m) number of steps at which each pair differs
+    """
+    B = A if B is None else B
+    return popcount(A[:, np.newaxis] ^ B[np.newaxis, :])
+
+
+def euclidean_distances(X: np.ndarray, Y: np.ndarray = None) -> np.ndarray:
+    """(n, m) Euclidean distances between the rows of X and of Y (default: X),
+    through ||x||^2 + ||y||^2 - 2 x.y, so the bulk of the work is one matrix
+    product.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    Y = X if Y is None else np.asarray(Y, dtype=np.float64)
+    squared = (
+        np.einsum("ij,ij->i", X, X)[:, np.newaxis]
+        + np.einsum("ij,ij->i", Y, Y)[np.newaxis, :]
+        - 2 * X @ Y.T
+    )
+    return np.sqrt(np.maximum(squared, 0, out=squared), out=squared)
+
+
+def _distances(P: Columns, Q: Columns, timing_weight, instrument_weight):
+    d = euclidean_distances(P.expression, Q.expression)
+    if timing_weight:
+        d += timing_weight / TIMING_DIM * hamming_distances(
+            P.timing_bits, Q.timing_bits
+        )
+    if instrument_weight:
+        d += instrument_weight * (
+            P.instrument[:, np.newaxis] != Q.instrument[np.newaxis, :]
+        )
+    return d
+
+
+def chromosome_distances(
+    P, Q=None, timing_weight=1.0, instrument_weight=1.0
+) -> np.ndarray:
+    """
+    Args:
+      P, Q: populations (Populations or arrays) of sizes n and m (default: P)
+
+    Returns:
+      (np.ndarray): (n, m) distances between their chromosomes
+    """
+    P = columns(P)
+    Q = P if Q is None else columns(Q)
+    return _distances(P, Q, timing_weight, instrument_weight)
+
+
+def pairwise_blocks(
+    P, Q=None, block_bytes=BLOCK_BYTES, timing_weight=1.0, instrument_weight=1.0
+):
+    """Yields the rows of chromosome_distances(P, Q) a block at a time, so
+    memory stays bounded by block_bytes.
+
+    Yields:
+      (int, np.ndarray): index of the block's first row, and the block of
+        shape (rows, m)
+    """
+    P = columns(P)
+    Q = P if Q is None else columns(Q)
+    n_rows = max(1, block_bytes // (8 * max(len(Q.instrument), 1)))
+    for start in range(0, len(P.instrument), n_rows):
+        block = _take(P, slice(start, start + n_rows))
+        yield start, _distances(block, Q, timing_weight, instrument_weight)
+
+
+def paired_distances(P, Q, timing_weight=1.0, instrument_weight=1.0):
+    """
+    Returns:
+      (np.ndarray): distance between P[i] and Q[i] for every i
+    """
+    P, Q = columns(P), columns(Q)
+    expression = np.asarray(P.expression, dtype=np.float64) - Q.expression
+    d = np.sqrt(np.einsum("ij,ij->i", expression, expression))
+    d += timing_weight / TIMING_DIM * popcount(P.timing_bits ^ Q.timing_bits)
+    d += instrument_weight * (P.instrument != Q.instrument)
+    return d
+
+
+def mean_hamming_distance(timing_bits: np.ndarray) -> float:
+    """Mean over pairs of distinct chromosomes of the Hamming distance between
+    their timing. A step played by c of n chromosomes differs in c * (n - c)
+    of the pairs.
+    """
+    n = len(timing_bits)
+    if n < 2:
+        return 0.0
+    counts = unpack_timing(timing_bits).sum(axis=0, dtype=np.int64)
+    return float(2 * np.sum(counts * (n - counts)) / (n * (n - 1)))
+
+
+def rms_euclidean_distance(X: np.ndarray) -> float:
+    """Root mean squared Euclidean distance over pairs of distinct rows of X,
+    which is sqrt(2n / (n - 1) * total variance).
+    """
+    n = len(X)
+    if n < 2:
+        return 0.0
+    total_var = np.sum(np.var(X, axis=0, dtype=np.float64))
+    return float(np.sqrt(2 * n / (n - 1) * total_var))
+
+
+def sampled_mean_distance(
+    population, n_pairs=10000, rng=None, timing_weight=1.0, instrument_weight=1.0
+):
+    """Estimates the mean distance between distinct chromosomes from n_pairs
+    pairs drawn uniformly at random.
+
+    Returns:
+      (float, float): the estimate and its standard error
+    """
+    rng = get_rng(rng)
+    cols = columns(population)
+    n = len(cols.instrument)
+    if n < 2:
+        return 0.0, 0.0
+    i = rng.integers(n, size=n_pairs)
+    j = (i + rng.integers(1, n, size=n_pairs)) % n  # Never i
+    d = paired_distances(
+        _take(cols, i), _take(cols, j), timing_weight, instrument_weight
+    )
+    return float(d.mean()), float(d.std(ddof=1) / np.sqrt(n_pairs))
+
+
+def lsh_buckets(population, n_bits=8, rng=None) -> np.ndarray:
+    """Buckets chromosomes so that close ones tend to share a bucket: by
+    instrument, and by which side of n_bits random hyperplanes (through the
+    mean) their expression falls on.
+
+    Returns:
+      (np.ndarray): bucket number of each chromosome, in [0, n_buckets)
+    """
+    cols = columns(population)
+    expression = np.asarray(cols.expression, dtype=np.float64)
+    planes = get_rng(rng).standard_normal((EXPRESSION_DIM, n_bits))
+    sides = (expression - expression.mean(axis=0)) @ planes > 0
+    signature = sides @ (1 << np.arange(n_bits, dtype=np.int64))
+    keys = cols.instrument.astype(np.int64) << n_bits | signature
+    return np.unique(keys, return_inverse=True)[1].ravel()
+
+
+def _default_n_bits(n) -> int:
+    return int(np.clip(np.ceil(np.log2(max(n / BUCKET_SIZE, 1))), 0, 16))
+
+
+def niche_counts(
+    population, sigma, alpha=1.0, n_bits=None, rng=None, **weights
+) -> np.ndarray:
+    """Niche count m_i = sum_j sh(d_ij) of each chromosome, with the sharing
+    function sh(d) = 1 - (d / sigma)^alpha for d < sigma, 0 otherwise (so
+    m_i >= 1, from the chromosome itself).
+
+    Populations larger than EXACT_LIMIT only count neighbors in the same
+    LSH bucket (see lsh_buckets()), which undercounts a little near bucket
+    boundaries but keeps the cost about linear.
+
+    Args:
+      n_bits (int): bits of the LSH (default: sized for buckets of about
+        BUCKET_SIZE); 0 counts exactly
+    """
+    cols = columns(population)
+    n = len(cols.instrument)
+    if n_bits is None:
+        n_bits = 0 if n <= EXACT_LIMIT else _default_n_bits(n)
+    buckets = lsh_buckets(cols, n_bits, rng) if n_bits else np.zeros(n, dtype=int)
+
+    counts = np.zeros(n)
+    order = np.argsort(buckets, kind="stable")
+    _, starts = np.unique(buckets[order], return_index=True)
+    for members in np.split(order, starts[1:]):
+        bucket = _take(cols, members)
+        for start, d in pairwise_blocks(bucket, **weights):
+            rows = np.arange(len(d))
+            d[rows, start + rows] = 0  # Rounding can leave a little
+            shared = np.where(d < sigma, 1 - (d / sigma) ** alpha, 0)
+            counts[members[start : start + len(d)]] = shared.sum(axis=1)
+    return counts
+
+
+def fitness_sharing(evals, population, sigma, alpha=1.0, **kwargs) -> np.ndarray:
+    """Penalizes chromosomes in crowded niches, to keep the population
+    diverse. Lower evaluations are better, so they're shifted to be positive
+    and multiplied by the niche counts (see niche_counts()).
+
+    Returns:
+      (np.ndarray): the shared evaluations
+    """
+    evals = np.asarray(evals, dtype=np.float64)
+    shifted = evals - evals.min() + 1e-12
+    return shifted * niche_counts(population, sigma, alpha, **kwargs)
+
+
+def crowding_replacement(
+    population, evals, offspring, offspring_evals, crowding_factor=3, rng=None
+):
+    """Each offspring competes with the closest of crowding_factor chromosomes
+    of population drawn at random, and replaces it if better. When several
+    offspring pick the same chromosome, the best of them competes.
+
+    Args:
+      population: a Population or a (n, CHROMOSOME_DIM) array
+      evals (np.ndarray): evaluations of population (lower is better)
+
+    Returns:
+      (tuple): the new population (a copy) and its evaluations
+    """
+    rng = get_rng(rng)
+    n, m = len(population), len(offspring)
+    candidates = rng.integers(n, size=(m, crowding_factor))
+    repeated = np.repeat(np.arange(m), crowding_factor)
+    d = paired_distances(
+        _rows(offspring, repeated), _rows(population, candidates.ravel())
+    ).reshape(m, crowding_factor)
+    targets = candidates[np.arange(m), np.argmin(d, axis=1)]
+
+    # Worst offspring first, so the best one targeting an index is written last
+    evals = np.array(evals, dtype=np.float64)
+    offspring_evals = np.asarray(offspring_evals)
+    order = np.argsort(offspring_evals)[::-1]
+    order = order[offspring_evals[order] < evals[targets[order]]]
+    new_population = _rows(population, np.arange(n))  # A copy
+    new_population[targets[order]] = _rows(offspring, order)
+    evals[targets[order]] = offspring_evals[order]
+    return new_population, evals
+
+
+def _rows(population, idxs):
+    if isinstance(population, Population):
+        return population[idxs]
+    return np.asarray(population)[idxs]
+
+
+def unique_indices(population, tolerance=0.0) -> np.ndarray:
+    """Indices of the first of each group of duplicate chromosomes, in order.
+    With a tolerance, expressions are compared after rounding to multiples of
+    it, so near duplicates count as duplicates too.
+    """
+    cols = columns(population)
+    expression = np.asarray(cols.expression, dtype=np.float64)
+    if tolerance > 0:
+        expression = np.round(expression / tolerance)
+    expression = expression + 0.0  # -0.0 to 0.0, which differ bytewise
+    rows = np.column_stack([cols.instrument, expression, cols.timing_bits])
+    # Each row as a single opaque value, which sorts much faster than rows
+    rows = rows.view(np.dtype((np.void, rows.itemsize * rows.shape[1]))).ravel()
+    _, first = np.unique(rows, return_index=True)
+    return np.sort(first)
+
+
+def duplicate_rate(population, tolerance=0.0) -> float:
+    """Fraction of chromosomes duplicating another one earlier in the
+    population.
+    """
+    cols = columns(population)
+    n = len(cols.instrument)
+    if n == 0:
+        return 0.0
+    return 1 - len(unique_indices(cols, tolerance)) / n
+
+
+def dedup(population, evals=None, tolerance=0.0):
+    """Drops duplicate chromosomes (see unique_indices()), keeping the
+    evaluations in step.
+
+    Returns:
+      the deduplicated population, or if evals is given, a tuple of it and its
+        evaluations
+    """
+    keep = unique_indices(population, tolerance)
+    if evals is None:
+        return _rows(population, keep)
+    return _rows(population, keep), np.asarray(evals)[keep]
@@ -5,13 +5,30 @@ author: garrick
 Function utility class. All functions can subclass this for consistent behavior
 in the genetic algorithm optimizer.
 """
+import itertools
+import os
+import pickle
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
 import numpy as np
-from sklearn.linear_model import LogisticRegression
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+
+from rng import get_rng, spawn, worker_initializer
+
+# Renamed from "log" in scikit-learn 1.1
+LOG_LOSS = "log_loss" if "log_loss" in SGDClassifier.loss_functions else "log"
 
 
 class Function:
-    def __init__(self) -> None:
-        pass
+    def __init__(self, rng=None) -> None:
+        """
+        Args:
+          rng: Generator or seed for functions with random values (see rng.py)
+        """
+        self.rng = rng
 
     def eval(self, X: np.ndarray) -> np.ndarray:
         """Evaluate the function at a batch of design points x
@@ -64,20 +81,27 @@ class BoothsFunc(Function):
 
 # Useful for just letting the genetic algorithm explore
 class UniformRandomFunc(Function):
-    def __init__(self) -> None:
-        super().__init__()
+    def __init__(self, rng=None) -> None:
+        super().__init__(rng)
 
     def eval(self, X: np.ndarray) -> np.ndarray:
         batch_size = len(X)
-        return np.random.random_sample((batch_size,))
+        return get_rng(self.rng).random((batch_size,))
 
 
 class SurrogateFunc(Function):
-    def __init__(self) -> None:
+    # Online surrogates support partial_fit(), learning from new samples only
+    online = False
+
+    def __init__(self, rng=None) -> None:
         """Superclass defining an objective/fitness function that is 
         approximated using a fit() class method.
+
+        Subclasses increment self.version whenever a fit changes the function,
+        so anything caching its values knows to throw them away.
         """
-        super().__init__()
+        super().__init__(rng)
+        self.version = 0
 
     def fit(self, X, labels, weights=None) -> None:
         """I'll put something here eventually...
@@ -88,10 +112,16 @@ class SurrogateFunc(Function):
         """
         raise NotImplementedError("Subclasses must override this function")
 
+    def partial_fit(self, X, labels, weights=None) -> None:
+        """Update the fit with newly labelled design points only (see fit()).
+        Only online surrogates implement this.
+        """
+        raise NotImplementedError("Subclasses must override this function")
+
 
 class LogRegUserPreferenceFunc(SurrogateFunc):
-    def __init__(self, random_state=222, **kwargs) -> None:
-        super().__init__()
+    def __init__(self, random_state=222, rng=None, **kwargs) -> None:
+        super().__init__(rng)
         self.model = LogisticRegression(random_state=random_state, **kwargs)
         self.is_fitted = False
 
@@ -105,6 +135,7 @@ class LogRegUserPreferenceFunc(SurrogateFunc):
             return
         self.model.fit(X, labels, sample_weight=weights)
         self.is_fitted = True
+        self.version += 1
 
     def eval(self, X: np.ndarray) -> np.ndarray:
         if self.is_fitted:
@@ -114,4 +145,292 @@ class LogRegUserPreferenceFunc(SurrogateFunc):
         else:
             # Just return random values
             batch_size = len(X)
-            return np.random.random_sample((batch_size,))
+            return get_rng(self.rng).random((batch_size,))
+
+
+class SGDUserPreferenceFunc(SurrogateFunc):
+    online = True
+
+    def __init__(self, random_state=222, rng=None, **kwargs) -> None:
+        """Online counterpart to LogRegUserPreferenceFunc: logistic regression
+        fit by stochastic gradient descent, so each partial_fit() costs time
+        proportional to the new samples, not the whole session.
+        """
+        super().__init__(rng)
+        self.random_state = random_state
+        self.kwargs = kwargs
+        self.model = SGDClassifier(loss=LOG_LOSS, random_state=random_state, **kwargs)
+        self.seen_labels = set()
+        self.is_fitted = False
+
+    def fit(self, X, labels, weights=None) -> None:
+        """NOTE fit will overwrite data, as with LogRegUserPreferenceFunc"""
+        self.model = SGDClassifier(
+            loss=LOG_LOSS, random_state=self.random_state, **self.kwargs
+        )
+        self.seen_labels = set()
+        self.is_fitted = False
+        self.partial_fit(X, labels, weights)
+
+    def partial_fit(self, X, labels, weights=None) -> None:
+        if len(labels) == 0:
+            return
+        self.model.partial_fit(X, labels, classes=[0, 1], sample_weight=weights)
+        self.seen_labels.update(np.unique(labels).tolist())
+        self.is_fitted = self.seen_labels >= {0, 1}  # Need one of each label
+        self.version += 1
+
+    def eval(self, X: np.ndarray) -> np.ndarray:
+        if self.is_fitted:
+            # Probability that the user dislikes the design point (lower is better)
+            return self.model.predict_proba(X)[:, 0]
+        else:
+            # Just return random values
+            batch_size = len(X)
+            return get_rng(self.rng).random((batch_size,))
+
+
+def _shared_arrays(shm, shape, dtype):
+    """Views of the design matrix and the output block that follows it."""
+    X = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    out = np.ndarray((shape[0],), dtype=np.float64, buffer=shm.buf, offset=X.nbytes)
+    return X, out
+
+
+_pickle_keys = itertools.count()  # Identify each pickling of a ParallelFunc's function
+_worker_function = (None, None)  # Key and function last unpickled in this worker
+
+
+def _eval_shared_chunk(key, pickled, shm_name, shape, dtype, start, stop) -> float:
+    """Worker for ParallelFunc. Evaluates rows [start, stop) of the design 
+    matrix in shared memory, writing them to the output block. The pickled
+    function is only unpickled when its key changes.
+
+    Returns:
+      (float): seconds spent evaluating the chunk
+    """
+    global _worker_function
+    if _worker_function[0] != key:
+        _worker_function = (key, pickle.loads(pickled))
+    function = _worker_function[1]
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        X, out = _shared_arrays(shm, shape, dtype)
+        t0 = time.perf_counter()
+        out[start:stop] = function.eval(X[start:stop])
+        elapsed = time.perf_counter() - t0
+        del X, out  # Views must be released before closing
+        return elapsed
+    finally:
+        shm.close()
+
+
+class ParallelFunc(Function):
+    def __init__(
+        self,
+        function: Function,
+        n_workers=None,
+        n_chunks=None,
+        executor="process",
+        rng=None,
+    ) -> None:
+        """Evaluates a wrapped Function in parallel by sharding the design 
+        matrix row-wise across a pool of workers. Worth it for expensive 
+        objectives (audio features, surrogate ensembles), not cheap ones like 
+        RosenbrocksFunc.
+
+        With the process executor, the design matrix and results are passed 
+        through shared memory; only the function and chunk bounds are sent to
+        each worker. The function is pickled once, and again only after it's
+        refit (see SurrogateFunc.version). The thread executor suits functions
+        that release the GIL.
+
+        Close the pool with close(), or use the ParallelFunc as a context
+        manager.
+
+        After each call, chunk_timings holds (start, stop, seconds) per chunk.
+
+        Args:
+          function (Function): the function to evaluate. Must be picklable for 
+            the process executor.
+          n_workers (int): pool size (default: number of CPUs)
+          n_chunks (int): chunks to split each batch into (default: n_workers)
+          executor (str): "process" or "thread"
+          rng: seed, SeedSequence or Generator from which each process worker
+            gets its own stream (see rng.worker_initializer). None uses fresh
+            entropy, leaving the shared Generator alone.
+        """
+        super().__init__()
+        assert executor in ("process", "thread"), f"Unknown executor {executor}"
+        self.function = function
+        self.executor = executor
+        n_workers = n_workers or os.cpu_count()
+        if executor == "process":
+            if rng is None:
+                rng = np.random.SeedSequence()
+            initializer = worker_initializer(spawn(rng, n_workers))
+            self.pool = ProcessPoolExecutor(max_workers=n_workers, **initializer)
+        else:
+            self.pool = ThreadPoolExecutor(max_workers=n_workers)
+        self.n_chunks = n_chunks or n_workers
+        self.chunk_timings = []
+        self._pickled = None  # Key, function version and pickled function
+
+    def _chunk_bounds(self, batch_size):
+        edges = np.linspace(0, batch_size, min(self.n_chunks, batch_size) + 1)
+        edges = edges.astype(int)
+        return list(zip(edges[:-1], edges[1:]))
+
+    def eval(self, X: np.ndarray) -> np.ndarray:
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        bounds = self._chunk_bounds(len(X))
+        if self.executor == "thread":
+            y = np.empty(len(X))
+            timings = self.pool.map(lambda b: self._eval_view(X, y, *b), bounds)
+        else:
+            y, timings = self._eval_shared(X, bounds)
+        self.chunk_timings = [(a, b, t) for (a, b), t in zip(bounds, timings)]
+        return y
+
+    def _eval_view(self, X, out, start, stop) -> float:
+        t0 = time.perf_counter()
+        out[start:stop] = self.function.eval(X[start:stop])
+        return time.perf_counter() - t0
+
+    def _pickled_function(self):
+        version = getattr(self.function, "version", None)
+        if self._pickled is None or self._pickled[1] != version:
+            data = pickle.dumps(self.function, protocol=pickle.HIGHEST_PROTOCOL)
+            self._pickled = (next(_pickle_keys), version, data)
+        return self._pickled[0], self._pickled[2]
+
+    def _eval_shared(self, X, bounds):
+        size = max(X.nbytes + 8 * len(X), 1)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        try:
+            X_shared, out = _shared_arrays(shm, X.shape, X.dtype)
+            X_shared[:] = X
+            key, pickled = self._pickled_function()
+            futures = [
+                self.pool.submit(
+                    _eval_shared_chunk,
+                    key,
+                    pickled,
+                    shm.name,
+                    X.shape,
+                    X.dtype.str,
+                    start,
+                    stop,
+                )
+                for start, stop in bounds
+            ]
+            try:
+                timings = [future.result() for future in futures]
+                y = out.copy()
+            finally:
+                del X_shared, out  # Views must be released before closing
+            return y, timings
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def fit(self, *args, **kwargs) -> None:
+        # Pass through to a wrapped SurrogateFunc
+        self.function.fit(*args, **kwargs)
+        self._pickled = None  # In case it doesn't keep a version
+
+    def partial_fit(self, *args, **kwargs) -> None:
+        # Pass through to a wrapped online SurrogateFunc
+        self.function.partial_fit(*args, **kwargs)
+        self._pickled = None
+
+    @property
+    def online(self) -> bool:
+        return getattr(self.function, "online", False)
+
+    def close(self) -> None:
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class CachedFunc(Function):
+    def __init__(self, function: Function, maxsize=100_000) -> None:
+        """Memoizes a wrapped Function, keyed by the bytes of each design point,
+        keeping the maxsize most recently used values. Only the points not in 
+        the cache are passed on, in a single batch.
+
+        If the wrapped function is a SurrogateFunc, the cache is cleared when 
+        it's refit (whether through this wrapper or not), so stale values are 
+        never served. Don't wrap functions that aren't deterministic, like
+        UniformRandomFunc.
+        """
+        super().__init__()
+        self.function = function
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.version = getattr(function, "version", None)
+
+    def _check_version(self) -> None:
+        version = getattr(self.function, "version", None)
+        if version != self.version:
+            self.cache.clear()
+            self.version = version
+
+    def eval(self, X: np.ndarray) -> np.ndarray:
+        self._check_version()
+        X = np.ascontiguousarray(X)
+        if len(X) == 0:
+            return self.function.eval(X)
+
+        # View each row as a single opaque value, so duplicates within the
+        # batch are found (and evaluated once) by np.unique
+        rows = X.reshape(len(X), -1).view(np.dtype((np.void, X[0].nbytes)))[:, 0]
+        unique_rows, first_idxs, inverse = np.unique(
+            rows, return_index=True, return_inverse=True
+        )
+        keys = [row.tobytes() for row in unique_rows]
+
+        values = np.empty(len(keys))
+        missing = []
+        for i, key in enumerate(keys):
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                values[i] = self.cache[key]
+            else:
+                missing.append(i)
+        self.hits += len(X) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            values[missing] = self.function.eval(X[first_idxs[missing]])
+            for i in missing:
+                self.cache[keys[i]] = values[i]
+            while len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+
+        return values[inverse.reshape(-1)]
+
+    def fit(self, *args, **kwargs) -> None:
+        self.function.fit(*args, **kwargs)
+        self._check_version()
+
+    def partial_fit(self, *args, **kwargs) -> None:
+        self.function.partial_fit(*args, **kwargs)
+        self._check_version()
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.cache))
+
+    def cache_clear(self) -> None:
+        self.cache.clear()
+        self.hits = self.misses = 0
@@ -4,32 +4,42 @@ author: garrick
 
 Main file for genetic algorithm.
 """
+import argparse
+import inspect
+import io
 import math
+import os
 from collections import namedtuple
 
 import matplotlib.pyplot as plt
 import numpy as np
 
-from function import BoothsFunc, RosenbrocksFunc, UniformRandomFunc
+from checkpoint import Checkpointer, atomic_write
+from function import BoothsFunc, Function, RosenbrocksFunc, UniformRandomFunc
+from history import GenAlgHistory, HistorySink, KeepAllSink
+from profiling import StepObserver, phase_timer
+from rng import get_rng
 
 N_INSTRUMENTS = 6
 EXPRESSION_DIM = 16
 TIMING_DIM = 16
 BAR_SIZE = 4
 N_BARS = TIMING_DIM // BAR_SIZE
+CHROMOSOME_DIM = 1 + EXPRESSION_DIM + TIMING_DIM
 POPULATION_SIZE = 20
 
 """Generative music dynamics"""
 
 
-def init_chromosome(density=0.75):
+def init_chromosome(density=0.75, rng=None):
     """
     Returns:
       (np.ndarray) chromosome of shape (1 + expression_dim + timing_dim,)
     """
-    instrument = np.random.choice(np.arange(N_INSTRUMENTS))
-    expression = np.random.random_sample(EXPRESSION_DIM)
-    timing = np.random.random_sample(TIMING_DIM) < density
+    rng = get_rng(rng)
+    instrument = rng.choice(np.arange(N_INSTRUMENTS))
+    expression = rng.random(EXPRESSION_DIM)
+    timing = rng.random(TIMING_DIM) < density
     return np.hstack([instrument, expression, timing])
 
 
@@ -68,7 +78,7 @@ def set_timing(chromosome, timing):
     chromosome[EXPRESSION_DIM + 1 :] = timing
 
 
-def roulette_wheel_selection(y):
+def roulette_wheel_selection(y, rng=None):
     """Performs roulette wheel selection, also known as fitness proportionate
     selection. Each parent is chosen with a probability proportional to its 
     performance relative to the population. This process can be run multiple 
@@ -83,31 +93,33 @@ def roulette_wheel_selection(y):
     Returns:
       (int): Index of the selected individual. Why, congratulations, <individual>!
     """
+    rng = get_rng(rng)
     likelihood = np.max(y) - y  # NOTE max will have likelihood of zero
     probs = likelihood / np.sum(likelihood)
-    return np.random.choice(np.arange(len(y)), p=probs)
+    return rng.choice(np.arange(len(y)), p=probs)
 
 
-def mutate(chromosome, m_ins_prob=0.1, m_exp_prob=0.1, m_tim_prob=0.1):
+def mutate(chromosome, m_ins_prob=0.1, m_exp_prob=0.1, m_tim_prob=0.1, rng=None):
     """
 
     Returns:
       (np.ndarray): A new, mutated chromosome. *Does not* modify the old one.
     """
+    rng = get_rng(rng)
     mutated = chromosome.copy()
 
-    if np.random.random_sample() < m_ins_prob:
-        set_instrument(mutated, np.random.choice(np.arange(N_INSTRUMENTS)))
+    if rng.random() < m_ins_prob:
+        set_instrument(mutated, rng.choice(np.arange(N_INSTRUMENTS)))
 
-    new_expression = np.random.random_sample(EXPRESSION_DIM)
+    new_expression = rng.random(EXPRESSION_DIM)
 
-    mask = np.random.random_sample((TIMING_DIM,)) < m_exp_prob
+    mask = rng.random((TIMING_DIM,)) < m_exp_prob
     new_expression = get_expression(mutated)
-    new_expression[mask] = np.random.random_sample(np.count_nonzero(mask))
+    new_expression[mask] = rng.random(np.count_nonzero(mask))
     set_expression(mutated, new_expression)
 
     # Randomly flip bits according to m_tim_prob
-    mask = np.random.random_sample((TIMING_DIM,)) < m_tim_prob
+    mask = rng.random((TIMING_DIM,)) < m_tim_prob
     new_timing = get_timing(mutated)
     new_timing[mask] = 1 - new_timing[mask]
     set_timing(mutated, new_timing)
@@ -115,18 +127,20 @@ def mutate(chromosome, m_ins_prob=0.1, m_exp_prob=0.1, m_tim_prob=0.1):
     return mutated
 
 
-def crossover(c1, c2):
+def crossover(c1, c2, rng=None):
+    rng = get_rng(rng)
+
     # Choose instrument from c1 or c2
-    new_instrument = np.random.choice([get_instrument(c1), get_instrument(c2)])
+    new_instrument = rng.choice([get_instrument(c1), get_instrument(c2)])
 
     # Pick each expression parameter from either c1 or c2
-    idxs = np.random.randint(2, size=EXPRESSION_DIM)  # Pick either from 0 or 1
+    idxs = rng.integers(2, size=EXPRESSION_DIM)  # Pick either from 0 or 1
     new_expression = np.vstack([get_expression(c1), get_expression(c2)]).T[
         np.arange(EXPRESSION_DIM), idxs
     ]
 
     # Pick bars (groups of beats) from either c1 or c2
-    idxs = np.random.randint(2, size=N_BARS)
+    idxs = rng.integers(2, size=N_BARS)
     new_timing = np.stack(
         [
             get_timing(c1).reshape(N_BARS, BAR_SIZE),
@@ -139,121 +153,469 @@ def crossover(c1, c2):
     return np.hstack([new_instrument, new_expression, new_timing])
 
 
+"""Batched generative music dynamics
+
+These operate on a whole (pop_size, CHROMOSOME_DIM) population at once, so
+large populations don't pay Python overhead per individual. They draw from the
+same distributions as their single-chromosome counterparts above.
+"""
+
+
+def batch_init_chromosome(pop_size, density=0.75, rng=None):
+    """
+    Returns:
+      (np.ndarray) population of shape (pop_size, CHROMOSOME_DIM)
+    """
+    rng = get_rng(rng)
+    population = np.empty((pop_size, CHROMOSOME_DIM))
+    population[:, 0] = rng.integers(N_INSTRUMENTS, size=pop_size)
+    population[:, 1 : EXPRESSION_DIM + 1] = rng.random((pop_size, EXPRESSION_DIM))
+    population[:, EXPRESSION_DIM + 1 :] = rng.random((pop_size, TIMING_DIM)) < density
+    return population
+
+
+def batch_crossover(P1, P2, rng=None):
+    """Batched version of crossover. Row i of the result is a child of P1[i]
+    and P2[i].
+    """
+    rng = get_rng(rng)
+    n = len(P1)
+    take_p2 = np.empty((n, CHROMOSOME_DIM), dtype=bool)
+    take_p2[:, 0] = rng.integers(2, size=n)
+    take_p2[:, 1 : EXPRESSION_DIM + 1] = rng.integers(2, size=(n, EXPRESSION_DIM))
+    # Pick bars (groups of beats) from either parent
+    take_p2[:, EXPRESSION_DIM + 1 :] = np.repeat(
+        rng.integers(2, size=(n, N_BARS)), BAR_SIZE, axis=1
+    )
+    return np.where(take_p2, P2, P1)
+
+
+def batch_mutate(
+    population, m_ins_prob=0.1, m_exp_prob=0.1, m_tim_prob=0.1, rng=None
+):
+    """Batched version of mutate.
+
+    Returns:
+      (np.ndarray): The mutated population. *Modifies* population in place, 
+        since the engine always passes freshly made children.
+    """
+    rng = get_rng(rng)
+    n = len(population)
+
+    mask = rng.random(n) < m_ins_prob
+    population[mask, 0] = rng.integers(N_INSTRUMENTS, size=np.count_nonzero(mask))
+
+    expression = population[:, 1 : EXPRESSION_DIM + 1]  # View
+    mask = rng.random((n, EXPRESSION_DIM)) < m_exp_prob
+    expression[mask] = rng.random(np.count_nonzero(mask))
+
+    # Randomly flip bits according to m_tim_prob
+    timing = population[:, EXPRESSION_DIM + 1 :]  # View
+    mask = rng.random((n, TIMING_DIM)) < m_tim_prob
+    timing[mask] = 1 - timing[mask]
+
+    return population
+
+
+"""Batched selection
+
+Each of these draws all k parent pairs for a generation in one call, returning
+an array of indices of shape (k, 2). The batched decorator marks them so that
+genetic_algorithm_step can use them with either kind of dynamics.
+"""
+
+
+def batched(selection):
+    selection.batched = True
+    return selection
+
+
+def _selection_cdf(y):
+    """Cumulative distribution for roulette wheel style selection, assigning 
+    zero probability mass to the individual with the worst/highest objective 
+    value. Falls back to uniform if every individual is equally fit.
+    """
+    likelihood = np.max(y) - y  # NOTE max will have likelihood of zero
+    cdf = np.cumsum(likelihood)
+    if cdf[-1] <= 0:
+        cdf = np.arange(1, len(y) + 1, dtype=float)
+    return cdf
+
+
+@batched
+def _clip_to_last(cdf, idxs):
+    """Spins that round up to the total would land past the end; they go to
+    the last individual with any mass instead.
+    """
+    return np.minimum(idxs, np.searchsorted(cdf, cdf[-1]))
+
+
+def batch_roulette_wheel_selection(y, k, rng=None):
+    """Batched version of roulette_wheel_selection. The distribution is built 
+    once and sampled by binary search, so drawing k pairs is O((n + k) log n).
+
+    Args:
+      y (np.ndarray): Fitness function evaluations of shape (batch_size, )
+      k (int): Number of parent pairs to draw
+
+    Returns:
+      (np.ndarray): Indices of selected parents, shape (k, 2)
+    """
+    rng = get_rng(rng)
+    cdf = _selection_cdf(y)
+    spins = rng.random((k, 2)) * cdf[-1]
+    # side="right" skips over zero-mass individuals
+    return _clip_to_last(cdf, np.searchsorted(cdf, spins, side="right"))
+
+
+@batched
+def batch_stochastic_universal_sampling(y, k, rng=None):
+    """Stochastic universal sampling (see "Algorithms for Optimization," p. 151
+    for the roulette wheel it improves on). One spin places 2k evenly spaced 
+    pointers on the wheel, so each individual is picked close to its expected 
+    number of times.
+
+    Returns:
+      (np.ndarray): Indices of selected parents, shape (k, 2)
+    """
+    rng = get_rng(rng)
+    cdf = _selection_cdf(y)
+    pointers = (rng.random() + np.arange(2 * k)) * (cdf[-1] / (2 * k))
+    idxs = _clip_to_last(cdf, np.searchsorted(cdf, pointers, side="right"))
+    # Pointers come out sorted, so shuffle before pairing parents up
+    return rng.permutation(idxs).reshape(k, 2)
+
+
+@batched
+def batch_truncation_selection(y, k, sample_size=5, rng=None):
+    """Batched version of truncation_selection. Only partially sorts y, once.
+    """
+    rng = get_rng(rng)
+    sample_size = min(sample_size, len(y))
+    top_idxs = np.argpartition(y, sample_size - 1)[:sample_size]
+    return top_idxs[rng.integers(sample_size, size=(k, 2))]
+
+
+@batched
+def batch_tournament_selection(y, k, tournament_size=3, rng=None):
+    """Each parent is the fittest of tournament_size individuals drawn 
+    uniformly at random (with replacement).
+
+    Returns:
+      (np.ndarray): Indices of selected parents, shape (k, 2)
+    """
+    rng = get_rng(rng)
+    contestants = rng.integers(len(y), size=(k, 2, tournament_size))
+    winners = np.argmin(y[contestants], axis=-1)  # Lower objective is better
+    return np.take_along_axis(contestants, winners[..., np.newaxis], axis=-1)[..., 0]
+
+
 GenAlgDynamics = namedtuple(
     "GenAlgDynamics", ["init", "selection", "crossover", "mutate"]
 )
+
+# Same fields as GenAlgDynamics, but each operator works on a whole population:
+#   init(pop_size) -> (pop_size, dim) population
+#   selection(y, k) -> (k, 2) parent indices
+#   crossover(P1, P2) -> (k, dim) children
+#   mutate(P) -> (k, dim) mutated population
+BatchGenAlgDynamics = namedtuple(
+    "BatchGenAlgDynamics", ["init", "selection", "crossover", "mutate"]
+)
+
 music_dynamics = GenAlgDynamics(
     init=init_chromosome,
     selection=roulette_wheel_selection,
     crossover=crossover,
     mutate=mutate,
 )
+music_batch_dynamics = BatchGenAlgDynamics(
+    init=batch_init_chromosome,
+    selection=batch_roulette_wheel_selection,
+    crossover=batch_crossover,
+    mutate=batch_mutate,
+)
 
 """Configurable genetic algorithm"""
 
 
+def _with_rng(operator):
+    """Returns operator, or if it has no rng argument (e.g. an operator written
+    before there was one), operator wrapped to accept and ignore it.
+    """
+    try:
+        parameters = inspect.signature(operator).parameters.values()
+    except (TypeError, ValueError):  # No signature to inspect
+        return operator
+    if any(p.name == "rng" or p.kind == p.VAR_KEYWORD for p in parameters):
+        return operator
+    return lambda *args, rng=None: operator(*args)
+
+
+def init_population(dynamics, pop_size=POPULATION_SIZE, rng=None) -> np.ndarray:
+    rng = get_rng(rng)
+    if isinstance(dynamics, BatchGenAlgDynamics):
+        return dynamics.init(pop_size, rng=rng)
+    init = _with_rng(dynamics.init)
+    return np.array([init(rng=rng) for _ in range(pop_size)])
+
+
 def genetic_algorithm_step(
-    population, f, dynamics: GenAlgDynamics = music_dynamics, pop_size=POPULATION_SIZE,
+    population,
+    f,
+    dynamics: GenAlgDynamics = music_dynamics,
+    pop_size=POPULATION_SIZE,
+    rng=None,
+    observer: StepObserver = None,
 ):
     """
     Args:
       f (Function): An instance of a Function; the objective function to 
         evaluate.
+      dynamics (GenAlgDynamics or BatchGenAlgDynamics): the evolutionary 
+        dynamics. Batch dynamics step the whole population in a few array 
+        operations. Either may use a @batched selection operator.
+      rng (np.random.Generator): passed to every operator with an rng
+        argument (see rng.py)
+      observer (StepObserver): receives per-phase timings and population 
+        statistics of the step (see profiling.py)
     
     """
+    rng = get_rng(rng)
+    timer = phase_timer(observer)
+    if isinstance(dynamics, BatchGenAlgDynamics):
+        new_population, argsort, y = _batch_genetic_algorithm_step(
+            population, f, dynamics, pop_size, rng, timer
+        )
+    else:
+        new_population, argsort, y = _scalar_genetic_algorithm_step(
+            population, f, dynamics, pop_size, rng, timer
+        )
+
+    if observer is not None:
+        observer.on_step(timer.profile(population, y))
+    return new_population, argsort, y
+
+
+def _scalar_genetic_algorithm_step(population, f, dynamics, pop_size, rng, timer):
     selection, crossover, mutate = (
-        dynamics.selection,
-        dynamics.crossover,
-        dynamics.mutate,
+        _with_rng(dynamics.selection),
+        _with_rng(dynamics.crossover),
+        _with_rng(dynamics.mutate),
     )
 
     # Evaluate fitness
-    y = f(population)
+    with timer.phase("evaluate"):
+        y = f(population)
     # print("avg y", np.mean(y))
     # print("best y", np.min(y), population[np.argmin(y)])
 
     # Select parents of the next generation
-    parent_idxs = [(selection(y), selection(y)) for _ in range(pop_size)]
-    parents = [(population[a], population[b]) for a, b in parent_idxs]
+    with timer.phase("select"):
+        if getattr(dynamics.selection, "batched", False):
+            parent_idxs = selection(y, pop_size, rng=rng)
+        else:
+            parent_idxs = [
+                (selection(y, rng=rng), selection(y, rng=rng))
+                for _ in range(pop_size)
+            ]
+        parents = [(population[a], population[b]) for a, b in parent_idxs]
 
     # Perform crossover
-    proto = [crossover(c1, c2) for c1, c2 in parents]
+    with timer.phase("crossover"):
+        proto = [crossover(c1, c2, rng=rng) for c1, c2 in parents]
 
     # Perform mutation
-    new_population = np.array([mutate(c) for c in proto])
+    with timer.phase("mutate"):
+        new_population = np.array([mutate(c, rng=rng) for c in proto])
 
     return new_population, np.argsort(y), y
 
 
-GenAlgHistory = namedtuple("GenAlgHistory", ["populations", "argsorts", "evals"])
+def _batch_genetic_algorithm_step(population, f, dynamics, pop_size, rng, timer):
+    with timer.phase("evaluate"):
+        y = f(population)
 
+    with timer.phase("select"):
+        parent_idxs = dynamics.selection(y, pop_size, rng=rng)
+        parents_1 = population[parent_idxs[:, 0]]
+        parents_2 = population[parent_idxs[:, 1]]
+    with timer.phase("crossover"):
+        proto = dynamics.crossover(parents_1, parents_2, rng=rng)
+    with timer.phase("mutate"):
+        new_population = dynamics.mutate(proto, rng=rng)
 
-def genetic_algorithm(
+    return new_population, np.argsort(y), y
+
+
+# A generation of the algorithm, yielded once it's been evaluated. The final
+# population is yielded with argsort and evals of None.
+GenAlgGeneration = namedtuple(
+    "GenAlgGeneration", ["generation", "population", "argsort", "evals"]
+)
+
+
+def genetic_algorithm_iter(
     function=UniformRandomFunc,
     dynamics: GenAlgDynamics = music_dynamics,
     max_iters=30,
     pop_size=POPULATION_SIZE,
-) -> GenAlgHistory:
-    """Runs genetic algorithm to optimize a given function with specified 
-    evolutionary dynamics.
+    checkpointer: Checkpointer = None,
+    rng=None,
+    observer: StepObserver = None,
+):
+    """Generator form of genetic_algorithm. Lazily yields a GenAlgGeneration 
+    for each of the max_iters + 1 generations, so callers can process a run 
+    without keeping all of it.
 
-    NOTE n_iters generations produces a history object with n_iters + 1 entries
-    (count the initial population, too)
-    """
-    init_chromosome = dynamics.init
-    iter = 0
-    population = np.array([init_chromosome() for _ in range(pop_size)])
-    f = function()
+    Every random draw of the run comes from rng (see rng.py), including those 
+    of the function if it's instantiated here, so a seed reproduces the run.
 
-    all_populations = [population]
-    all_argsorts = []
-    all_evals = []
+    With a checkpointer, the run is checkpointed every checkpointer.every 
+    generations. If the checkpointer already holds a checkpoint, the run 
+    resumes from it instead (first replaying the archived generations), 
+    continuing exactly as the original run would have.
+    """
+    state = checkpointer.load() if checkpointer is not None else None
+    if state is not None:
+        yield from checkpointer.archive()
+        iter, population, f = state["iter"], state["population"], state["function"]
+        rng = state["rng"]  # Pickled with f, so still shared if it was before
+    else:
+        iter = 0
+        rng = get_rng(rng)
+        population = init_population(dynamics, pop_size, rng=rng)
+        if isinstance(function, Function):
+            f = function
+        else:
+            f = function()
+            f.rng = rng
+
+    def save():
+        checkpointer.save(
+            {
+                "iter": iter,
+                "population": population,
+                "function": f,
+                "rng": rng,
+            }
+        )
 
     while iter < max_iters:
-        # print(f"Iteration {iter}")
-
         # XXX: could measure differences? or cache and plot?
-        population, argsort, evals = genetic_algorithm_step(
-            population, f, dynamics=dynamics, pop_size=pop_size
+        new_population, argsort, evals = genetic_algorithm_step(
+            population,
+            f,
+            dynamics=dynamics,
+            pop_size=pop_size,
+            rng=rng,
+            observer=observer,
         )
-        all_populations.append(population)
-        all_argsorts.append(argsort)
-        all_evals.append(evals)
+        generation = GenAlgGeneration(iter, population, argsort, evals)
+        if checkpointer is not None:
+            checkpointer.record(generation)
+        yield generation
+        population = new_population
 
         iter += 1
 
-    return GenAlgHistory(
-        populations=all_populations, argsorts=all_argsorts, evals=all_evals
-    )
+        if checkpointer is not None and checkpointer.due(iter):
+            save()
+
+    if checkpointer is not None:
+        save()
+        checkpointer.wait()
+    yield GenAlgGeneration(iter, population, None, None)
+
+
+def genetic_algorithm(
+    function=UniformRandomFunc,
+    dynamics: GenAlgDynamics = music_dynamics,
+    max_iters=30,
+    pop_size=POPULATION_SIZE,
+    sink: HistorySink = None,
+    checkpointer: Checkpointer = None,
+    rng=None,
+    observer: StepObserver = None,
+) -> GenAlgHistory:
+    """Runs genetic algorithm to optimize a given function with specified 
+    evolutionary dynamics.
+
+    NOTE n_iters generations produces a history object with n_iters + 1 entries
+    (count the initial population, too)
+
+    Args:
+      function: a Function subclass (or other factory) to instantiate, or a 
+        Function instance to use as is, e.g. a ParallelFunc
+      sink (HistorySink): decides which generations the history keeps, and 
+        where (default: all of them, in memory)
+      checkpointer (Checkpointer): checkpoints the run, or resumes it if 
+        there's an existing checkpoint (see genetic_algorithm_iter)
+      rng: Generator or seed for the run's random draws (see rng.py)
+      observer (StepObserver): profiles every step (see profiling.py)
+    """
+    sink = sink or KeepAllSink()
+    for generation in genetic_algorithm_iter(
+        function, dynamics, max_iters, pop_size, checkpointer, rng, observer
+    ):
+        sink.record(*generation)
+    sink.close()
+
+    return sink.history()
 
 
 """Rosenbrock's Function"""
 
 
-def rosenbrocks_init_chromosome():
-    return np.random.random_sample(2) * 6 - 3  # 3, -3
+def rosenbrocks_init_chromosome(rng=None):
+    rng = get_rng(rng)
+    return rng.random(2) * 6 - 3  # 3, -3
 
 
 # def rosenbrocks_crossover(c1, c2, lambd=0.5):
 #     return (1 - lambd) * c1 + lambd * c2
 
 
-def rosenbrocks_crossover(c1, c2):
-    mask = np.random.random_sample(2) < 0.5
+def rosenbrocks_crossover(c1, c2, rng=None):
+    rng = get_rng(rng)
+    mask = rng.random(2) < 0.5
     new_c = c1.copy()
     new_c[mask] = c2[mask]
     return new_c
 
 
-def rosenbrocks_mutation(c):
-    scale = np.random.choice([1, 0.1, 0.01], p=[0.05, 0.3, 0.65])
-    new_c = c + (np.random.random_sample(2) * scale - scale / 2)
+def rosenbrocks_mutation(c, rng=None):
+    rng = get_rng(rng)
+    scale = rng.choice([1, 0.1, 0.01], p=[0.05, 0.3, 0.65])
+    new_c = c + (rng.random(2) * scale - scale / 2)
     return np.clip(new_c, -3, 3)
 
 
-def truncation_selection(y, sample_size=5):
+def truncation_selection(y, sample_size=5, rng=None):
+    rng = get_rng(rng)
     top_idxs = np.argsort(y)[:sample_size]  # Lower objective values are better
-    return np.random.choice(top_idxs)
+    return rng.choice(top_idxs)
+
+
+def batch_rosenbrocks_init_chromosome(pop_size, rng=None):
+    rng = get_rng(rng)
+    return rng.random((pop_size, 2)) * 6 - 3  # 3, -3
+
+
+def batch_rosenbrocks_crossover(P1, P2, rng=None):
+    rng = get_rng(rng)
+    mask = rng.random(P1.shape) < 0.5
+    return np.where(mask, P2, P1)
+
+
+def _batch_mutation_step(pop_size, rng=None):
+    rng = get_rng(rng)
+    scale = rng.choice([1, 0.1, 0.01], size=(pop_size, 1), p=[0.05, 0.3, 0.65])
+    return rng.random((pop_size, 2)) * scale - scale / 2
+
+
+def batch_rosenbrocks_mutation(P, rng=None):
+    return np.clip(P + _batch_mutation_step(len(P), rng), -3, 3)
 
 
 rosenbrock_problem = GenAlgDynamics(
@@ -262,29 +624,55 @@ rosenbrock_problem = GenAlgDynamics(
     crossover=rosenbrocks_crossover,
     mutate=rosenbrocks_mutation,
 )
+rosenbrock_batch_problem = BatchGenAlgDynamics(
+    init=batch_rosenbrocks_init_chromosome,
+    selection=batch_truncation_selection,
+    crossover=batch_rosenbrocks_crossover,
+    mutate=batch_rosenbrocks_mutation,
+)
 
 """Booths's Function"""
 
 
-def booths_init_chromosome():
-    return np.random.random_sample(2) * 20 - 10  # -10, 10
+def booths_init_chromosome(rng=None):
+    rng = get_rng(rng)
+    return rng.random(2) * 20 - 10  # -10, 10
 
 
 booths_crossover = rosenbrocks_crossover
 
 
-def booths_mutation(c):
-    scale = np.random.choice([1, 0.1, 0.01], p=[0.05, 0.3, 0.65])
-    new_c = c + (np.random.random_sample(2) * scale - scale / 2)
+def booths_mutation(c, rng=None):
+    rng = get_rng(rng)
+    scale = rng.choice([1, 0.1, 0.01], p=[0.05, 0.3, 0.65])
+    new_c = c + (rng.random(2) * scale - scale / 2)
     return np.clip(new_c, -10, 10)
 
 
+def batch_booths_init_chromosome(pop_size, rng=None):
+    rng = get_rng(rng)
+    return rng.random((pop_size, 2)) * 20 - 10  # -10, 10
+
+
+batch_booths_crossover = batch_rosenbrocks_crossover
+
+
+def batch_booths_mutation(P, rng=None):
+    return np.clip(P + _batch_mutation_step(len(P), rng), -10, 10)
+
+
 booths_problem = GenAlgDynamics(
     init=booths_init_chromosome,
     selection=truncation_selection,
     crossover=booths_crossover,
     mutate=booths_mutation,
 )
+booths_batch_problem = BatchGenAlgDynamics(
+    init=batch_booths_init_chromosome,
+    selection=batch_truncation_selection,
+    crossover=batch_booths_crossover,
+    mutate=batch_booths_mutation,
+)
 
 """Plotting code"""
 
@@ -305,35 +693,92 @@ def log_level_locator(z, n=20, base=1.5, exclude_first=10):
     return lines[exclude_first:]
 
 
-def create_contours(function=RosenbrocksFunc, log=True):
-    if function == BoothsFunc:
-        bound = 10
-    else:
-        bound = 3
+CONTOUR_RESOLUTION = 100  # Landscape grid points along each axis
+PLOT_GENERATIONS = [0, 1, 2, 4, 9, 99, 499, 899, 999]
+
+# Objective values Z on the grid X1, X2
+Landscape = namedtuple("Landscape", ["X1", "X2", "Z"])
+_landscapes = {}  # (function, bound, resolution) -> Landscape
 
-    x1 = np.linspace(-bound, bound, 100)
-    x2 = np.linspace(-bound, bound, 100)
-    X = np.meshgrid(x1, x2)  # Index 0 is all x1 coordinates, 1 is all x2; vectorizes
 
-    eval_X = np.array([[x1, x2] for x1, x2 in zip(X[0].flatten(), X[1].flatten())])
+def contour_bound(function) -> float:
+    return 10 if function == BoothsFunc else 3
 
-    f = function()
-    Z = f(eval_X)
-    Z = np.array(Z).reshape([100, 100])
 
+def landscape(
+    function=RosenbrocksFunc, bound=None, resolution=CONTOUR_RESOLUTION, cache_dir=None
+) -> Landscape:
+    """Evaluates function on a (resolution, resolution) grid over [-bound,
+    bound]^2. Memoized per (function, bound, resolution), so plotting many
+    generations evaluates it once.
+
+    Args:
+      bound (float): half width of the grid (default: contour_bound())
+      cache_dir (str): if given, landscapes are also saved there, and loaded
+        from there by later runs
+    """
+    bound = contour_bound(function) if bound is None else bound
+    key = (function, bound, resolution)
+    if key in _landscapes:
+        return _landscapes[key]
+
+    path = None
+    if cache_dir is not None:
+        name = f"{function.__name__}_{bound}_{resolution}.npz"
+        path = os.path.join(cache_dir, name)
+    if path is not None and os.path.exists(path):
+        with np.load(path) as data:
+            surface = Landscape(data["X1"], data["X2"], data["Z"])
+    else:
+        x = np.linspace(-bound, bound, resolution)
+        X1, X2 = np.meshgrid(x, x)
+        Z = function()(np.column_stack([X1.ravel(), X2.ravel()]))
+        surface = Landscape(X1, X2, np.asarray(Z).reshape(X1.shape))
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            buffer = io.BytesIO()
+            np.savez(buffer, **surface._asdict())
+            atomic_write(path, buffer.getvalue())
+
+    _landscapes[key] = surface
+    return surface
+
+
+def create_contours(function=RosenbrocksFunc, log=True, cache_dir=None):
+    X1, X2, Z = landscape(function, cache_dir=cache_dir)
     if log:
-        plt.contour(X[0], X[1], Z, levels=log_level_locator(Z), cmap="viridis_r")
+        plt.contour(X1, X2, Z, levels=log_level_locator(Z), cmap="viridis_r")
     else:
-        plt.contour(X[0], X[1], Z, levels=10, cmap="viridis_r")
+        plt.contour(X1, X2, Z, levels=10, cmap="viridis_r")
+
+
+def plot_populations(
+    history: GenAlgHistory,
+    function=RosenbrocksFunc,
+    generations=PLOT_GENERATIONS,
+    save_path=None,
+    cache_dir=None,
+):
+    """Plots the given generations' design points over the function's
+    contours, in a grid of subplots.
 
+    Args:
+      save_path (str): save the figure there instead of showing it, e.g. on a
+        headless machine
+      cache_dir (str): where to persist the landscape (see landscape())
+    """
+    generations_kept = history.generations or range(len(history.populations))
+    idx_of_generation = {g: i for i, g in enumerate(generations_kept)}
+    n_cols = math.ceil(math.sqrt(len(generations)))
+    n_rows = math.ceil(len(generations) / n_cols)
 
-def plot_populations(history: GenAlgHistory, function=RosenbrocksFunc):
     # Plot a generation of design points
-    
-    for subplot_idx, generation in enumerate([0, 1, 2, 4, 9, 99, 499, 899, 999]):
-        pop = history.populations[generation]
-        plt.subplot(3, 3, subplot_idx + 1)
-        create_contours(function)
+    for subplot_idx, generation in enumerate(generations):
+        if generation not in idx_of_generation:  # Not kept by the history sink
+            continue
+        pop = history.populations[idx_of_generation[generation]]
+        plt.subplot(n_rows, n_cols, subplot_idx + 1)
+        create_contours(function, cache_dir=cache_dir)
         plt.scatter(pop[:, 0], pop[:, 1], zorder=2, marker=".")
         # XXX: Why do I have to change z-order?
         # plt.xlabel("x1")
@@ -343,22 +788,30 @@ def plot_populations(history: GenAlgHistory, function=RosenbrocksFunc):
         # plt.title(
         #     f"Generation {generation + 1 if generation >= 0 else len(history.populations) + generation + 1}"
         # )
-    plt.show()
-    # TODO: automate save plot
+    if save_path is not None:
+        plt.savefig(save_path, dpi=200)
+    else:
+        plt.show()
     plt.clf()
 
 
-# TODO: add argparse, allow running different trials
-TRIAL = "rosenbrocks"
+TRIALS = {
+    "rosenbrocks": (RosenbrocksFunc, rosenbrock_problem),
+    "booths": (BoothsFunc, booths_problem),
+}
 
 if __name__ == "__main__":
-    np.random.seed(222)
-
-    if TRIAL == "rosenbrocks":
-        history = genetic_algorithm(RosenbrocksFunc, rosenbrock_problem, max_iters=999)
-
-        plot_populations(history)
-    elif TRIAL == "booths":
-        history = genetic_algorithm(BoothsFunc, booths_problem, max_iters=999)
-
-        plot_populations(history, BoothsFunc)
+    parser = argparse.ArgumentParser(description="Run a benchmark trial")
+    parser.add_argument("--trial", choices=TRIALS, default="rosenbrocks")
+    parser.add_argument("--max-iters", type=int, default=999)
+    parser.add_argument("--seed", type=int, default=222)
+    parser.add_argument("--save", help="save the plot to this file, e.g. plot.png")
+    parser.add_argument("--landscape-cache", help="directory to cache landscapes in")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    function, dynamics = TRIALS[args.trial]
+    history = genetic_algorithm(function, dynamics, max_iters=args.max_iters, rng=rng)
+    plot_populations(
+        history, function, save_path=args.save, cache_dir=args.landscape_cache
+    )
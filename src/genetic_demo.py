@@ -6,40 +6,40 @@ produce music.
 
 # TODO: add colors
 """
-from collections import defaultdict
+import argparse
+import copy
+import queue
+import threading
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 import matplotlib.pyplot as plt
 import numpy as np
-from pythonosc import udp_client
 
 import plot
-from function import LogRegUserPreferenceFunc, UniformRandomFunc
-from genetic import (
-    genetic_algorithm_step,
-    get_expression,
-    get_instrument,
-    get_timing,
-    music_dynamics,
+from checkpoint import Checkpointer
+from dataset import WEIGHTINGS
+from function import LogRegUserPreferenceFunc, SGDUserPreferenceFunc
+from genetic import music_dynamics
+from osc import (
+    ADDR_CLEAR,
+    ADDR_POP,
+    ADDR_PUSH,
+    ADDR_START_RECORDING,
+    ADDR_STOP_RECORDING,
+    AUDIO_SERVER_IP,
+    AUDIO_SERVER_PORT,
+    OSCTransport,
 )
+from profiling import RecordingObserver
+from sequencer import Sequencer
+from session import Session
 
 # from synthesis import *  # Potential decomposition of sound-producing functions here
 
 POPULATION_SIZE = 20
-AUDIO_SERVER_IP = "127.0.0.1"
-AUDIO_SERVER_PORT = 57120
-
-# Constants
-ADDR_NEXT = "/next"
-ADDR_PUSH = "/push"
-ADDR_POP = "/pop"
-ADDR_CLEAR = "/clear"
-ADDR_START_RECORDING = "/startRecording"
-ADDR_STOP_RECORDING = "/stopRecording"
-
-# TODO: move to a util file
-# Preserve correct types
-def chromosome_to_osc(c: np.ndarray):
-    return [get_instrument(c)] + get_expression(c).tolist() + get_timing(c).tolist()
+HISTORY_LENGTH = 100  # Generations kept for plotting
+CHECKPOINT_DIR = "checkpoints"
 
 
 class Handler:
@@ -64,6 +64,15 @@ class HandleQuit(Handler):
         global quit  # To modify, must mark global
         quit = True
         client.send_message(ADDR_CLEAR, [])  # Cleanup
+        if sequencer is not None:
+            sequencer.stop()
+        # An unfinished advance is dropped; the checkpoint predates it
+        for future in background_futures.copy():  # Atomic, unlike list()
+            future.cancel()
+        advance_executor.shutdown(wait=False)
+        plot_executor.shutdown(wait=False)
+        checkpointer.close()
+        client.close()
         print("Goodbye!")
 
     def helptext(self) -> str:
@@ -93,7 +102,9 @@ class HandleLike(Handler):
             print("No current Chromosome. Use 'next' to play one!")
             return
 
-        dataset.append((cur_chromosome, 1))
+        session.add_rating(cur_chromosome, 1)
+        save_demo_state()
+        prefetch()
         print("Liked Chromosome. You'll see more like this in the future.")
 
     def helptext(self) -> str:
@@ -106,7 +117,9 @@ class HandleDislike(Handler):
             print("No current Chromosome. Use 'next' to play one!")
             return
 
-        dataset.append((cur_chromosome, 0))
+        session.add_rating(cur_chromosome, 0)
+        save_demo_state()
+        prefetch()
         print("Disliked Chromosome. You'll see less like this in the future.")
 
     def helptext(self) -> str:
@@ -115,36 +128,23 @@ class HandleDislike(Handler):
 
 class HandleAdvance(Handler):
     def eval(self) -> None:
-        global iter, cur_population, cur_chromosome_idx
-        assert iter is not None
-
-        # TODO: learn surrogate function based on current user input
-        X, y = [], []
-        if dataset:  # Non-empty
-            X, y = zip(*dataset)
-
-        X, y = np.array(X), np.array(y)
-
-        # Plot and advance (TODO: refine and split plot code into another handler)
-        if X.size > 0:
-            # plot.tsne_scatter(X, y)
-            # plt.show()
-            # plt.clf()
-            f.fit(X, y)  # Update function based on user preferences
-            # plot.approx_voronoi_tesselation(f.model, X, y)
-            # plt.show()
-            # plt.clf()
-
-        cur_population, _, _ = genetic_algorithm_step(
-            cur_population, f, dynamics=dynamics, pop_size=POPULATION_SIZE,
-        )
-        all_populations.append(cur_population)
-        iter += 1
+        """The next generation is computed in the background (usually it's
+        already been prefetched), and swapped in by apply_advance() when it's
+        ready, so the current one can still be auditioned meanwhile.
+        """
+        assert session is not None
 
-        print(f"Generation {iter + 1}")
+        if pending_advance is not None and pending_advance.requested:
+            print("Already advancing; hang tight.")
+            return
+        if pending_advance is None or pending_advance.key != advance_key():
+            start_advance()  # Ratings came in since the prefetch started
+        pending_advance.requested = True
 
-        cur_chromosome_idx = None
-        # NOTE We keep the current chromosome playing
+        if pending_advance.future.done():
+            on_advance_done(pending_advance)
+        else:
+            print("Computing the next generation in the background...")
 
     def helptext(self) -> str:
         return "Advance a generation."
@@ -152,30 +152,18 @@ class HandleAdvance(Handler):
 
 class HandlePlot(Handler):
     def eval(self) -> None:
-        X, y = [], []
-        if dataset:  # Non-empty
-            X, y = zip(*dataset)
-
-        X, y = np.array(X), np.array(y)
-
-        # Plot and advance (TODO: refine and split plot code into another handler)
-        if X.size > 0:
-            plot.tsne_scatter(X, y)
-            plt.show()
-            plt.clf()
-
-            plot.approx_voronoi_tesselation(f.model, X, y)
-            plt.show()
-            plt.clf()
-
-            plot.new_population_locations(f.model, X, y, cur_population)
-            plt.show()
-            plt.clf()
-
-            plot.population_histogram(all_populations)
-            plt.show()
-            plt.clf()
-            pass
+        X, y = session.dataset.X, session.dataset.labels
+        model = copy.deepcopy(session.f.model) if X.size > 0 else None
+        future = submit(
+            plot_executor,
+            compute_plot_data,
+            model,
+            X.copy(),
+            y.copy(),
+            np.copy(session.population),
+        )
+        future.add_done_callback(ready_plots.put)
+        print("Computing plots in the background; they'll show after a command.")
 
     def helptext(self) -> str:
         return "Plot visualizations of the algorithm's progress."
@@ -188,7 +176,12 @@ class HandlePush(Handler):
             return
 
         print("Pushing.")
-        client.send_message(ADDR_PUSH, [])
+        if sequencer is not None:
+            pushed_parts.append(f"part{len(pushed_parts)}")
+            sequencer.set_part(pushed_parts[-1], cur_chromosome)
+            sequencer.remove_part("cur")  # Like /push, which silences \cur
+        else:
+            client.send_message(ADDR_PUSH, [])
 
     def helptext(self) -> str:
         return "Commit the currently playing Chromosome and start a new Part."
@@ -201,7 +194,11 @@ class HandlePop(Handler):
             return
 
         print("Popping.")
-        client.send_message(ADDR_POP, [])
+        if sequencer is not None:
+            if pushed_parts:
+                sequencer.remove_part(pushed_parts.pop())
+        else:
+            client.send_message(ADDR_POP, [])
 
     def helptext(self) -> str:
         return "Remove the most recently added Chromosome."
@@ -211,23 +208,25 @@ class HandleNext(Handler):
     def eval(self) -> None:
         global cur_chromosome, cur_chromosome_idx
 
-        if cur_population is None:
+        if session is None:
             raise RuntimeError("Population not initialized!")
 
-        n = len(cur_population)
+        n = len(session.population)
 
         if cur_chromosome_idx is None or cur_chromosome_idx == n - 1:
             cur_chromosome_idx = 0
         else:
             cur_chromosome_idx += 1
 
-        cur_chromosome = cur_population[cur_chromosome_idx]
+        cur_chromosome = session.population[cur_chromosome_idx]
 
         print(f"Playing Chromosome {cur_chromosome_idx + 1}/{n}")
         print(cur_chromosome)  # TODO: remove debug line/replace with something prettier
 
-        args = chromosome_to_osc(cur_chromosome)
-        client.send_message(ADDR_NEXT, args)
+        if sequencer is not None:
+            sequencer.set_part("cur", cur_chromosome)
+        else:
+            client.send_chromosome(cur_chromosome)
 
     def helptext(self) -> str:
         return "Play the next Chromosome in the current population."
@@ -237,7 +236,11 @@ class HandleClear(Handler):
     def eval(self) -> None:
         print("Clearing...")
 
-        client.send_message(ADDR_CLEAR, [])
+        if sequencer is not None:
+            sequencer.clear()
+            pushed_parts.clear()
+        else:
+            client.send_message(ADDR_CLEAR, [])
 
     def helptext(self) -> str:
         return "Clear all playing Parts."
@@ -306,36 +309,290 @@ command_handlers = {
 }
 
 quit = False
-cur_population = None
+session = None  # The population, ratings, preferences and random state
 cur_chromosome_idx = None
 cur_chromosome = None
-all_populations = []
-f = None
 dynamics = music_dynamics
-iter = None
 client = None
-dataset = []
 recording = False
+checkpointer = None
+step_observer = RecordingObserver()  # Phase timings, for plotting
+sequencer = None  # Sequences parts in Python, if enabled (see --sequence)
+pushed_parts = []  # Names of the sequencer's pushed parts, oldest first
+
+
+# Background work. Handlers run holding state_lock, so results computed by the
+# workers are only swapped in between commands.
+advance_executor = ThreadPoolExecutor(max_workers=1)
+plot_executor = ThreadPoolExecutor(max_workers=1)
+state_lock = threading.RLock()
+pending_advance = None  # PendingAdvance of the next generation, if any
+ready_plots = queue.Queue()  # Futures of finished compute_plot_data calls
+background_futures = set()  # Unfinished futures, to cancel on quit
+
+
+def submit(executor, fn, *args):
+    """Submits to executor, keeping track of the future until it's done."""
+    future = executor.submit(fn, *args)
+    background_futures.add(future)
+    future.add_done_callback(background_futures.discard)
+    return future
+
+
+# The result of advancing a generation, computed on private copies of the
+# function and Generator
+Advance = namedtuple(
+    "Advance", ["f", "rng", "population", "argsort", "evals", "profiles"]
+)
+
+
+class PendingAdvance:
+    def __init__(self, key) -> None:
+        """An advance being computed from the state identified by key (see
+        advance_key()). It's only applied once requested, i.e. when the user
+        asks to advance; until then it's a prefetch.
+        """
+        self.key = key
+        self.requested = False
+        self.future = None
+
+
+def advance_key():
+    """Identifies the state an advance is computed from. Ratings change the
+    dataset, and so the surrogate fit and the next generation.
+    """
+    return (session.iter, session.dataset.n_appended)
+
+
+def compute_advance(pending, f, rng, fit_data, population):
+    """Fits f and steps the algorithm. Runs on the advance worker, on copies,
+    so the session itself is untouched until apply_advance().
+    """
+    if pending is not pending_advance:
+        return None  # Superseded before it even started
+
+    observer = RecordingObserver()
+    new_population, argsort, evals = session.step(
+        f, rng, fit_data, population, observer=observer
+    )
+    return Advance(f, rng, new_population, argsort, evals, observer.profiles)
+
+
+def start_advance() -> None:
+    """Starts computing the next generation from the current state,
+    superseding any pending advance.
+    """
+    global pending_advance
+
+    fit_data = session.fit_data()
+    # Copied together, so the copy of f still shares the copy of rng. The
+    # originals are left untouched in case the result is thrown away.
+    f_copy, rng_copy = copy.deepcopy((session.f, session.rng))
+
+    pending = PendingAdvance(advance_key())
+    pending_advance = pending
+    pending.future = submit(
+        advance_executor,
+        compute_advance,
+        pending,
+        f_copy,
+        rng_copy,
+        fit_data,
+        session.population,
+    )
+    pending.future.add_done_callback(lambda _: on_advance_done(pending))
+
+
+def prefetch() -> None:
+    """Speculatively computes the next generation from the current state,
+    unless the user is already waiting on one.
+    """
+    if pending_advance is None or not pending_advance.requested:
+        start_advance()
+
+
+def on_advance_done(pending) -> None:
+    with state_lock:
+        if quit:
+            return  # Ran on past HandleQuit, which couldn't cancel it
+        if pending is pending_advance and pending.requested:
+            apply_advance(pending)
+
+
+def apply_advance(pending) -> None:
+    """Swaps in a computed generation, then starts prefetching the next."""
+    global cur_chromosome_idx, pending_advance
+
+    if quit:
+        return  # The executors and checkpointer are shut down
+    pending_advance = None
+    try:
+        advance = pending.future.result()
+    except Exception as e:
+        print(f"Advancing failed: {e!r}")
+        return
+
+    generation = session.apply_step(
+        advance.population,
+        advance.argsort,
+        advance.evals,
+        n_fitted=pending.key[1],
+        f=advance.f,
+        rng=advance.rng,
+    )
+    checkpointer.record(generation)
+    step_observer.profiles.extend(advance.profiles)
+    save_demo_state()
+
+    print(f"Generation {session.iter + 1}")
+
+    cur_chromosome_idx = None
+    # NOTE We keep the current chromosome playing
+    prefetch()
+
+
+# Projections (and their Voronoi backgrounds) of the design points, and of the
+# design points together with the current population
+PlotData = namedtuple(
+    "PlotData",
+    ["labels", "X_proj", "voronoi", "joint_proj", "joint_voronoi", "pop_size"],
+)
+
+
+def compute_plot_data(model, X, labels, population):
+    """The expensive part of plotting (t-SNE, 1-NN), run on the plot worker.
+    Drawing has to happen on the main thread (see show_plots()). The t-SNE
+    embedding is only recomputed when there are new ratings; the population is
+    placed into it.
+    """
+    if model is None:
+        return None
+
+    X_proj, pop_proj = plot.projection.project(X, population)
+    y_pred = model.predict(X)
+    joint_proj = np.vstack([X_proj, pop_proj])
+    return PlotData(
+        labels=labels,
+        X_proj=X_proj,
+        voronoi=plot.voronoi_background(X_proj, y_pred),
+        joint_proj=joint_proj,
+        joint_voronoi=plot.voronoi_background(X_proj, y_pred, extent=joint_proj),
+        pop_size=len(population),
+    )
+
+
+def show_plots(data) -> None:
+    if step_observer.profiles:
+        plot.step_profiles(step_observer)
+        plt.show()
+        plt.clf()
+
+    if data is not None:
+        plt.scatter(data.X_proj[:, 0], data.X_proj[:, 1], c=data.labels, marker=".")
+        plt.show()
+        plt.clf()
+
+        plot.draw_voronoi(*data.voronoi, data.X_proj, data.labels)
+        plt.show()
+        plt.clf()
+
+        pop_size = data.pop_size
+        plot.draw_voronoi(
+            *data.joint_voronoi, data.joint_proj[:-pop_size], data.labels, alpha=0.1
+        )
+        plt.show()
+        plt.clf()
+
+        plot.draw_voronoi(*data.joint_voronoi, data.joint_proj[-pop_size:], alpha=0.1)
+        plt.show()
+        plt.clf()
+
+    if len(session.stats) > 0:
+        plot.population_histogram(session.stats)
+        plt.show()
+        plt.clf()
+
+
+def show_ready_plots() -> None:
+    while not ready_plots.empty():
+        future = ready_plots.get()
+        try:
+            data = future.result()
+        except Exception as e:
+            print(f"Plotting failed: {e!r}")
+            continue
+        show_plots(data)
+
+
+def save_demo_state():
+    """Checkpoints the session. Past generations are archived incrementally by
+    the checkpointer, so only the current state is rewritten each time.
+    """
+    checkpointer.save(session.state())
+
+
+def restore_demo_state() -> bool:
+    """
+    Returns:
+      (bool): whether there was a checkpoint to restore
+    """
+    state = checkpointer.load()
+    if state is None:
+        return False
+
+    session.restore(state)
+    for generation in checkpointer.archive():
+        session.record(generation)
+    return True
 
 
 def initialize_demo_state(
-    function, ip=AUDIO_SERVER_IP, port=AUDIO_SERVER_PORT, pop_size=POPULATION_SIZE
+    function,
+    ip=AUDIO_SERVER_IP,
+    port=AUDIO_SERVER_PORT,
+    pop_size=POPULATION_SIZE,
+    checkpoint_dir=CHECKPOINT_DIR,
+    resume=False,
+    weighting=None,
+    seed=None,
+    sequence=False,
 ):
-    """Begins genetic algorithm, connects to OSC server for producing sound"""
-    global client, cur_population, f, iter
+    """Begins genetic algorithm (or resumes it from the checkpoint in 
+    checkpoint_dir), connects to OSC server for producing sound
+
+    Args:
+      weighting (Weighting): recency weighting of the user's ratings
+      seed (int): seed for a new session's random draws; a resumed session
+        continues its checkpointed random state instead
+      sequence (bool): sequence the parts here and send the server timetagged
+        notes (see sequencer.py), instead of having it loop the patterns
+    """
+    global checkpointer, client, session, sequencer
 
     print("Initializing audio client...")
-    client = udp_client.SimpleUDPClient(ip, port)
+    client = OSCTransport(ip, port)
+    if sequence:
+        sequencer = Sequencer(client)
+        sequencer.start()
     print(f"Sending OSC messages to {ip}, port {port}")
 
-    print("Initializing Chromosomes...")
-    init_chromosome = dynamics.init
-    iter = 0
-    cur_population = np.array([init_chromosome() for _ in range(pop_size)])
-    all_populations.append(cur_population)
-    f = function()
-
-    print(f"Generation {iter + 1}")
+    session = Session(
+        function,
+        dynamics=dynamics,
+        pop_size=pop_size,
+        weighting=weighting,
+        seed=seed,
+        history_length=HISTORY_LENGTH,
+    )
+    checkpointer = Checkpointer(checkpoint_dir)
+    if resume and restore_demo_state():
+        print(f"Resumed session from {checkpoint_dir}")
+    else:
+        print("Initializing Chromosomes...")
+        save_demo_state()
+
+    print(f"Generation {session.iter + 1}")
+    prefetch()
 
 
 def get_input():
@@ -349,15 +606,65 @@ def get_input():
 
 
 # read-eval-print loop
-def repl():
-    initialize_demo_state(LogRegUserPreferenceFunc)
+def repl(
+    checkpoint_dir=CHECKPOINT_DIR,
+    resume=False,
+    online=False,
+    weighting=None,
+    seed=None,
+    sequence=False,
+):
+    function = SGDUserPreferenceFunc if online else LogRegUserPreferenceFunc
+    initialize_demo_state(
+        function,
+        checkpoint_dir=checkpoint_dir,
+        resume=resume,
+        weighting=weighting,
+        seed=seed,
+        sequence=sequence,
+    )
 
     print("Enter commands ('help' for help):")
     while not quit:
         cmd = get_input()
         handler = command_handlers[cmd]
-        handler()
+        with state_lock:
+            handler()
+        show_ready_plots()
 
 
 if __name__ == "__main__":
-    repl()
+    parser = argparse.ArgumentParser(description="REPL client for genalg-sequencer")
+    parser.add_argument(
+        "--resume", action="store_true", help="resume the checkpointed session"
+    )
+    parser.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR)
+    parser.add_argument(
+        "--online",
+        action="store_true",
+        help="learn preferences online, only from new ratings at each advance",
+    )
+    parser.add_argument(
+        "--weighting",
+        choices=WEIGHTINGS,
+        help="weight recent ratings more heavily when learning preferences",
+    )
+    parser.add_argument(
+        "--seed", type=int, help="seed a new session, to make it reproducible"
+    )
+    parser.add_argument(
+        "--sequence",
+        action="store_true",
+        help="schedule notes from here, timetagged, for steadier timing",
+    )
+    args = parser.parse_args()
+
+    weighting = WEIGHTINGS[args.weighting]() if args.weighting else None
+    repl(
+        checkpoint_dir=args.checkpoint_dir,
+        resume=args.resume,
+        online=args.online,
+        weighting=weighting,
+        seed=args.seed,
+        sequence=args.sequence,
+    )
@@ -0,0 +1,323 @@
+"""
+history.py
+author: garrick
+
+Records of a genetic algorithm run. A HistorySink receives each generation as
+it's produced and decides what to keep: everything, every k-th generation, the
+last N generations, or everything but on disk instead of in memory.
+
+MemmapSink writes a single binary history file laid out as:
+
+  header (HEADER_SIZE bytes): magic, capacity (n_gens), pop_size, dim,
+    n_populations and n_evals written so far, and the population dtype
+  populations: (n_gens, pop_size, dim) array of the population dtype
+  evals: (n_gens, pop_size) float64 array
+
+Both arrays are preallocated, so the file is appended to in place, and
+open_history() memory-maps it for random access without loading anything.
+"""
+import os
+import struct
+from collections import deque, namedtuple
+
+import numpy as np
+
+# populations[i] is evaluated by evals[i] (argsorts[i] sorts evals[i]). The
+# final population is never evaluated, so there's one fewer entry in evals.
+# generations[i] is the generation number of populations[i]; None means every
+# generation was kept, so it's just i.
+GenAlgHistory = namedtuple(
+    "GenAlgHistory",
+    ["populations", "argsorts", "evals", "generations"],
+    defaults=[None],
+)
+
+
+class HistorySink:
+    def __init__(self) -> None:
+        pass
+
+    def record(self, generation, population, argsort=None, evals=None) -> None:
+        """Receive one generation. Generations arrive in order, each once it's
+        been evaluated (the final one arrives without evaluations).
+
+        Args:
+          generation (int): generation number, starting from 0
+          population: the population of that generation
+          argsort (np.ndarray): argsort of evals, or None
+          evals (np.ndarray): evaluations of population, or None
+        """
+        raise NotImplementedError("Subclasses must override this function")
+
+    def history(self) -> GenAlgHistory:
+        raise NotImplementedError("Subclasses must override this function")
+
+    def close(self) -> None:
+        pass
+
+
+class KeepAllSink(HistorySink):
+    def __init__(self) -> None:
+        """Keeps every generation in memory."""
+        super().__init__()
+        self.populations = []
+        self.argsorts = []
+        self.evals = []
+
+    def record(self, generation, population, argsort=None, evals=None) -> None:
+        self.populations.append(population)
+        if evals is not None:
+            self.argsorts.append(argsort)
+            self.evals.append(evals)
+
+    def history(self) -> GenAlgHistory:
+        return GenAlgHistory(
+            populations=self.populations, argsorts=self.argsorts, evals=self.evals
+        )
+
+
+class EveryKthSink(HistorySink):
+    def __init__(self, k: int) -> None:
+        """Keeps generations 0, k, 2k, ... in memory."""
+        super().__init__()
+        self.k = k
+        self.populations = []
+        self.argsorts = []
+        self.evals = []
+        self.generations = []
+
+    def record(self, generation, population, argsort=None, evals=None) -> None:
+        if generation % self.k != 0:
+            return
+        self.populations.append(population)
+        self.generations.append(generation)
+        if evals is not None:
+            self.argsorts.append(argsort)
+            self.evals.append(evals)
+
+    def history(self) -> GenAlgHistory:
+        return GenAlgHistory(
+            populations=self.populations,
+            argsorts=self.argsorts,
+            evals=self.evals,
+            generations=self.generations,
+        )
+
+
+class RingBufferSink(HistorySink):
+    def __init__(self, capacity: int) -> None:
+        """Keeps the last capacity generations in memory."""
+        super().__init__()
+        self.populations = deque(maxlen=capacity)
+        self.generations = deque(maxlen=capacity)
+        self.evaluated = deque(maxlen=capacity)  # (generation, argsort, evals)
+
+    def record(self, generation, population, argsort=None, evals=None) -> None:
+        self.populations.append(population)
+        self.generations.append(generation)
+        if evals is not None:
+            self.evaluated.append((generation, argsort, evals))
+
+    def history(self) -> GenAlgHistory:
+        # Drop evaluations whose population has already left the buffer
+        first = self.generations[0] if self.generations else 0
+        evaluated = [e for e in self.evaluated if e[0] >= first]
+        return GenAlgHistory(
+            populations=list(self.populations),
+            argsorts=[argsort for _, argsort, _ in evaluated],
+            evals=[evals for _, _, evals in evaluated],
+            generations=list(self.generations),
+        )
+
+
+class _LazySequence:
+    """Read-only sequence that loads its items on access."""
+
+    def __init__(self, length, load) -> None:
+        self.length = length
+        self.load = load
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.length))]
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError("history index out of range")
+        return self.load(i)
+
+    def __iter__(self):
+        return (self.load(i) for i in range(self.length))
+
+
+class DiskSink(HistorySink):
+    def __init__(self, path: str) -> None:
+        """Streams every generation to .npy files in directory path, keeping
+        nothing in memory. history() loads generations lazily, memory-mapped.
+        Populations are saved in their array form (see np.asarray).
+        """
+        super().__init__()
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.n_populations = 0
+        self.n_evals = 0
+
+    def _file(self, kind, generation):
+        return os.path.join(self.path, f"{kind}_{generation:06d}.npy")
+
+    def record(self, generation, population, argsort=None, evals=None) -> None:
+        np.save(self._file("population", generation), np.asarray(population))
+        self.n_populations += 1
+        if evals is not None:
+            np.save(self._file("evals", generation), evals)
+            self.n_evals += 1
+
+    def history(self) -> GenAlgHistory:
+        def load(kind):
+            return lambda i: np.load(self._file(kind, i), mmap_mode="r")
+
+        return GenAlgHistory(
+            populations=_LazySequence(self.n_populations, load("population")),
+            argsorts=_LazySequence(
+                self.n_evals, lambda i: np.argsort(load("evals")(i))
+            ),
+            evals=_LazySequence(self.n_evals, load("evals")),
+        )
+
+
+HISTORY_MAGIC = b"GAHIST01"
+HEADER_FORMAT = "<8s5Q8s"  # magic, n_gens, pop_size, dim, n_pops, n_evals, dtype
+HEADER_SIZE = 64
+
+
+def _layout(n_gens, pop_size, dim, dtype):
+    """
+    Returns:
+      (tuple): offset of the evals block, and total file size, in bytes
+    """
+    evals_offset = HEADER_SIZE + n_gens * pop_size * dim * np.dtype(dtype).itemsize
+    return evals_offset, evals_offset + n_gens * pop_size * 8
+
+
+def _read_header(path):
+    with open(path, "rb") as fp:
+        raw = fp.read(struct.calcsize(HEADER_FORMAT))
+    magic, n_gens, pop_size, dim, n_populations, n_evals, dtype = struct.unpack(
+        HEADER_FORMAT, raw
+    )
+    if magic != HISTORY_MAGIC:
+        raise ValueError(f"{path} is not a genetic algorithm history file")
+    dtype = np.dtype(dtype.rstrip(b"\0").decode())
+    return n_gens, pop_size, dim, n_populations, n_evals, dtype
+
+
+class MemmapSink(HistorySink):
+    def __init__(self, path: str, n_gens: int, dtype=np.float64, flush_every=10):
+        """Appends every generation to a preallocated, memory-mapped history 
+        file (see the layout above). The file is created on the first record, 
+        once the population shape is known.
+
+        Args:
+          n_gens (int): capacity in generations; max_iters + 1 for a full run
+          dtype: dtype populations are stored as
+          flush_every (int): generations between flushes to disk
+        """
+        super().__init__()
+        self.path = path
+        self.n_gens = n_gens
+        self.dtype = np.dtype(dtype)
+        self.flush_every = flush_every
+        self.n_populations = 0
+        self.n_evals = 0
+        self.file = None
+
+    def _create(self, pop_size, dim):
+        evals_offset, size = _layout(self.n_gens, pop_size, dim, self.dtype)
+        with open(self.path, "wb") as fp:
+            fp.truncate(size)
+        self.file = np.memmap(self.path, dtype=np.uint8, mode="r+")
+        self.populations = np.ndarray(
+            (self.n_gens, pop_size, dim),
+            dtype=self.dtype,
+            buffer=self.file,
+            offset=HEADER_SIZE,
+        )
+        self.evals = np.ndarray(
+            (self.n_gens, pop_size),
+            dtype=np.float64,
+            buffer=self.file,
+            offset=evals_offset,
+        )
+        self.pop_size, self.dim = pop_size, dim
+        self._write_header()
+
+    def _write_header(self):
+        struct.pack_into(
+            HEADER_FORMAT,
+            self.file,
+            0,
+            HISTORY_MAGIC,
+            self.n_gens,
+            self.pop_size,
+            self.dim,
+            self.n_populations,
+            self.n_evals,
+            self.dtype.str.encode(),
+        )
+
+    def record(self, generation, population, argsort=None, evals=None) -> None:
+        population = np.asarray(population)
+        if self.file is None:
+            self._create(*population.shape)
+        if generation != self.n_populations:
+            raise ValueError(
+                f"Expected generation {self.n_populations}, got {generation}"
+            )
+        if generation >= self.n_gens:
+            raise ValueError(f"History file is full ({self.n_gens} generations)")
+
+        self.populations[generation] = population
+        self.n_populations += 1
+        if evals is not None:
+            self.evals[generation] = evals
+            self.n_evals += 1
+        # Counts go in last, so a reader never sees a partially written entry
+        self._write_header()
+
+        if self.n_populations % self.flush_every == 0:
+            self.file.flush()
+
+    def history(self) -> GenAlgHistory:
+        if self.file is None:
+            return GenAlgHistory(populations=[], argsorts=[], evals=[])
+        self.file.flush()
+        return open_history(self.path)
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.flush()
+
+
+def open_history(path: str) -> GenAlgHistory:
+    """Memory-maps a history file written by MemmapSink. Nothing is read until
+    it's indexed, so even very large runs open instantly.
+    """
+    n_gens, pop_size, dim, n_populations, n_evals, dtype = _read_header(path)
+    evals_offset, _ = _layout(n_gens, pop_size, dim, dtype)
+
+    populations = np.memmap(
+        path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(n_gens, pop_size, dim)
+    )
+    evals = np.memmap(
+        path, dtype=np.float64, mode="r", offset=evals_offset, shape=(n_gens, pop_size)
+    )
+    evals = evals[:n_evals]
+
+    return GenAlgHistory(
+        populations=populations[:n_populations],
+        argsorts=_LazySequence(n_evals, lambda i: np.argsort(evals[i])),
+        evals=evals,
+    )
@@ -0,0 +1,162 @@
+"""
+islands.py
+author: garrick
+
+Island model genetic algorithm. Several sub-populations (islands) evolve
+independently in separate worker processes, and every so often the best few
+individuals of each island migrate to its neighbours. Keeping the islands
+mostly apart preserves diversity, and evolving them in parallel uses every core.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from function import Function, UniformRandomFunc
+from genetic import (
+    POPULATION_SIZE,
+    GenAlgDynamics,
+    GenAlgHistory,
+    genetic_algorithm_step,
+    init_population,
+    music_dynamics,
+)
+from rng import spawn, worker_initializer
+
+TOPOLOGIES = ["ring", "full"]
+
+
+def migration_sources(topology, n_islands):
+    """
+    Returns:
+      (list): for each island, the list of islands that send it migrants
+    """
+    if topology == "ring":
+        return [[(i - 1) % n_islands] for i in range(n_islands)]
+    elif topology == "full":
+        return [[j for j in range(n_islands) if j != i] for i in range(n_islands)]
+    raise ValueError(f"Unknown topology {topology}, expected one of {TOPOLOGIES}")
+
+
+def _concatenate(populations):
+    if isinstance(populations[0], np.ndarray):
+        return np.concatenate(populations)
+    return type(populations[0]).concatenate(populations)  # e.g. Population
+
+
+def _evolve_island(population, function, dynamics, n_gens, pop_size, rng):
+    """Worker for island_genetic_algorithm. Runs n_gens generations on one
+    island and evaluates the final population, so the caller can pick migrants.
+    The island's Generator is returned too, so its stream continues next time.
+    """
+    if isinstance(function, Function):
+        f = function
+    else:
+        f = function()
+        f.rng = rng
+
+    populations, argsorts, evals = [], [], []
+    for _ in range(n_gens):
+        population, argsort, y = genetic_algorithm_step(
+            population, f, dynamics=dynamics, pop_size=pop_size, rng=rng
+        )
+        populations.append(population)
+        argsorts.append(argsort)
+        evals.append(y)
+
+    return populations, argsorts, evals, f(population), rng
+
+
+def migrate(populations, final_evals, sources, n_migrants):
+    """Replaces the n_migrants worst individuals of each island with the best
+    n_migrants of each of its source islands. Modifies populations in place.
+    """
+    best = [np.argsort(y)[:n_migrants] for y in final_evals]
+    migrants = [populations[i][best[i]] for i in range(len(populations))]
+
+    for i, island_sources in enumerate(sources):
+        incoming = _concatenate([migrants[j] for j in island_sources])
+        # Never replace more than the whole island
+        incoming = incoming[: len(populations[i])]
+        worst = np.argsort(final_evals[i])[::-1][: len(incoming)]
+        populations[i][worst] = incoming
+
+
+def island_genetic_algorithm(
+    function=UniformRandomFunc,
+    dynamics: GenAlgDynamics = music_dynamics,
+    max_iters=30,
+    pop_size=POPULATION_SIZE,
+    n_islands=4,
+    migration_interval=5,
+    n_migrants=2,
+    topology="ring",
+    n_workers=None,
+    rng=None,
+) -> GenAlgHistory:
+    """Runs genetic algorithm on n_islands islands of pop_size individuals in a
+    pool of worker processes, with migration every migration_interval
+    generations.
+
+    The returned history merges the islands: entry i holds every island's
+    population for generation i, concatenated in island order (so
+    n_islands * pop_size individuals), and argsorts rank the merged evals.
+
+    Args:
+      function: a Function subclass to instantiate in each worker, or a
+        picklable Function instance
+      topology (str): "ring" (each island sends to the next) or "full" (every
+        island sends to every other)
+      n_workers (int): worker processes (default: min(n_islands, CPUs))
+      rng: seed, SeedSequence or Generator from which each island gets its own
+        independent stream (see rng.spawn), so runs are reproducible regardless
+        of n_workers
+    """
+    sources = migration_sources(topology, n_islands)
+    n_workers = n_workers or min(n_islands, os.cpu_count())
+    # The islands' streams, then the workers' own (for functions without one)
+    rngs = spawn(rng, n_islands + n_workers)
+    rngs, worker_rngs = rngs[:n_islands], rngs[n_islands:]
+    populations = [init_population(dynamics, pop_size, rng=r) for r in rngs]
+
+    all_populations = [_concatenate(populations)]
+    all_argsorts = []
+    all_evals = []
+
+    initializer = worker_initializer(worker_rngs)
+    with ProcessPoolExecutor(max_workers=n_workers, **initializer) as pool:
+        iter = 0
+        while iter < max_iters:
+            n_gens = min(migration_interval, max_iters - iter)
+            futures = [
+                pool.submit(
+                    _evolve_island,
+                    population,
+                    function,
+                    dynamics,
+                    n_gens,
+                    pop_size,
+                    island_rng,
+                )
+                for population, island_rng in zip(populations, rngs)
+            ]
+            results = [future.result() for future in futures]
+
+            for gen in range(n_gens):
+                population = _concatenate([result[0][gen] for result in results])
+                evals = np.concatenate([result[2][gen] for result in results])
+                all_populations.append(population)
+                all_argsorts.append(np.argsort(evals))
+                all_evals.append(evals)
+
+            populations = [result[0][-1] for result in results]
+            final_evals = [result[3] for result in results]
+            rngs = [result[4] for result in results]
+            iter += n_gens
+
+            if iter < max_iters:
+                migrate(populations, final_evals, sources, n_migrants)
+
+    return GenAlgHistory(
+        populations=all_populations, argsorts=all_argsorts, evals=all_evals
+    )
@@ -0,0 +1,281 @@
+"""
+osc.py
+author: garrick
+
+OSC transport to the audio servers (sc/server.sc, chuck/server.ck).
+
+Chromosomes are encoded straight from population arrays into preallocated
+buffers: every message of a batch has the same layout, so a batch is a
+structured array of big-endian records (see ChromosomeEncoder) filled with a
+few vectorized assignments. Batches go out as OSC bundles, with a timetag
+saying when the server should act on them, split into as few datagrams as fit
+max_datagram_size.
+
+UDPSink receives datagrams locally, for testing without an audio server.
+"""
+import socket
+import struct
+import time
+
+import numpy as np
+from pythonosc.osc_bundle import OscBundle
+from pythonosc.osc_message import OscMessage
+
+from genetic import EXPRESSION_DIM, TIMING_DIM
+
+AUDIO_SERVER_IP = "127.0.0.1"
+AUDIO_SERVER_PORT = 57120
+
+ADDR_NEXT = "/next"
+ADDR_NOTE = "/note"  # A single step of a part, sent by sequencer.py
+ADDR_PUSH = "/push"
+ADDR_POP = "/pop"
+ADDR_CLEAR = "/clear"
+ADDR_START_RECORDING = "/startRecording"
+ADDR_STOP_RECORDING = "/stopRecording"
+
+BUNDLE_TAG = b"#bundle\0"
+BUNDLE_HEADER_SIZE = 16  # Tag and timetag
+IMMEDIATELY = 1  # The special timetag meaning "as soon as received"
+NTP_EPOCH_OFFSET = 2208988800  # Seconds from 1900 (NTP) to 1970 (Unix)
+# Comfortably below the UDP limit (65507 bytes); datagrams are fragmented past
+# the network's MTU anyway
+MAX_DATAGRAM_SIZE = 8192
+
+
+def timetag(t=None) -> int:
+    """
+    Args:
+      t (float): Unix time in seconds (default: now)
+
+    Returns:
+      (int): the OSC (NTP) timetag of t, 32.32 fixed point seconds since 1900
+    """
+    t = time.time() if t is None else t
+    return int((t + NTP_EPOCH_OFFSET) * 2 ** 32)
+
+
+def _osc_string(s: str) -> bytes:
+    """Null-terminated and padded to a multiple of 4 bytes."""
+    b = s.encode() + b"\0"
+    return b + b"\0" * (-len(b) % 4)
+
+
+def encode_message(address: str, args=()) -> bytes:
+    """Encodes an arbitrary message, for the odd control message. Args may be
+    ints, floats or strings, or a single one of them (like
+    SimpleUDPClient.send_message).
+    """
+    if not isinstance(args, (list, tuple)):
+        args = [args]
+    tags, data = ",", []
+    for arg in args:
+        if isinstance(arg, (bool, np.bool_)):
+            arg = int(arg)
+        if isinstance(arg, (int, np.integer)):
+            tags += "i"
+            data.append(struct.pack(">i", arg))
+        elif isinstance(arg, (float, np.floating)):
+            tags += "f"
+            data.append(struct.pack(">f", arg))
+        elif isinstance(arg, str):
+            tags += "s"
+            data.append(_osc_string(arg))
+        else:
+            raise TypeError(f"Can't encode {type(arg).__name__} as an OSC argument")
+    return _osc_string(address) + _osc_string(tags) + b"".join(data)
+
+
+class ChromosomeEncoder:
+    def __init__(self, address: str = ADDR_NEXT) -> None:
+        """Encodes chromosomes as messages (instrument as an int, expression as
+        floats, timing as ints) to address, in bundles.
+
+        A bundle of n chromosomes is the bundle header followed by n records
+        of self.dtype: the element size, the address and type tags (constant,
+        written once when the buffer is allocated), then the arguments.
+        """
+        self.address = address
+        header = _osc_string(address) + _osc_string(
+            ",i" + "f" * EXPRESSION_DIM + "i" * TIMING_DIM
+        )
+        self.header = header
+        self.dtype = np.dtype(
+            [
+                ("size", ">i4"),
+                ("header", f"S{len(header)}"),
+                ("instrument", ">i4"),
+                ("expression", ">f4", (EXPRESSION_DIM,)),
+                ("timing", ">i4", (TIMING_DIM,)),
+            ]
+        )
+        self.capacity = 0
+        self.buffer = np.zeros(BUNDLE_HEADER_SIZE, dtype=np.uint8)
+        self.buffer[:8] = np.frombuffer(BUNDLE_TAG, dtype=np.uint8)
+
+    @property
+    def message_size(self) -> int:
+        return self.dtype.itemsize - 4
+
+    def _records(self, n) -> np.ndarray:
+        if n > self.capacity:
+            capacity = max(n, 2 * self.capacity)
+            buffer = np.zeros(
+                BUNDLE_HEADER_SIZE + capacity * self.dtype.itemsize, dtype=np.uint8
+            )
+            buffer[:BUNDLE_HEADER_SIZE] = self.buffer[:BUNDLE_HEADER_SIZE]
+            records = buffer[BUNDLE_HEADER_SIZE:].view(self.dtype)
+            records["size"] = self.message_size
+            records["header"] = self.header
+            self.buffer, self.capacity = buffer, capacity
+        return self.buffer[BUNDLE_HEADER_SIZE:].view(self.dtype)[:n]
+
+    def encode_bundle(self, population, timetag=IMMEDIATELY) -> memoryview:
+        """
+        Args:
+          population: (n, CHROMOSOME_DIM) array, or a Population
+
+        Returns:
+          (memoryview): the bundle; only valid until the next encode
+        """
+        population = np.asarray(population)
+        records = self._records(len(population))
+        records["instrument"] = population[:, 0]
+        records["expression"] = population[:, 1 : EXPRESSION_DIM + 1]
+        records["timing"] = population[:, EXPRESSION_DIM + 1 :]
+        self.buffer[8:BUNDLE_HEADER_SIZE].view(">u8")[0] = timetag
+
+        size = BUNDLE_HEADER_SIZE + records.nbytes
+        return memoryview(self.buffer)[:size]
+
+    def encode_message(self, chromosome) -> memoryview:
+        """
+        Returns:
+          (memoryview): a single message; only valid until the next encode
+        """
+        bundle = self.encode_bundle(np.asarray(chromosome)[np.newaxis])
+        return bundle[BUNDLE_HEADER_SIZE + 4 :]
+
+
+def _bundle(messages, timetag) -> bytes:
+    elements = [struct.pack(">i", len(m)) + bytes(m) for m in messages]
+    return BUNDLE_TAG + struct.pack(">Q", timetag) + b"".join(elements)
+
+
+class OSCTransport:
+    def __init__(
+        self,
+        ip=AUDIO_SERVER_IP,
+        port=AUDIO_SERVER_PORT,
+        max_datagram_size=MAX_DATAGRAM_SIZE,
+    ) -> None:
+        """Sends OSC over a single UDP socket. send_message() is compatible
+        with pythonosc's SimpleUDPClient.
+        """
+        self.server = (ip, port)
+        self.max_datagram_size = max_datagram_size
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.encoders = {}  # OSC address -> ChromosomeEncoder
+        self.n_datagrams = 0
+        self.n_bytes = 0
+
+    def _send(self, datagram) -> None:
+        self.sock.sendto(datagram, self.server)
+        self.n_datagrams += 1
+        self.n_bytes += len(datagram)
+
+    def _encoder(self, address) -> ChromosomeEncoder:
+        if address not in self.encoders:
+            self.encoders[address] = ChromosomeEncoder(address)
+        return self.encoders[address]
+
+    def send_message(self, address: str, args=()) -> None:
+        self._send(encode_message(address, args))
+
+    def send_chromosome(self, chromosome, address: str = ADDR_NEXT) -> None:
+        self._send(self._encoder(address).encode_message(chromosome))
+
+    def send_population(
+        self, population, address: str = ADDR_NEXT, timetag=IMMEDIATELY
+    ) -> int:
+        """Sends a message per chromosome, bundled into as few datagrams as
+        possible, all with the same timetag.
+
+        Returns:
+          (int): number of datagrams sent
+        """
+        encoder = self._encoder(address)
+        per_datagram = (self.max_datagram_size - BUNDLE_HEADER_SIZE) // (
+            encoder.dtype.itemsize
+        )
+        n_sent = 0
+        for start in range(0, len(population), per_datagram):
+            chunk = population[start : start + per_datagram]
+            self._send(encoder.encode_bundle(chunk, timetag))
+            n_sent += 1
+        return n_sent
+
+    def send_bundle(self, messages, timetag=IMMEDIATELY) -> int:
+        """Sends encoded messages (e.g. from encode_message()) as bundles with
+        the given timetag, splitting them across datagrams if needed.
+
+        Returns:
+          (int): number of datagrams sent
+        """
+        n_sent = 0
+        chunk, size = [], BUNDLE_HEADER_SIZE
+        for message in messages:
+            message = bytes(message)  # Encoder buffers are reused
+            if chunk and size + 4 + len(message) > self.max_datagram_size:
+                self._send(_bundle(chunk, timetag))
+                n_sent += 1
+                chunk, size = [], BUNDLE_HEADER_SIZE
+            chunk.append(message)
+            size += 4 + len(message)
+        if chunk:
+            self._send(_bundle(chunk, timetag))
+            n_sent += 1
+        return n_sent
+
+    def close(self) -> None:
+        self.sock.close()
+
+
+class UDPSink:
+    def __init__(self, ip="127.0.0.1", port=0) -> None:
+        """A UDP socket to point an OSCTransport at in tests. The default port
+        of 0 binds any free port (see self.port).
+        """
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((ip, port))
+        self.ip, self.port = self.sock.getsockname()
+
+    def receive(self, timeout=1.0) -> bytes:
+        """Blocks for the next datagram; raises socket.timeout after timeout
+        seconds.
+        """
+        self.sock.settimeout(timeout)
+        datagram, _ = self.sock.recvfrom(65536)
+        return datagram
+
+    def close(self) -> None:
+        self.sock.close()
+
+
+def bundle_timetag(datagram: bytes) -> int:
+    return struct.unpack(">Q", datagram[8:BUNDLE_HEADER_SIZE])[0]
+
+
+def decode(datagram: bytes) -> list:
+    """
+    Returns:
+      (list): (address, params) of every message in a datagram, flattening
+        bundles
+    """
+    if not OscBundle.dgram_is_bundle(datagram):
+        message = OscMessage(datagram)
+        return [(message.address, message.params)]
+    messages = []
+    for content in OscBundle(datagram):
+        messages.extend(decode(content.dgram))
+    return messages
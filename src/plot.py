@@ -3,14 +3,30 @@ plot.py
 author: garrick
 
 Utilities for plotting. Think of this as a wrapper around matplotlib.
+
+Plots of design points share a Projection (by default, the module's
+projection), which embeds a dataset in 2-D once and reuses the embedding for
+every later plot of the same data. New points, like the current population,
+are placed into an existing embedding rather than re-embedding everything.
 """
+import hashlib
+import threading
+import time
 
 import matplotlib.pyplot as plt
 import numpy as np
+from scipy.spatial import cKDTree
 from sklearn.datasets import load_iris
+from sklearn.decomposition import PCA
 from sklearn.linear_model import LogisticRegression
 from sklearn.manifold import TSNE
-from sklearn.neighbors import KNeighborsClassifier
+from sklearn.neighbors import KNeighborsClassifier, NearestNeighbors
+
+from stats import PopulationStats
+
+TSNE_PERPLEXITY = 30  # sklearn's default; t-SNE needs more points than this
+MIN_RESOLUTION = 32  # Of the coarsest grid of voronoi_background
+QUERY_CHUNK_SIZE = 65536  # Grid points per KD-tree query
 
 
 def tsne_example():
@@ -57,70 +73,252 @@ def tsne_example():
     plt.show()
 
 
-def approx_voronoi_tesselation(model, X, labels, resolution=500, alpha=0.3):
-    # Model should be fitted
-    X_proj = TSNE(n_components=2, random_state=222).fit_transform(X)
-    y_pred = model.predict(X)
+def _digest(X: np.ndarray) -> tuple:
+    return X.shape, hashlib.blake2b(X.tobytes(), digest_size=16).digest()
 
-    proj_xmin, proj_xmax = np.min(X_proj[:, 0]), np.max(X_proj[:, 0])
-    proj_ymin, proj_ymax = np.min(X_proj[:, 1]), np.max(X_proj[:, 1])
-    xx, yy = np.meshgrid(
-        np.linspace(proj_xmin, proj_xmax, resolution),
-        np.linspace(proj_ymin, proj_ymax, resolution),
-    )
 
-    # approximate Voronoi tesselation on (resolution, resolution) grid using 1-NN
-    background_model = KNeighborsClassifier(n_neighbors=1).fit(X_proj, y_pred)
-    voronoiBackground = background_model.predict(np.c_[xx.ravel(), yy.ravel()])
-    voronoiBackground = voronoiBackground.reshape((resolution, resolution))
+class Projection:
+    def __init__(self, method="tsne", n_neighbors=5, random_state=222) -> None:
+        """2-D embedding of design points for plotting, computed once per
+        version of the data. Points outside the data are placed out of sample:
+        by PCA's linear map, or for t-SNE (which has none) at the
+        distance-weighted mean embedding of their nearest neighbors in the
+        data.
 
-    plt.contourf(xx, yy, voronoiBackground, alpha=alpha)
-    plt.scatter(X_proj[:, 0], X_proj[:, 1], c=labels, marker=".")
+        Args:
+          method (str): "tsne", or "pca" (much faster, but cruder). t-SNE
+            falls back to PCA when there are too few points for its
+            perplexity.
+          n_neighbors (int): neighbors placing each out of sample point
+        """
+        self.method = method
+        self.n_neighbors = n_neighbors
+        self.random_state = random_state
+        self.lock = threading.Lock()  # Plots may be computed on a worker
 
+        self.version = None  # Identifies the data embedded
+        self.embedding = None
+        self.pca = None  # Fitted PCA, if that's the method in use
+        self.neighbors = None  # NearestNeighbors of the data, for t-SNE
+        self.n_fits = 0
 
-def tsne_scatter(X, labels):
-    X_proj = TSNE(n_components=2, random_state=222).fit_transform(X)
-    plt.scatter(X_proj[:, 0], X_proj[:, 1], c=labels, marker=".")
-    return X_proj
+    def _fit(self, X: np.ndarray) -> None:
+        if self.method == "tsne" and len(X) > TSNE_PERPLEXITY:
+            self.embedding = TSNE(
+                n_components=2, random_state=self.random_state
+            ).fit_transform(X)
+            self.pca = None
+            n_neighbors = min(self.n_neighbors, len(X))
+            self.neighbors = NearestNeighbors(n_neighbors=n_neighbors).fit(X)
+        else:
+            n_components = min(2, *X.shape)
+            self.pca = PCA(n_components, random_state=self.random_state).fit(X)
+            self.neighbors = None
+            self.embedding = self._pca_transform(X)
+        # Handed out by project() without copying, so it can't be changed
+        self.embedding.setflags(write=False)
+        self.n_fits += 1
+
+    def _pca_transform(self, Y: np.ndarray) -> np.ndarray:
+        # Padded to 2-D if there was too little data for two components
+        Y_proj = np.zeros((len(Y), 2))
+        Y_proj[:, : self.pca.n_components_] = self.pca.transform(Y)
+        return Y_proj
+
+    def _transform(self, Y: np.ndarray) -> np.ndarray:
+        if self.pca is not None:
+            return self._pca_transform(Y)
+        distances, idxs = self.neighbors.kneighbors(Y)
+        # A point of the data lands right on its own embedding
+        weights = 1 / np.maximum(distances, 1e-12)
+        weights /= weights.sum(axis=1, keepdims=True)
+        return np.einsum("ij,ijk->ik", weights, self.embedding[idxs])
+
+    def project(self, X, Y=None, version=None):
+        """Embeds X, reusing the embedding if X hasn't changed, and places Y
+        into the embedding.
+
+        Args:
+          X (np.ndarray): design points, shape (n, dim)
+          Y (np.ndarray): optional out of sample points, shape (m, dim)
+          version: identifies X, e.g. a dataset's n_appended (default: a hash
+            of X)
+
+        Returns:
+          (np.ndarray): read-only embedding of X, shape (n, 2), or if Y is
+            given, a tuple of the embeddings of X and Y
+        """
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        version = _digest(X) if version is None else version
+        with self.lock:
+            if version != self.version or self.embedding is None:
+                self._fit(X)
+                self.version = version
+            if Y is None:
+                return self.embedding
+            Y = np.asarray(Y, dtype=np.float64)
+            return self.embedding, self._transform(Y)
+
+
+projection = Projection()  # Shared by the plots, unless they're given another
+
+
+def _parents(n_fine, n_coarse) -> np.ndarray:
+    """Index of the nearest coarse grid line to each fine one."""
+    if n_fine == 1:
+        return np.zeros(1, dtype=np.int64)
+    return np.rint(np.arange(n_fine) * (n_coarse - 1) / (n_fine - 1)).astype(int)
+
+
+def _boundary(background: np.ndarray) -> np.ndarray:
+    """Cells with a differently labelled neighbor, grown by one cell."""
+    differs = np.zeros(background.shape, dtype=bool)
+    for axis in [0, 1]:
+        edge = np.diff(background, axis=axis) != 0
+        lo = [slice(None), slice(None)]
+        hi = [slice(None), slice(None)]
+        lo[axis], hi[axis] = slice(None, -1), slice(1, None)
+        differs[tuple(lo)] |= edge
+        differs[tuple(hi)] |= edge
+    grown = differs.copy()
+    grown[1:] |= differs[:-1]
+    grown[:-1] |= differs[1:]
+    grown[:, 1:] |= differs[:, :-1]
+    grown[:, :-1] |= differs[:, 1:]
+    return grown
 
 
-def new_population_locations(
-    model, X, labels, cur_population, resolution=500, alpha=0.1
+def voronoi_background(
+    X_proj,
+    labels,
+    resolution=500,
+    extent=None,
+    time_budget=None,
+    min_resolution=MIN_RESOLUTION,
 ):
-    pop_size = len(cur_population)
-    # Project both population and training data
-    X_proj = TSNE(n_components=2, random_state=222).fit_transform(
-        np.vstack([X, cur_population])
-    )
-    y_pred = model.predict(X)
+    """Approximate Voronoi tesselation of labelled, projected points on a
+    (resolution, resolution) grid using 1-NN.
 
-    proj_xmin, proj_xmax = np.min(X_proj[:, 0]), np.max(X_proj[:, 0])
-    proj_ymin, proj_ymax = np.min(X_proj[:, 1]), np.max(X_proj[:, 1])
-    xx, yy = np.meshgrid(
-        np.linspace(proj_xmin, proj_xmax, resolution),
-        np.linspace(proj_ymin, proj_ymax, resolution),
+    The grid is labelled coarse to fine: a coarse grid is labelled by
+    KD-tree queries, and each finer grid only queries near the class
+    boundaries of the previous one, copying the rest. Regions smaller than a
+    coarse cell can be missed; min_resolution=resolution labels every point.
+
+    Args:
+      extent (np.ndarray): points the grid should cover (default: X_proj)
+      time_budget (float): seconds to spend refining; once spent, the rest of
+        the grid keeps its coarser labels (default: no limit)
+      min_resolution (int): resolution of the coarsest grid
+
+    Returns:
+      (tuple): grid coordinates xx and yy, and the label of each grid point
+    """
+    start = time.perf_counter()
+    extent = X_proj if extent is None else extent
+    proj_xmin, proj_xmax = np.min(extent[:, 0]), np.max(extent[:, 0])
+    proj_ymin, proj_ymax = np.min(extent[:, 1]), np.max(extent[:, 1])
+
+    # Grid resolutions, coarsest first, each about half the next
+    resolutions = [resolution]
+    while resolutions[-1] // 2 >= min_resolution:
+        resolutions.append(-(-resolutions[-1] // 2))
+    resolutions.reverse()
+
+    tree = cKDTree(X_proj)
+    labels = np.asarray(labels)
+    for level, r in enumerate(resolutions):
+        xs = np.linspace(proj_xmin, proj_xmax, r)
+        ys = np.linspace(proj_ymin, proj_ymax, r)
+        if level == 0:
+            refine = np.ones((r, r), dtype=bool)
+            background = np.empty((r, r), dtype=labels.dtype)
+        else:
+            p = _parents(r, len(background))
+            refine = _boundary(background)[np.ix_(p, p)]
+            background = background[np.ix_(p, p)]
+
+        iy, ix = np.nonzero(refine)
+        for chunk in range(0, len(iy), QUERY_CHUNK_SIZE):
+            # The coarsest grid is always labelled in full
+            elapsed = time.perf_counter() - start
+            if level > 0 and time_budget is not None and elapsed > time_budget:
+                break
+            cy = iy[chunk : chunk + QUERY_CHUNK_SIZE]
+            cx = ix[chunk : chunk + QUERY_CHUNK_SIZE]
+            _, nearest = tree.query(np.column_stack([xs[cx], ys[cy]]))
+            background[cy, cx] = labels[nearest]
+
+    xx, yy = np.meshgrid(xs, ys)
+    return xx, yy, background
+
+
+def draw_voronoi(xx, yy, background, X_proj, labels=None, alpha=0.3):
+    plt.contourf(xx, yy, background, alpha=alpha)
+    plt.scatter(X_proj[:, 0], X_proj[:, 1], c=labels, marker=".")
+
+
+def step_profiles(observer):
+    """Plots per-phase wall time and population statistics of every step
+    recorded by a profiling.RecordingObserver.
+    """
+    fig, (ax_time, ax_stats) = plt.subplots(2, 1, sharex=True)
+    phase_seconds = observer.phase_seconds()
+    steps = np.arange(len(observer.profiles))
+    ax_time.stackplot(
+        steps,
+        *[seconds * 1e3 for seconds in phase_seconds.values()],
+        labels=list(phase_seconds),
     )
+    ax_time.set_ylabel("ms")
+    ax_time.legend(loc="upper left", fontsize=6)
 
-    # approximate Voronoi tesselation on (resolution, resolution) grid using 1-NN
-    background_model = KNeighborsClassifier(n_neighbors=1).fit(X_proj[:-pop_size], y_pred)
-    voronoiBackground = background_model.predict(np.c_[xx.ravel(), yy.ravel()])
-    voronoiBackground = voronoiBackground.reshape((resolution, resolution))
+    for stat in ["best", "mean", "diversity"]:
+        ax_stats.plot(steps, observer.stat(stat), label=stat)
+    ax_stats.set_xlabel("generation")
+    ax_stats.legend(loc="upper left", fontsize=6)
+    return fig
 
-    plt.contourf(xx, yy, voronoiBackground, alpha=alpha)
-    plt.scatter(X_proj[:-pop_size, 0], X_proj[:-pop_size, 1], c=labels, marker=".")
 
-    plt.show()
-    plt.clf()
+def population_histogram(stats):
+    """Plots how the populations of a run evolved: instrument shares, how
+    often each timing step is played, mean expression, and diversity.
 
-    plt.contourf(xx, yy, voronoiBackground, alpha=alpha)
-    plt.scatter(X_proj[-pop_size:, 0], X_proj[-pop_size:, 1], marker=".")
+    Args:
+      stats: a stats.PopulationStats, or a list of populations to compute one
+        from
+    """
+    if not isinstance(stats, PopulationStats):
+        stats = PopulationStats.from_populations(stats)
+    generations = stats["generation"]
 
-    plt.show()
-    plt.clf()
+    fig, axes = plt.subplots(2, 2, sharex=True)
+    ax_instrument, ax_timing, ax_expression, ax_diversity = axes.ravel()
 
+    counts = stats["instrument_counts"]
+    shares = counts / np.maximum(counts.sum(axis=1, keepdims=True), 1)
+    ax_instrument.stackplot(
+        generations, *shares.T, labels=[str(i) for i in range(shares.shape[1])]
+    )
+    ax_instrument.set_ylabel("instrument share")
+    ax_instrument.legend(loc="upper left", fontsize=6)
 
-def population_histogram(all_populations):
-    pass
+    # Generations along x, like the other plots
+    for ax, name in [(ax_timing, "timing_density"), (ax_expression, "expression_mean")]:
+        image = stats[name].T
+        extent = [generations[0], generations[-1], -0.5, len(image) - 0.5]
+        ax.imshow(image, aspect="auto", origin="lower", extent=extent)
+    ax_timing.set_ylabel("timing step")
+    ax_expression.set_ylabel("mean expression")
+    ax_expression.set_xlabel("generation")
+
+    ax_diversity.plot(generations, stats["hamming_diversity"], label="timing (Hamming)")
+    ax_diversity.plot(
+        generations, stats["euclidean_diversity"], label="expression (RMS distance)"
+    )
+    ax_diversity.plot(generations, stats["duplicate_rate"], label="duplicate rate")
+    ax_diversity.set_xlabel("generation")
+    ax_diversity.legend(loc="upper right", fontsize=6)
+    return fig
 
 
 if __name__ == "__main__":
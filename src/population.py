@@ -0,0 +1,257 @@
+"""
+population.py
+author: garrick
+
+Compact storage for populations of music chromosomes. Rather than one float64
+row per chromosome (see init_chromosome in genetic.py), a Population keeps each
+gene group in its own tightly typed column:
+
+  instrument: uint8, shape (pop_size,)
+  expression: float32, shape (pop_size, EXPRESSION_DIM)
+  timing_bits: uint16, shape (pop_size,); bit j is timing step j
+
+which takes about a quarter of the memory, and lets crossover and mutation work
+on timing with bitwise operations.
+"""
+import numpy as np
+
+from genetic import (
+    BAR_SIZE,
+    CHROMOSOME_DIM,
+    EXPRESSION_DIM,
+    N_BARS,
+    N_INSTRUMENTS,
+    TIMING_DIM,
+    BatchGenAlgDynamics,
+    batch_roulette_wheel_selection,
+)
+from rng import get_rng
+
+assert TIMING_DIM <= 16, "Timing must fit in a uint16"
+
+# Bit mask covering each bar of timing steps
+BAR_MASKS = np.array(
+    [((1 << BAR_SIZE) - 1) << (bar * BAR_SIZE) for bar in range(N_BARS)],
+    dtype=np.uint16,
+)
+
+
+def pack_timing(timing: np.ndarray) -> np.ndarray:
+    """
+    Args:
+      timing (np.ndarray): 0/1 timing of shape (pop_size, TIMING_DIM)
+
+    Returns:
+      (np.ndarray): bit-packed timing of shape (pop_size,), dtype uint16
+    """
+    packed = np.packbits(np.asarray(timing, dtype=bool), axis=1, bitorder="little")
+    packed = np.pad(packed, ((0, 0), (0, 2 - packed.shape[1])))
+    return packed.view("<u2")[:, 0].astype(np.uint16)
+
+
+def unpack_timing(timing_bits: np.ndarray) -> np.ndarray:
+    """
+    Returns:
+      (np.ndarray): timing of shape (pop_size, TIMING_DIM), dtype uint8
+    """
+    as_bytes = timing_bits.astype("<u2").view(np.uint8).reshape(-1, 2)
+    return np.unpackbits(as_bytes, axis=1, bitorder="little")[:, :TIMING_DIM]
+
+
+# A chromosome on the wire (see Population.to_bytes), packed with no padding
+RECORD_DTYPE = np.dtype(
+    [
+        ("instrument", "u1"),
+        ("expression", "<f4", (EXPRESSION_DIM,)),
+        ("timing_bits", "<u2"),
+    ]
+)
+
+
+class Population:
+    def __init__(
+        self, instrument: np.ndarray, expression: np.ndarray, timing_bits: np.ndarray
+    ) -> None:
+        """A population of music chromosomes. The instrument, expression and
+        timing_bits attributes are the underlying arrays, so reading or
+        writing them (or slices of them) doesn't copy.
+        """
+        self.instrument = np.asarray(instrument, dtype=np.uint8)
+        self.expression = np.asarray(expression, dtype=np.float32)
+        self.timing_bits = np.asarray(timing_bits, dtype=np.uint16)
+
+    @classmethod
+    def empty(cls, pop_size):
+        return cls(
+            np.empty(pop_size, dtype=np.uint8),
+            np.empty((pop_size, EXPRESSION_DIM), dtype=np.float32),
+            np.empty(pop_size, dtype=np.uint16),
+        )
+
+    @classmethod
+    def from_array(cls, population: np.ndarray):
+        """
+        Args:
+          population (np.ndarray): chromosomes in the float64 row layout, shape
+            (pop_size, CHROMOSOME_DIM)
+        """
+        population = np.atleast_2d(population)
+        return cls(
+            population[:, 0],
+            population[:, 1 : EXPRESSION_DIM + 1],
+            pack_timing(population[:, EXPRESSION_DIM + 1 :]),
+        )
+
+    @property
+    def timing(self) -> np.ndarray:
+        """
+        Returns:
+          (np.ndarray): unpacked copy of the timing information, as integers
+        """
+        return unpack_timing(self.timing_bits)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            a.nbytes for a in (self.instrument, self.expression, self.timing_bits)
+        )
+
+    def to_array(self) -> np.ndarray:
+        """
+        Returns:
+          (np.ndarray): the population in the float64 row layout, shape
+            (pop_size, CHROMOSOME_DIM)
+        """
+        out = np.empty((len(self), CHROMOSOME_DIM))
+        out[:, 0] = self.instrument
+        out[:, 1 : EXPRESSION_DIM + 1] = self.expression
+        out[:, EXPRESSION_DIM + 1 :] = self.timing
+        return out
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        # Lets a Population be passed anywhere a design matrix is expected. The
+        # row layout is always built anew, so it can't be had without a copy.
+        if copy is False:
+            raise ValueError("Converting a Population to an array always copies")
+        out = self.to_array()
+        return out if dtype is None else out.astype(dtype, copy=False)
+
+    def __len__(self) -> int:
+        return len(self.instrument)
+
+    def __getitem__(self, idx):
+        """An integer index gives a single chromosome in the float64 row layout,
+        so get_instrument etc. keep working. Any other index gives a Population
+        (a view for slices, a copy for index arrays, as with numpy).
+        """
+        if np.isscalar(idx):
+            return self.to_array_row(idx)
+        return Population(
+            self.instrument[idx], self.expression[idx], self.timing_bits[idx]
+        )
+
+    def __setitem__(self, idx, other) -> None:
+        if not isinstance(other, Population):
+            other = Population.from_array(other)
+        self.instrument[idx] = other.instrument
+        self.expression[idx] = other.expression
+        self.timing_bits[idx] = other.timing_bits
+
+    @classmethod
+    def concatenate(cls, populations):
+        return cls(
+            np.concatenate([p.instrument for p in populations]),
+            np.concatenate([p.expression for p in populations]),
+            np.concatenate([p.timing_bits for p in populations]),
+        )
+
+    def to_bytes(self) -> bytes:
+        """
+        Returns:
+          (bytes): the population as consecutive little-endian RECORD_DTYPE
+            records, 67 bytes per chromosome
+        """
+        records = np.empty(len(self), dtype=RECORD_DTYPE)
+        records["instrument"] = self.instrument
+        records["expression"] = self.expression
+        records["timing_bits"] = self.timing_bits
+        return records.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        records = np.frombuffer(data, dtype=RECORD_DTYPE)
+        return cls(
+            records["instrument"].copy(),
+            records["expression"].copy(),
+            records["timing_bits"].copy(),
+        )
+
+    def to_array_row(self, i) -> np.ndarray:
+        i = range(len(self))[i]  # Negative indices count from the end
+        return self[i : i + 1].to_array()[0]
+
+    def __repr__(self) -> str:
+        return f"Population(pop_size={len(self)}, nbytes={self.nbytes})"
+
+
+"""Compact generative music dynamics"""
+
+
+def compact_init_chromosome(pop_size, density=0.75, rng=None) -> Population:
+    rng = get_rng(rng)
+    population = Population.empty(pop_size)
+    population.instrument[:] = rng.integers(N_INSTRUMENTS, size=pop_size)
+    population.expression[:] = rng.random((pop_size, EXPRESSION_DIM))
+    population.timing_bits[:] = pack_timing(
+        rng.random((pop_size, TIMING_DIM)) < density
+    )
+    return population
+
+
+def compact_crossover(P1: Population, P2: Population, rng=None) -> Population:
+    rng = get_rng(rng)
+    n = len(P1)
+    instrument = np.where(rng.integers(2, size=n), P2.instrument, P1.instrument)
+
+    take_p2 = rng.integers(2, size=(n, EXPRESSION_DIM)).astype(bool)
+    expression = np.where(take_p2, P2.expression, P1.expression)
+
+    # Pick bars (groups of beats) from either parent
+    bar_mask = np.bitwise_or.reduce(
+        np.where(rng.integers(2, size=(n, N_BARS)), BAR_MASKS, 0), axis=1
+    ).astype(np.uint16)
+    timing_bits = (P1.timing_bits & ~bar_mask) | (P2.timing_bits & bar_mask)
+
+    return Population(instrument, expression, timing_bits)
+
+
+def compact_mutate(
+    population: Population, m_ins_prob=0.1, m_exp_prob=0.1, m_tim_prob=0.1, rng=None
+) -> Population:
+    """
+    Returns:
+      (Population): The mutated population. *Modifies* population in place.
+    """
+    rng = get_rng(rng)
+    n = len(population)
+
+    mask = rng.random(n) < m_ins_prob
+    population.instrument[mask] = rng.integers(
+        N_INSTRUMENTS, size=np.count_nonzero(mask)
+    )
+
+    mask = rng.random((n, EXPRESSION_DIM)) < m_exp_prob
+    population.expression[mask] = rng.random(np.count_nonzero(mask))
+
+    # Randomly flip bits according to m_tim_prob
+    population.timing_bits ^= pack_timing(rng.random((n, TIMING_DIM)) < m_tim_prob)
+
+    return population
+
+
+compact_music_dynamics = BatchGenAlgDynamics(
+    init=compact_init_chromosome,
+    selection=batch_roulette_wheel_selection,
+    crossover=compact_crossover,
+    mutate=compact_mutate,
+)
@@ -0,0 +1,175 @@
+"""
+profiling.py
+author: garrick
+
+Instrumentation for genetic_algorithm_step. Pass a StepObserver as observer
+and, after every step, its on_step() receives a StepProfile: wall time spent in
+each phase (evaluate, select, crossover, mutate), optionally the memory each
+phase allocated, and statistics of the evaluated population.
+
+Without an observer nothing is measured, so the cost is a few no-op context
+managers per generation.
+"""
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import nullcontext
+
+import numpy as np
+
+PHASES = ["evaluate", "select", "crossover", "mutate"]
+
+# seconds[phase] is the wall time of each phase. allocated[phase] is the peak
+# memory (in bytes) allocated during it (before Python 3.9, the memory it still
+# holds at the end), or allocated is None if allocations weren't tracked.
+# best, mean and diversity describe the evaluated population
+# (lower evaluations are better).
+StepProfile = namedtuple(
+    "StepProfile", ["seconds", "allocated", "best", "mean", "diversity"]
+)
+
+
+def population_diversity(population) -> float:
+    """Mean standard deviation of each gene across the population; 0 when
+    every individual is identical.
+    """
+    population = np.asarray(population, dtype=np.float64)
+    return float(np.mean(np.std(population, axis=0)))
+
+
+class PhaseTimer:
+    def __init__(self, track_allocations=False) -> None:
+        """Measures the phases of one step. Use as:
+
+            with timer.phase("evaluate"):
+                ...
+
+        Args:
+          track_allocations (bool): also measure allocations with tracemalloc,
+            starting it if needed (which slows down allocation considerably)
+        """
+        self.seconds = {}
+        self.allocated = None
+        if track_allocations:
+            self.allocated = {}
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        self.name = None
+
+    def phase(self, name):
+        self.name = name
+        return self
+
+    def __enter__(self):
+        if self.allocated is not None:
+            if hasattr(tracemalloc, "reset_peak"):  # Python 3.9+
+                tracemalloc.reset_peak()
+            self.start_memory = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.seconds[self.name] = time.perf_counter() - self.start
+        if self.allocated is not None:
+            current, peak = tracemalloc.get_traced_memory()
+            if not hasattr(tracemalloc, "reset_peak"):
+                # The peak may predate this phase, so count what it still holds
+                peak = current
+            self.allocated[self.name] = max(peak - self.start_memory, 0)
+
+    def profile(self, population, y) -> StepProfile:
+        return StepProfile(
+            seconds=self.seconds,
+            allocated=self.allocated,
+            best=float(np.min(y)),
+            mean=float(np.mean(y)),
+            diversity=population_diversity(population),
+        )
+
+
+class _NullTimer:
+    """Stands in for PhaseTimer when there's no observer."""
+
+    _context = nullcontext()
+
+    def phase(self, name):
+        return self._context
+
+
+NULL_TIMER = _NullTimer()
+
+
+def phase_timer(observer) -> PhaseTimer:
+    """A PhaseTimer for observer, or a no-op timer if observer is None."""
+    if observer is None:
+        return NULL_TIMER
+    return PhaseTimer(observer.track_allocations)
+
+
+class StepObserver:
+    def __init__(self, track_allocations=False) -> None:
+        """
+        Args:
+          track_allocations (bool): whether steps should measure allocations
+            (see PhaseTimer)
+        """
+        self.track_allocations = track_allocations
+
+    def on_step(self, profile: StepProfile) -> None:
+        """Called after every genetic_algorithm_step."""
+        raise NotImplementedError("Subclasses must override this function")
+
+
+class RecordingObserver(StepObserver):
+    def __init__(self, track_allocations=False) -> None:
+        """Keeps every profile in memory, e.g. for plotting."""
+        super().__init__(track_allocations)
+        self.profiles = []
+
+    def on_step(self, profile: StepProfile) -> None:
+        self.profiles.append(profile)
+
+    def phase_seconds(self) -> dict:
+        """
+        Returns:
+          (dict): for each phase, an array of its wall time in every step
+        """
+        return {
+            phase: np.array([p.seconds.get(phase, 0.0) for p in self.profiles])
+            for phase in PHASES
+        }
+
+    def stat(self, name) -> np.ndarray:
+        """
+        Args:
+          name (str): "best", "mean" or "diversity"
+        """
+        return np.array([getattr(p, name) for p in self.profiles])
+
+
+class LoggingObserver(StepObserver):
+    def __init__(self, stream=None, track_allocations=False) -> None:
+        """Writes a line per step to stream (default: stderr), e.g. a log
+        file.
+        """
+        super().__init__(track_allocations)
+        self.stream = stream
+        self.n_steps = 0
+
+    def on_step(self, profile: StepProfile) -> None:
+        phases = " ".join(
+            f"{phase}={seconds * 1e3:.2f}ms"
+            for phase, seconds in profile.seconds.items()
+        )
+        if profile.allocated is not None:
+            phases += " allocated " + " ".join(
+                f"{phase}={allocated / 1024:.0f}KiB"
+                for phase, allocated in profile.allocated.items()
+            )
+        print(
+            f"step {self.n_steps}: {phases} best={profile.best:.4g} "
+            f"mean={profile.mean:.4g} diversity={profile.diversity:.4g}",
+            file=self.stream or sys.stderr,
+        )
+        self.n_steps += 1
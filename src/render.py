@@ -0,0 +1,240 @@
+"""
+render.py
+author: garrick
+
+Offline audio rendering, for when there's no SuperCollider/ChucK server: batch
+generation on a headless machine, objectives on how chromosomes actually sound,
+and regression tests.
+
+Each instrument is a synthesized one-shot voice, loosely after those of
+sc/server.sc (kick, snare, snare-hop, hihat, open hihat, and the FM zaps), with
+the step's expression value shaping it. A whole population is rendered at once:
+every note of every chromosome is synthesized in one array per instrument, then
+overlap-added into place.
+"""
+import argparse
+import os
+import wave
+
+import numpy as np
+
+from function import Function
+from genetic import (
+    EXPRESSION_DIM,
+    N_INSTRUMENTS,
+    TIMING_DIM,
+    batch_init_chromosome,
+)
+from rng import get_rng
+from sequencer import STEP_BEATS, TEMPO_BPM
+
+SAMPLE_RATE = 22050
+VOICE_SECONDS = 0.5  # Length of a note; longer notes ring into later steps
+FEATURES = ["rms", "centroid", "zero_crossing_rate"]
+
+
+def _kick(t, e, noise):
+    # Pitch drops fast from ~150Hz; expression tunes it
+    freq = (50 + 100 * np.exp(-30 * t)) * (0.8 + 0.4 * e)
+    phase = 2 * np.pi * np.cumsum(freq, axis=-1) * (t[1] - t[0])
+    return np.sin(phase) * np.exp(-8 * t)
+
+
+def _snare(t, e, noise):
+    body = np.sin(2 * np.pi * (160 + 80 * e) * t) * np.exp(-15 * t)
+    return 0.6 * noise * np.exp(-20 * t) + 0.4 * body
+
+
+def _snare_hop(t, e, noise):
+    return noise * np.exp(-(40 + 40 * e) * t)
+
+
+def _hihat(t, e, noise):
+    hiss = np.diff(noise, axis=-1, prepend=0) / 2  # Crude highpass
+    return hiss * np.exp(-(60 + 60 * e) * t)
+
+
+def _hihat_open(t, e, noise):
+    hiss = np.diff(noise, axis=-1, prepend=0) / 2
+    return hiss * np.exp(-(6 + 6 * e) * t)
+
+
+def _zaps(t, e, noise):
+    # FM, with expression mapped like ~updateExpression of sc/server.sc
+    mod_freq = 5 + 35 * e
+    car_freq = 400 + 800 * e
+    mod = 3 * np.sin(2 * np.pi * mod_freq * t)
+    return np.sin(2 * np.pi * car_freq * t + mod) * np.exp(-t / 0.1)
+
+
+# Instrument number -> voice(t, expression, noise), evaluated on (n_notes,
+# voice_len) arrays (expression is (n_notes, 1))
+VOICES = [_kick, _snare, _snare_hop, _hihat, _hihat_open, _zaps]
+assert len(VOICES) == N_INSTRUMENTS
+
+
+def step_samples(sample_rate=SAMPLE_RATE, bpm=TEMPO_BPM, step_beats=STEP_BEATS):
+    return int(round(60 / bpm * step_beats * sample_rate))
+
+
+def render_population(
+    population,
+    sample_rate=SAMPLE_RATE,
+    n_loops=1,
+    bpm=TEMPO_BPM,
+    step_beats=STEP_BEATS,
+    rng=None,
+    chunk_size=64,
+) -> np.ndarray:
+    """Renders every chromosome of a population, looped n_loops times.
+
+    Args:
+      population: (n, CHROMOSOME_DIM) array, or a Population
+      rng: Generator or seed for the noise of the percussive voices
+      chunk_size (int): chromosomes synthesized at a time, bounding memory
+
+    Returns:
+      (np.ndarray): float32 samples in [-1, 1], shape (n, n_samples), where
+        n_samples covers every step plus the tail of the last note
+    """
+    population = np.asarray(population)
+    rng = get_rng(rng)
+    L = step_samples(sample_rate, bpm, step_beats)
+    k = int(np.ceil(VOICE_SECONDS * sample_rate / L))  # Steps a voice spans
+    t = np.arange(k * L) / sample_rate
+    noise = rng.uniform(-1, 1, size=k * L)
+
+    n_steps = TIMING_DIM * n_loops
+    samples = np.empty((len(population), (n_steps + k) * L), dtype=np.float32)
+    for start in range(0, len(population), chunk_size):
+        chunk = population[start : start + chunk_size]
+        samples[start : start + len(chunk)] = _render_chunk(
+            chunk, t, noise, L, k, n_loops
+        ).reshape(len(chunk), -1)
+    # Normalize by the worst case of overlapping notes, so nothing clips
+    samples /= k
+    return samples
+
+
+def _render_chunk(population, t, noise, L, k, n_loops) -> np.ndarray:
+    n = len(population)
+    instruments = population[:, 0].astype(np.int64)
+    expression = population[:, 1 : EXPRESSION_DIM + 1]
+    onsets = population[:, EXPRESSION_DIM + 1 :] > 0.5
+
+    # Synthesize every note: notes[i, step] is chromosome i's voice at step
+    notes = np.zeros((n, TIMING_DIM, k * L), dtype=np.float32)
+    for instrument, voice in enumerate(VOICES):
+        mask = (instruments == instrument)[:, np.newaxis] & onsets
+        if mask.any():
+            notes[mask] = voice(t, expression[mask][:, np.newaxis], noise)
+
+    # Overlap-add: frames[i, s] holds samples [s * L, (s + 1) * L) of
+    # chromosome i's loop; a note at step s spans frames s to s + k - 1
+    notes = notes.reshape(n, TIMING_DIM, k, L)
+    frames = np.zeros((n, TIMING_DIM * n_loops + k, L), dtype=np.float32)
+    for loop in range(n_loops):
+        start = loop * TIMING_DIM
+        for j in range(k):
+            frames[:, start + j : start + j + TIMING_DIM] += notes[:, :, j]
+    return frames
+
+
+def render_chromosome(chromosome, **kwargs) -> np.ndarray:
+    return render_population(np.asarray(chromosome)[np.newaxis], **kwargs)[0]
+
+
+def write_wav(path: str, samples: np.ndarray, sample_rate=SAMPLE_RATE) -> None:
+    """Writes mono float samples in [-1, 1] as 16-bit PCM."""
+    pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2")
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+
+
+def write_population_wavs(directory: str, population, **kwargs) -> list:
+    """Renders a population to directory/chromosome_<i>.wav.
+
+    Returns:
+      (list): paths of the written files
+    """
+    os.makedirs(directory, exist_ok=True)
+    sample_rate = kwargs.get("sample_rate", SAMPLE_RATE)
+    paths = []
+    for i, samples in enumerate(render_population(population, **kwargs)):
+        path = os.path.join(directory, f"chromosome_{i:04d}.wav")
+        write_wav(path, samples, sample_rate)
+        paths.append(path)
+    return paths
+
+
+def audio_features(samples: np.ndarray, sample_rate=SAMPLE_RATE) -> np.ndarray:
+    """
+    Args:
+      samples (np.ndarray): (n, n_samples) rendered audio
+
+    Returns:
+      (np.ndarray): (n, len(FEATURES)) RMS loudness, spectral centroid (Hz)
+        and zero crossing rate (per second) of each
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    rms = np.sqrt(np.mean(samples ** 2, axis=1))
+
+    magnitudes = np.abs(np.fft.rfft(samples, axis=1))
+    freqs = np.fft.rfftfreq(samples.shape[1], 1 / sample_rate)
+    total = magnitudes.sum(axis=1)
+    centroid = np.divide(
+        magnitudes @ freqs, total, out=np.zeros_like(total), where=total > 0
+    )
+
+    signs = np.signbit(samples)
+    crossings = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1)
+    zero_crossing_rate = crossings / (samples.shape[1] / sample_rate)
+
+    return np.column_stack([rms, centroid, zero_crossing_rate])
+
+
+class AudioFeatureFunc(Function):
+    def __init__(self, target, scale=None, sample_rate=SAMPLE_RATE, rng=None):
+        """Objective on how chromosomes sound: the scaled squared distance of
+        their audio features (see FEATURES) from target. Lower is better.
+
+        Args:
+          target (array-like): target value of each feature; NaN ignores it
+          scale (array-like): typical magnitude of each feature, so they're
+            weighted evenly (default: the target)
+        """
+        super().__init__(rng)
+        self.target = np.asarray(target, dtype=np.float64)
+        self.scale = self.target if scale is None else np.asarray(scale)
+        self.sample_rate = sample_rate
+
+    def eval(self, X: np.ndarray) -> np.ndarray:
+        # A fixed noise seed, so a chromosome always evaluates the same
+        samples = render_population(X, sample_rate=self.sample_rate, rng=0)
+        features = audio_features(samples, self.sample_rate)
+        distance = ((features - self.target) / self.scale) ** 2
+        return np.nansum(distance, axis=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render chromosomes to WAV files")
+    parser.add_argument("output_dir")
+    parser.add_argument("--pop-size", type=int, default=20)
+    parser.add_argument("--loops", type=int, default=2)
+    parser.add_argument("--sample-rate", type=int, default=SAMPLE_RATE)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    population = batch_init_chromosome(args.pop_size, rng=rng)
+    paths = write_population_wavs(
+        args.output_dir,
+        population,
+        sample_rate=args.sample_rate,
+        n_loops=args.loops,
+        rng=rng,
+    )
+    print(f"Wrote {len(paths)} files to {args.output_dir}")
@@ -0,0 +1,73 @@
+"""
+rng.py
+author: garrick
+
+Random number generation. Every random operator takes an rng argument: a
+numpy.random.Generator, or anything numpy.random.default_rng accepts (e.g. an
+int seed). Leaving it as None uses a shared module-level Generator, which seed()
+resets.
+
+Independent streams for parallel workers (islands, processes) should come from
+spawn(), so they're neither correlated nor irreproducible. Worker processes
+also inherit (when forked) or recreate the shared Generator, so process pools
+are made with worker_initializer() to give each worker its own.
+"""
+import multiprocessing
+
+import numpy as np
+
+_default_rng = np.random.default_rng()
+
+
+def seed(seed=None) -> None:
+    """Reseeds the shared Generator used when no rng is given."""
+    global _default_rng
+    _default_rng = np.random.default_rng(seed)
+
+
+def get_rng(rng=None) -> np.random.Generator:
+    """
+    Args:
+      rng: a Generator (returned as is), a seed, or None for the shared
+        Generator
+    """
+    if rng is None:
+        return _default_rng
+    return np.random.default_rng(rng)
+
+
+def spawn(rng, n: int) -> list:
+    """Makes n independent Generators with SeedSequence.spawn.
+
+    Args:
+      rng: a seed or SeedSequence (reproducible), or a Generator, which is
+        advanced to seed the new streams
+    """
+    if isinstance(rng, np.random.SeedSequence):
+        seed_seq = rng
+    elif isinstance(rng, np.random.Generator) or rng is None:
+        seed_seq = np.random.SeedSequence(get_rng(rng).integers(2 ** 63))
+    else:
+        seed_seq = np.random.SeedSequence(rng)
+    return [np.random.default_rng(child) for child in seed_seq.spawn(n)]
+
+
+def _init_worker(generators) -> None:
+    global _default_rng
+    _default_rng = generators.get()
+
+
+def worker_initializer(generators) -> dict:
+    """
+    Args:
+      generators: one Generator per worker, e.g. from spawn()
+
+    Returns:
+      (dict): initializer and initargs for a ProcessPoolExecutor of
+        len(generators) workers, replacing each worker's shared Generator with
+        one of generators
+    """
+    queue = multiprocessing.Queue()
+    for generator in generators:
+        queue.put(generator)
+    return {"initializer": _init_worker, "initargs": (queue,)}
@@ -150,6 +150,29 @@ Routine({
 		~updateTiming.value(\cur, timing);
 	}, "/next");
 
+	/*
+	note
+	----
+
+	Plays a single step of a part right away. Sent in timetagged bundles by
+	sequencer.py, which does the sequencing instead of the patterns when
+	genetic_demo.py is run with --sequence.
+	*/
+	OSCFunc({ | msg, time, addr, port |
+		var instrument, expression;
+		instrument = msg[1].asInteger;
+		expression = msg[2];
+
+		(instrument < ~buffers.size).if ({
+			Synth(\playBufMono, [\bufref, ~buffers[instrument], \amp, 1]);
+		}, {
+			Synth(~synthDefs[instrument - ~buffers.size], [
+				\modFreq, ~interpolateValue.value(5, 40, expression),
+				\carFreq, ~interpolateValue.value(400, 1200, expression)
+			]);
+		});
+	}, "/note");
+
 	/*
 	push
 	----
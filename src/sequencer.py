@@ -0,0 +1,186 @@
+"""
+sequencer.py
+author: garrick
+
+Python-side sequencing of chromosomes. Instead of leaving timing to the audio
+server, a Sequencer thread loops the parts (chromosomes) in step, and sends each
+step's notes as an OSC bundle timetagged with when it should sound, a bounded
+lookahead ahead of the playhead. The server plays bundles at their timetag, so
+jitter in sending (the network, or the GIL held by the genetic algorithm) is
+absorbed as long as it's less than the lookahead.
+
+Step times are computed from the start time and step index, never accumulated,
+so timing doesn't drift however long it plays.
+"""
+import threading
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+from genetic import TIMING_DIM, get_expression, get_instrument, get_timing
+from osc import ADDR_NOTE, OSCTransport, encode_message, timetag
+
+TEMPO_BPM = 220  # Matches the TempoClock of sc/server.sc
+STEP_BEATS = 1 / 2  # Each timing step is an eighth note
+LOOKAHEAD = 0.5  # Seconds of notes to keep scheduled ahead of the playhead
+TICK = 0.05  # Seconds between scheduler wakeups
+
+# queue_depth: bundles sent that haven't sounded yet; lead: seconds scheduled
+# ahead of now; late: steps sent after their time (played as soon as they
+# arrive); dropped: steps skipped because they were more than a lookahead late
+SequencerStats = namedtuple(
+    "SequencerStats",
+    [
+        "queue_depth",
+        "lead",
+        "n_sent",
+        "n_late",
+        "n_dropped",
+        "max_lateness",
+        "mean_lateness",
+    ],
+)
+
+
+def render_part(chromosome) -> list:
+    """Pre-renders a chromosome as the encoded note message of each of its
+    steps, or None for the steps where it's silent.
+    """
+    instrument = get_instrument(chromosome)
+    expression = get_expression(chromosome)
+    timing = get_timing(chromosome)
+    return [
+        encode_message(ADDR_NOTE, [instrument, float(expression[step])])
+        if timing[step]
+        else None
+        for step in range(TIMING_DIM)
+    ]
+
+
+class Sequencer:
+    def __init__(
+        self,
+        transport: OSCTransport,
+        bpm=TEMPO_BPM,
+        step_beats=STEP_BEATS,
+        lookahead=LOOKAHEAD,
+        tick=TICK,
+    ) -> None:
+        """
+        Args:
+          transport (OSCTransport): where to send the notes
+          lookahead (float): seconds scheduled ahead. Changes to the parts are
+            heard at most this late; sending stalls up to this long are
+            inaudible.
+          tick (float): seconds the scheduler sleeps between wakeups; must be
+            less than lookahead
+        """
+        self.transport = transport
+        self.step_duration = 60 / bpm * step_beats
+        self.lookahead = lookahead
+        self.tick = tick
+
+        self.parts = {}  # Name -> rendered part (see render_part())
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+        self.start_time = None
+        self.next_step = 0  # Index of the next step to schedule
+        self.in_flight = deque()  # Times of sent steps that haven't sounded
+        self.n_sent = 0
+        self.n_late = 0
+        self.n_dropped = 0
+        self.lateness = deque(maxlen=1000)  # Of the most recent late steps
+
+    def set_part(self, name, chromosome) -> None:
+        """Adds (or replaces) a part, looped in step with the others."""
+        rendered = render_part(chromosome)
+        with self.lock:
+            self.parts[name] = rendered
+
+    def remove_part(self, name) -> None:
+        with self.lock:
+            self.parts.pop(name, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.parts.clear()
+
+    def step_time(self, step) -> float:
+        return self.start_time + step * self.step_duration
+
+    def start(self, start_time=None) -> None:
+        """Starts playing from the first step at start_time (Unix time;
+        default: one lookahead from now).
+        """
+        if start_time is None:
+            start_time = time.time() + self.lookahead
+        self.start_time = start_time
+        self.next_step = 0
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stops scheduling. Bundles already sent still play."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _run(self) -> None:
+        while not self.stopped.is_set():
+            self.schedule(time.time())
+            self.stopped.wait(self.tick)
+
+    def schedule(self, now) -> None:
+        """Sends every step due to sound within the lookahead of now."""
+        # After a stall, skip straight past steps more than a lookahead late
+        late_by = now - self.lookahead - self.start_time
+        first = int(np.ceil(late_by / self.step_duration))
+        if first > self.next_step:
+            self.n_dropped += first - self.next_step
+            self.next_step = first
+
+        while self.step_time(self.next_step) < now + self.lookahead:
+            step = self.next_step
+            self.next_step += 1
+            t = self.step_time(step)
+
+            with self.lock:
+                if t < now:
+                    self.n_late += 1
+                    self.lateness.append(now - t)
+                notes = [part[step % TIMING_DIM] for part in self.parts.values()]
+            notes = [note for note in notes if note is not None]
+            if notes:
+                self.transport.send_bundle(notes, timetag(t))
+                with self.lock:
+                    self.n_sent += 1
+                    self.in_flight.append(t)
+        with self.lock:
+            self._prune(now)
+
+    def _prune(self, now) -> None:
+        # Call holding the lock. Drops the steps that have sounded by now.
+        while self.in_flight and self.in_flight[0] <= now:
+            self.in_flight.popleft()
+
+    def stats(self, now=None) -> SequencerStats:
+        now = time.time() if now is None else now
+        with self.lock:
+            self._prune(now)
+            queue_depth = len(self.in_flight)
+            n_sent, n_late = self.n_sent, self.n_late
+            lateness = np.array(self.lateness)
+        return SequencerStats(
+            queue_depth=queue_depth,
+            lead=max(self.step_time(self.next_step - 1) - now, 0.0),
+            n_sent=n_sent,
+            n_late=n_late,
+            n_dropped=self.n_dropped,
+            max_lateness=float(lateness.max()) if lateness.size else 0.0,
+            mean_lateness=float(lateness.mean()) if lateness.size else 0.0,
+        )
@@ -0,0 +1,472 @@
+"""
+session.py
+author: garrick
+
+Server-side state of an interactive genetic algorithm session: the current
+population, the user's ratings, the learned preferences and recent history.
+Each session has its own lock, so concurrent users never contend with each
+other, only with themselves.
+
+Advancing a generation (fitting the preferences and stepping the algorithm) is
+the slow part, so it's split in two: begin_advance() marks the session as
+advancing and returns right away, and advance() does the work, typically on a
+worker thread. Ratings are refused while advancing, so advance() can read the
+dataset and population without holding the lock, and only takes it to swap in
+the result.
+
+A SessionManager hosts many sessions in one process under a memory budget.
+Idle sessions are evicted least recently used first: their state is written to
+disk and the Session object stays behind as an empty shell, so any reference to
+it stays valid, and the state is loaded back on its next access.
+"""
+import os
+import pickle
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+from checkpoint import atomic_write
+from dataset import Dataset
+from function import LogRegUserPreferenceFunc
+from genetic import (
+    CHROMOSOME_DIM,
+    POPULATION_SIZE,
+    GenAlgGeneration,
+    genetic_algorithm_step,
+    init_population,
+)
+from history import GenAlgHistory, RingBufferSink
+from population import Population, compact_music_dynamics
+from stats import PopulationStats
+
+HISTORY_LENGTH = 100  # Generations kept per session
+SPILL_DIR = "sessions"  # Where SessionManager writes evicted sessions
+
+
+class ConflictError(RuntimeError):
+    """A request conflicts with the state of the session, e.g. it rates a
+    generation that's no longer current.
+    """
+
+
+def _population_nbytes(population) -> int:
+    # Without converting a compact Population to the float64 layout
+    if isinstance(population, Population):
+        return population.nbytes
+    return np.asarray(population).nbytes
+
+
+def _history_nbytes(history: RingBufferSink) -> int:
+    n = sum(_population_nbytes(p) for p in history.populations)
+    for _, argsort, evals in history.evaluated:
+        n += np.asarray(argsort).nbytes + np.asarray(evals).nbytes
+    return n
+
+
+class Session:
+    def __init__(
+        self,
+        function=LogRegUserPreferenceFunc,
+        dynamics=compact_music_dynamics,
+        pop_size=POPULATION_SIZE,
+        weighting=None,
+        seed=None,
+        history_length=HISTORY_LENGTH,
+    ) -> None:
+        """
+        Args:
+          function: SurrogateFunc subclass learning the user's preferences
+          weighting (Weighting): recency weighting of the ratings
+          seed: seed of the session's Generator (see rng.py)
+        """
+        self.id = uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.dynamics = dynamics
+        self.pop_size = pop_size
+        self.rng = np.random.default_rng(seed)
+
+        self.iter = 0
+        self.population = init_population(dynamics, pop_size, rng=self.rng)
+        self.dataset = Dataset(CHROMOSOME_DIM, weighting=weighting)
+        self.f = function(rng=self.rng)
+        self.n_fitted = 0  # Number of samples in dataset f has learned from
+        self.history = RingBufferSink(history_length)
+        self.stats = PopulationStats()  # Of every generation, unlike history
+        self.advancing = False
+        self.last_error = None  # Of the last advance, which runs unwatched
+        self.spill_path = None  # Where the state is while evicted
+        # Called as on_resident(self), holding the lock, after the session is
+        # unloaded or loaded back (by whichever method needed it); see
+        # SessionManager
+        self.on_resident = None
+
+    def state(self) -> dict:
+        """Everything needed to pick the session up again, save the history
+        (laid out like the REPL's checkpoints; see genetic_demo.py).
+        """
+        return {
+            "iter": self.iter,
+            "cur_population": self.population,
+            "dataset": self.dataset,
+            "n_fitted": self.n_fitted,
+            "f": self.f,
+            "rng": self.rng,
+        }
+
+    def restore(self, state: dict) -> None:
+        self.iter = state["iter"]
+        self.population = state["cur_population"]
+        self.dataset = state["dataset"]
+        self.n_fitted = state["n_fitted"]
+        self.f = state["f"]
+        self.rng = state["rng"]
+
+    @property
+    def resident(self) -> bool:
+        return self.spill_path is None
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the session's arrays; 0 while evicted.
+        The fitted model is left out, it's small next to the rest.
+        """
+        if not self.resident:
+            return 0
+        return (
+            _population_nbytes(self.population)
+            + self.dataset.nbytes
+            + _history_nbytes(self.history)
+            + self.stats.nbytes
+        )
+
+    def unload(self, path: str) -> bool:
+        """Writes the state to path and drops it from memory, unless the
+        session is busy (advancing, or in the middle of a request). It's loaded
+        back on the next access.
+
+        Returns:
+          (bool): whether the session was unloaded
+        """
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            if self.advancing or not self.resident:
+                return False
+            # Pickled together, so f still shares the session's Generator
+            saved = {
+                "state": self.state(),
+                "history": self.history,
+                "stats": self.stats,
+            }
+            atomic_write(path, pickle.dumps(saved, protocol=pickle.HIGHEST_PROTOCOL))
+            self.population = self.dataset = self.f = self.rng = None
+            self.history = self.stats = None
+            self.spill_path = path
+            if self.on_resident is not None:
+                self.on_resident(self)
+            return True
+        finally:
+            self.lock.release()
+
+    def _load(self) -> None:
+        # Call holding the lock
+        if self.resident:
+            return
+        with open(self.spill_path, "rb") as fp:
+            saved = pickle.load(fp)
+        os.remove(self.spill_path)
+        self.restore(saved["state"])
+        self.history = saved["history"]
+        self.stats = saved["stats"]
+        self.spill_path = None
+        if self.on_resident is not None:
+            self.on_resident(self)
+
+    def load(self) -> None:
+        """Loads the state back into memory, if it was evicted."""
+        with self.lock:
+            self._load()
+
+    def discard(self) -> None:
+        """Removes the evicted state from disk, if any."""
+        with self.lock:
+            if not self.resident:
+                os.remove(self.spill_path)
+
+    def record(self, generation: GenAlgGeneration) -> None:
+        """Adds an evaluated generation to the history and statistics, e.g.
+        one restored from a checkpoint's archive.
+        """
+        self.history.record(*generation)
+        self.stats.record(generation[0], generation[1])
+
+    def add_rating(self, chromosome, label: int) -> None:
+        """Records a rating of any chromosome, e.g. one still playing from a
+        previous generation.
+        """
+        with self.lock:
+            self._load()
+            self.dataset.append(chromosome, label)
+
+    def rate(self, generation: int, ratings) -> int:
+        """Records a batch of ratings of the current population.
+
+        Args:
+          generation (int): the generation rated, to catch ratings that raced
+            with an advance
+          ratings: (index, label) pairs; label 1 for like, 0 for dislike
+
+        Returns:
+          (int): total number of ratings in the session
+        """
+        ratings = np.asarray(ratings, dtype=np.int64).reshape(-1, 2)
+        idxs, labels = ratings[:, 0], ratings[:, 1]
+        if np.any((idxs < 0) | (idxs >= self.pop_size)):
+            raise ValueError(f"Chromosome indices must be in [0, {self.pop_size})")
+        if np.any((labels != 0) & (labels != 1)):
+            raise ValueError("Labels must be 0 (dislike) or 1 (like)")
+
+        with self.lock:
+            if self.advancing:
+                raise ConflictError("Session is advancing; rate the next generation")
+            if generation != self.iter:
+                raise ConflictError(
+                    f"Generation {generation} is not current ({self.iter})"
+                )
+            self._load()
+            rated = np.asarray(self.population[idxs])
+            for x, label in zip(rated, labels):
+                self.dataset.append(x, label)
+            return self.dataset.n_appended
+
+    def current(self):
+        """
+        Returns:
+          (int, population): the current generation and population
+        """
+        with self.lock:
+            self._load()
+            return self.iter, self.population
+
+    def recent_history(self) -> GenAlgHistory:
+        with self.lock:
+            self._load()
+            return self.history.history()
+
+    def statistics(self) -> np.ndarray:
+        """
+        Returns:
+          (np.ndarray): copy of the STATS_DTYPE records of every evaluated
+            generation
+        """
+        with self.lock:
+            self._load()
+            return self.stats.records.copy()
+
+    def fit_data(self, copy=True) -> tuple:
+        """
+        Returns:
+          (tuple): what f should be fit to at the next advance: the ratings
+            since the last advance if f learns online, otherwise all of them
+            (X, labels and weights)
+        """
+        with self.lock:
+            self._load()
+            if self.f.online:
+                data = self.dataset.since(self.n_fitted)
+            else:
+                dataset = self.dataset
+                data = (dataset.X, dataset.labels, dataset.weights)
+            return tuple(np.copy(a) for a in data) if copy else data
+
+    def step(self, f, rng, fit_data, population, observer=None):
+        """Fits f to fit_data and steps the algorithm from population. Touches
+        nothing of the session's, so it can run on copies of f and rng (e.g.
+        to compute the next generation speculatively).
+
+        Returns:
+          (population, np.ndarray, np.ndarray): the next population, and the
+            argsort and evaluations of population
+        """
+        if f.online:
+            f.partial_fit(*fit_data)
+        elif len(fit_data[0]) > 0:
+            X, labels, weights = fit_data
+            f.fit(X, labels, weights=weights)
+
+        return genetic_algorithm_step(
+            population,
+            f,
+            dynamics=self.dynamics,
+            pop_size=self.pop_size,
+            rng=rng,
+            observer=observer,
+        )
+
+    def apply_step(
+        self, population, argsort, evals, n_fitted, f=None, rng=None
+    ) -> GenAlgGeneration:
+        """Swaps in the result of step(). f and rng replace the session's if
+        the step ran on copies of them.
+
+        Args:
+          n_fitted (int): dataset.n_appended when fit_data() was taken
+
+        Returns:
+          (GenAlgGeneration): the generation just evaluated
+        """
+        with self.lock:
+            self._load()
+            generation = GenAlgGeneration(self.iter, self.population, argsort, evals)
+            self.record(generation)
+            self.population = population
+            self.n_fitted = n_fitted
+            if f is not None:
+                self.f, self.rng = f, rng
+            self.iter += 1
+            self.dataset.advance_generation()
+            return generation
+
+    def begin_advance(self) -> bool:
+        """
+        Returns:
+          (bool): False if the session was already advancing
+        """
+        with self.lock:
+            if self.advancing:
+                return False
+            self._load()
+            self.advancing = True
+            self.last_error = None
+            return True
+
+    def advance(self) -> None:
+        """Fits the preferences to the ratings and steps to the next
+        generation. Call begin_advance() first.
+
+        Nothing waits on an advance, so rather than raising, a failed one
+        leaves the generation as it was and its error in status().
+        """
+        try:
+            n_fitted = self.dataset.n_appended
+            new_population, argsort, evals = self.step(
+                self.f, self.rng, self.fit_data(copy=False), self.population
+            )
+            self.apply_step(new_population, argsort, evals, n_fitted)
+        except Exception as e:
+            with self.lock:
+                self.last_error = f"{type(e).__name__}: {e}"
+        finally:
+            with self.lock:
+                self.advancing = False
+
+    def status(self) -> dict:
+        """Includes the diversity of the last evaluated generation, if any
+        (see stats.py).
+        """
+        with self.lock:
+            self._load()
+            status = {
+                "id": self.id,
+                "generation": self.iter,
+                "pop_size": self.pop_size,
+                "n_ratings": self.dataset.n_appended,
+                "advancing": self.advancing,
+            }
+            if self.last_error is not None:
+                status["error"] = self.last_error
+            if len(self.stats) > 0:
+                latest = self.stats.latest()
+                for name in ["hamming_diversity", "duplicate_rate"]:
+                    status[name] = float(latest[name])
+            return status
+
+
+class SessionManager:
+    def __init__(self, memory_budget=None, spill_dir=SPILL_DIR) -> None:
+        """Keeps the sessions, by id, least recently used first.
+
+        Args:
+          memory_budget (int): bytes the sessions in memory may take (see
+            Session.nbytes); past it, the least recently used idle sessions
+            are evicted to spill_dir. None never evicts.
+          spill_dir (str): where evicted sessions are written; created when
+            first needed
+        """
+        self.sessions = OrderedDict()
+        self.sizes = {}  # Id -> nbytes of resident sessions at their last access
+        self.resident_bytes = 0
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.n_evictions = 0
+        self.lock = threading.Lock()
+
+    def _resident(self, session: Session) -> None:
+        # Sessions call this holding their own lock (so never the other way
+        # round) whenever they're loaded or unloaded, including the loads
+        # their methods do themselves.
+        with self.lock:
+            if session.id not in self.sessions:
+                return  # Deleted
+            if session.resident:
+                self.sessions.move_to_end(session.id)
+                size = session.nbytes
+                self.resident_bytes += size - self.sizes.get(session.id, 0)
+                self.sizes[session.id] = size
+            elif session.id in self.sizes:
+                self.resident_bytes -= self.sizes.pop(session.id)
+                self.n_evictions += 1
+
+    def _touch(self, session: Session) -> None:
+        # Call without holding the lock, so loading isn't done under it
+        with session.lock:
+            session._load()
+            self._resident(session)  # Measured again, it grows every generation
+        self._evict()
+
+    def _evict(self) -> None:
+        # Call without holding the lock; unloading writes to disk. Never
+        # evicts the most recently used session.
+        if self.memory_budget is None:
+            return
+        with self.lock:
+            ids = list(self.sessions)[:-1]
+            lru = [self.sessions[i] for i in ids if i in self.sizes]
+        for session in lru:
+            with self.lock:
+                if self.resident_bytes <= self.memory_budget:
+                    return
+            os.makedirs(self.spill_dir, exist_ok=True)
+            session.unload(os.path.join(self.spill_dir, f"{session.id}.pkl"))
+
+    def create(self, **kwargs) -> Session:
+        session = Session(**kwargs)
+        session.on_resident = self._resident
+        with self.lock:
+            self.sessions[session.id] = session
+        self._touch(session)
+        return session
+
+    def get(self, session_id) -> Session:
+        """Raises KeyError if there's no such session. Loads the session back
+        if it was evicted, and may evict others.
+        """
+        with self.lock:
+            session = self.sessions[session_id]
+        self._touch(session)
+        return session
+
+    def delete(self, session_id) -> None:
+        with self.lock:
+            session = self.sessions.pop(session_id)
+            self.resident_bytes -= self.sizes.pop(session_id, 0)
+        session.discard()
+
+    @property
+    def n_resident(self) -> int:
+        return len(self.sizes)
+
+    def __len__(self) -> int:
+        return len(self.sessions)
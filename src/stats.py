@@ -0,0 +1,135 @@
+"""
+stats.py
+author: garrick
+
+Per-generation statistics of music populations, computed once as each
+generation is produced and kept in a compact array of records (STATS_DTYPE),
+so plotting a run of thousands of generations never goes back to the
+populations themselves.
+
+Every statistic is O(pop_size) to compute except the duplicate rate, which
+sorts. The diversity measures are exact, from per-gene moments rather than
+pairwise distances (see diversity.py):
+
+  hamming_diversity: mean Hamming distance between the timing of two distinct
+    chromosomes, from how many chromosomes play each step
+  euclidean_diversity: root mean squared Euclidean distance between the
+    expression of two distinct chromosomes, from the variance of each gene
+"""
+import numpy as np
+
+from diversity import (
+    columns,
+    duplicate_rate,
+    mean_hamming_distance,
+    rms_euclidean_distance,
+)
+from genetic import EXPRESSION_DIM, N_INSTRUMENTS, TIMING_DIM
+from history import GenAlgHistory, HistorySink
+from population import unpack_timing
+
+STATS_DTYPE = np.dtype(
+    [
+        ("generation", "<i8"),
+        ("instrument_counts", "<i4", (N_INSTRUMENTS,)),
+        ("timing_density", "<f4", (TIMING_DIM,)),
+        ("expression_mean", "<f4", (EXPRESSION_DIM,)),
+        ("expression_var", "<f4", (EXPRESSION_DIM,)),
+        ("hamming_diversity", "<f8"),
+        ("euclidean_diversity", "<f8"),
+        ("duplicate_rate", "<f8"),
+    ]
+)
+
+
+class PopulationStats:
+    def __init__(self, capacity=64) -> None:
+        """Statistics of each generation recorded, in an array of STATS_DTYPE
+        records that doubles in size when full.
+        """
+        self.n = 0
+        self._records = np.zeros(capacity, dtype=STATS_DTYPE)
+
+    def record(self, generation, population) -> np.void:
+        """
+        Returns:
+          (np.void): the generation's record; fields are read like a dict's
+        """
+        if self.n == len(self._records):
+            self._records = np.resize(self._records, 2 * len(self._records))
+
+        cols = columns(population)
+        r = self._records[self.n]
+        r["generation"] = generation
+        r["instrument_counts"] = np.bincount(cols.instrument, minlength=N_INSTRUMENTS)
+        r["timing_density"] = unpack_timing(cols.timing_bits).mean(axis=0)
+        r["expression_mean"] = cols.expression.mean(axis=0)
+        r["expression_var"] = cols.expression.var(axis=0)
+        r["hamming_diversity"] = mean_hamming_distance(cols.timing_bits)
+        r["euclidean_diversity"] = rms_euclidean_distance(cols.expression)
+        r["duplicate_rate"] = duplicate_rate(cols)
+        self.n += 1
+        return r
+
+    @property
+    def records(self) -> np.ndarray:
+        """View of the records so far, shape (n,)."""
+        return self._records[: self.n]
+
+    def __getitem__(self, name) -> np.ndarray:
+        """
+        Args:
+          name (str): a field of STATS_DTYPE
+
+        Returns:
+          (np.ndarray): view of that statistic of every generation
+        """
+        return self.records[name]
+
+    def latest(self) -> np.void:
+        """Copy of the most recent generation's record, e.g. to adapt to
+        diversity.
+        """
+        if self.n == 0:
+            raise IndexError("No generations recorded yet")
+        return self._records[self.n - 1].copy()
+
+    @property
+    def nbytes(self) -> int:
+        return self._records.nbytes
+
+    def __len__(self) -> int:
+        return self.n
+
+    @classmethod
+    def from_populations(cls, populations, generations=None):
+        stats = cls(capacity=max(len(populations), 1))
+        if generations is None:
+            generations = range(len(populations))
+        for generation, population in zip(generations, populations):
+            stats.record(generation, population)
+        return stats
+
+
+class StatsSink(HistorySink):
+    def __init__(self, sink: HistorySink = None) -> None:
+        """Records PopulationStats of every generation, and passes it on to
+        sink, if any, to keep.
+        """
+        super().__init__()
+        self.sink = sink
+        self.stats = PopulationStats()
+
+    def record(self, generation, population, argsort=None, evals=None) -> None:
+        self.stats.record(generation, population)
+        if self.sink is not None:
+            self.sink.record(generation, population, argsort, evals)
+
+    def history(self) -> GenAlgHistory:
+        if self.sink is None:
+            return GenAlgHistory([], [], [])
+        return self.sink.history()
+
+    def close(self) -> None:
+        if self.sink is not None:
+            self.sink.close()
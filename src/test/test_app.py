@@ -0,0 +1,80 @@
+# Test app.py
+import time
+
+import numpy as np
+
+from app import *
+from genetic import EXPRESSION_DIM
+from population import Population
+
+
+def create(client, **options):
+    response = client.post("/sessions", json={"pop_size": 10, "seed": 0, **options})
+    assert response.status_code == 201
+    return response.get_json()["id"]
+
+
+def wait_for_generation(client, session_id, generation, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = client.get(f"/sessions/{session_id}").get_json()
+        if status["generation"] == generation and not status["advancing"]:
+            return status
+        time.sleep(0.01)
+    raise AssertionError("Session didn't advance in time")
+
+
+def test_population_formats():
+    client = app.test_client()
+    session_id = create(client)
+
+    packed = client.get(f"/sessions/{session_id}/population").get_json()
+    assert packed["generation"] == 0
+    assert len(packed["instrument"]) == 10
+    assert len(packed["expression"]) == 10 * EXPRESSION_DIM
+
+    response = client.get(f"/sessions/{session_id}/population?format=binary")
+    assert response.headers["X-Pop-Size"] == "10"
+    population = Population.from_bytes(response.data)
+    assert np.array_equal(population.instrument, packed["instrument"])
+    assert np.array_equal(population.timing_bits, packed["timing"])
+
+    assert client.delete(f"/sessions/{session_id}").status_code == 204
+    assert client.get(f"/sessions/{session_id}").status_code == 404
+
+
+def test_rate_and_advance():
+    client = app.test_client()
+    session_id = create(client)
+
+    ratings = {"generation": 0, "ratings": [[0, 1], [1, 0], [2, 1], [3, 0]]}
+    response = client.post(f"/sessions/{session_id}/ratings", json=ratings)
+    assert response.get_json()["n_ratings"] == 4
+    bad = {"generation": 0, "ratings": [[10, 1]]}
+    assert client.post(f"/sessions/{session_id}/ratings", json=bad).status_code == 400
+
+    response = client.post(f"/sessions/{session_id}/advance")
+    assert response.status_code == 202
+    wait_for_generation(client, session_id, 1)
+
+    # Ratings of the old generation are refused
+    response = client.post(f"/sessions/{session_id}/ratings", json=ratings)
+    assert response.status_code == 409
+
+    history = client.get(f"/sessions/{session_id}/history").get_json()
+    assert history["generations"] == [0]
+    assert len(history["best"]) == len(history["hamming_diversity"]) == 1
+
+
+def test_invalid_pop_size():
+    client = app.test_client()
+    for pop_size in ["many", None, 0, MAX_POP_SIZE + 1]:
+        response = client.post("/sessions", json={"pop_size": pop_size})
+        assert response.status_code == 400
+
+
+def test_invalid_seed():
+    client = app.test_client()
+    for seed in ["abc", -1, 1.5, True]:
+        response = client.post("/sessions", json={"pop_size": 10, "seed": seed})
+        assert response.status_code == 400
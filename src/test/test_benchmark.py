@@ -0,0 +1,15 @@
+# Test benchmark.py
+from benchmark import *
+
+
+def test_compare_flags_regressions():
+    baseline = {"results": {"a": {"seconds": 1.0}, "b": {"seconds": 1.0}}}
+    current = {"results": {"a": {"seconds": 1.05}, "b": {"seconds": 2.0}}}
+    rows = compare(baseline, current, threshold=0.1)
+    assert [(row[0], row[4]) for row in rows] == [("a", False), ("b", True)]
+
+
+def test_time_it():
+    result = time_it(lambda: None, min_time=0, max_repeats=3)
+    assert result["repeats"] == 1
+    assert result["seconds"] >= 0
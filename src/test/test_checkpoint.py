@@ -0,0 +1,62 @@
+# Test checkpoint.py
+from checkpoint import *
+from genetic import genetic_algorithm, genetic_algorithm_iter, rosenbrock_problem
+from function import RosenbrocksFunc
+import numpy as np
+
+
+def test_atomic_write(tmp_path):
+    path = str(tmp_path / "file")
+    atomic_write(path, b"one")
+    atomic_write(path, b"two")
+    assert open(path, "rb").read() == b"two"
+    assert os.listdir(tmp_path) == ["file"]
+
+
+def test_resume_is_bitwise_identical(tmp_path):
+    expected = genetic_algorithm(
+        RosenbrocksFunc, rosenbrock_problem, max_iters=20, rng=222
+    )
+
+    # Interrupted run, last checkpointed at generation 10
+    checkpointer = Checkpointer(str(tmp_path), every=5)
+    for generation in genetic_algorithm_iter(
+        RosenbrocksFunc, rosenbrock_problem, 20, checkpointer=checkpointer, rng=222
+    ):
+        if generation.generation == 12:
+            break
+    checkpointer.close()
+
+    resumed = genetic_algorithm(
+        RosenbrocksFunc,
+        rosenbrock_problem,
+        max_iters=20,
+        checkpointer=Checkpointer(str(tmp_path), every=5),
+        rng=0,  # Ignored: resuming restores the checkpointed Generator
+    )
+    assert len(resumed.populations) == 21
+    for a, b in zip(expected.populations, resumed.populations):
+        np.testing.assert_array_equal(a, b)
+    for a, b in zip(expected.evals, resumed.evals):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_stale_archives_are_ignored(tmp_path):
+    checkpointer = Checkpointer(str(tmp_path))
+    for generation in range(5):
+        checkpointer.record(generation)
+    checkpointer.save({})
+    checkpointer.close()
+    # Left over from a run saved at other generations
+    for start, generations in [(3, [30, 40]), (5, [50]), (7, [70])]:
+        atomic_write(checkpointer._archive_file(start), pickle.dumps(generations))
+
+    checkpointer = Checkpointer(str(tmp_path))
+    checkpointer.load()
+    assert len(os.listdir(tmp_path)) == 3  # state.pkl and the first two archives
+    for generation in range(5, 8):
+        checkpointer.record(generation)
+    checkpointer.save({})
+    (tmp_path / "archive_000000006.pkl").write_bytes(pickle.dumps([60]))
+    assert list(checkpointer.archive()) == list(range(8))
+    checkpointer.close()
@@ -0,0 +1,54 @@
+# Test dataset.py
+from dataset import *
+
+
+def test_dataset_grows():
+    dataset = Dataset(capacity=2)
+    for i in range(5):
+        dataset.append(np.full(3, i), i % 2)
+    assert len(dataset) == 5
+    assert dataset.capacity == 8
+    np.testing.assert_array_equal(dataset.X[:, 0], np.arange(5))
+    np.testing.assert_array_equal(dataset.labels, [0, 1, 0, 1, 0])
+
+    X_new, labels_new, weights_new = dataset.since(3)
+    np.testing.assert_array_equal(X_new[:, 0], [3, 4])
+    np.testing.assert_array_equal(labels_new, [1, 0])
+
+
+def test_empty_dataset():
+    dataset = Dataset()
+    assert len(dataset) == 0
+    assert dataset.X.size == 0
+
+
+def test_exponential_decay_evicts_old_samples():
+    dataset = Dataset(weighting=ExponentialDecay(half_life=1), min_weight=0.1)
+    for i in range(10):
+        dataset.append([i], 1)
+    # Weights are 1, 1/2, 1/4 and 1/8 for the newest four; the rest are evicted
+    np.testing.assert_allclose(dataset.weights, [1 / 8, 1 / 4, 1 / 2, 1])
+    np.testing.assert_array_equal(dataset.X[:, 0], [6, 7, 8, 9])
+    assert dataset.n_appended == 10
+
+    X_new, _, _ = dataset.since(8)
+    np.testing.assert_array_equal(X_new[:, 0], [8, 9])
+
+
+def test_sliding_window():
+    dataset = Dataset(weighting=SlidingWindow(size=3))
+    for i in range(5):
+        dataset.append([i], 0)
+    np.testing.assert_array_equal(dataset.X[:, 0], [2, 3, 4])
+    np.testing.assert_array_equal(dataset.weights, [1, 1, 1])
+
+
+def test_per_generation_decay():
+    dataset = Dataset(weighting=PerGenerationDecay(0.5), min_weight=0.2)
+    dataset.append([0], 0)
+    dataset.advance_generation()
+    dataset.append([1], 1)
+    np.testing.assert_allclose(dataset.weights, [0.5, 1])
+    dataset.advance_generation()
+    dataset.advance_generation()
+    np.testing.assert_array_equal(dataset.X[:, 0], [1])
@@ -0,0 +1,68 @@
+# Test diversity.py
+from scipy.spatial.distance import cdist
+
+from diversity import *
+from genetic import batch_init_chromosome
+from population import compact_init_chromosome
+
+
+def test_distances_match_brute_force():
+    population = compact_init_chromosome(50, rng=0)
+    timing = unpack_timing(population.timing_bits)
+    expression = population.expression.astype(np.float64)
+
+    hamming = hamming_distances(population.timing_bits)
+    np.testing.assert_array_equal(hamming, cdist(timing, timing, "hamming") * 16)
+    np.testing.assert_allclose(
+        euclidean_distances(expression), cdist(expression, expression), atol=1e-6
+    )
+
+    # Blocks of a few rows each, and dense arrays give the same distances
+    full = chromosome_distances(population)
+    blocks = [d for _, d in pairwise_blocks(population.to_array(), block_bytes=1600)]
+    assert len(blocks) > 1
+    np.testing.assert_allclose(np.vstack(blocks), full, atol=1e-6)
+    np.testing.assert_allclose(
+        paired_distances(population, population[::-1]), np.diag(full[:, ::-1])
+    )
+
+
+def test_population_estimates():
+    population = compact_init_chromosome(300, rng=0)
+    full = chromosome_distances(population)
+    exact = full[~np.eye(300, dtype=bool)].mean()
+    estimate, stderr = sampled_mean_distance(population, rng=0)
+    assert abs(estimate - exact) < 4 * stderr
+
+    hamming = hamming_distances(population.timing_bits).sum() / (300 * 299)
+    assert np.isclose(mean_hamming_distance(population.timing_bits), hamming)
+
+    # Bucketing only drops neighbors
+    exact_counts = niche_counts(population, sigma=1.5, n_bits=0)
+    lsh_counts = niche_counts(population, sigma=1.5, n_bits=3, rng=0)
+    assert np.all(exact_counts >= 1) and np.all(lsh_counts <= exact_counts + 1e-9)
+    shared = fitness_sharing(np.zeros(300) + np.arange(300), population, sigma=1.5)
+    assert shared.shape == (300,)
+
+
+def test_dedup_and_crowding():
+    population = batch_init_chromosome(10, rng=0)
+    doubled = np.vstack([population, population[:4]])
+    evals = np.arange(14.0)
+    deduped, deduped_evals = dedup(doubled, evals)
+    np.testing.assert_array_equal(deduped, population)
+    np.testing.assert_array_equal(deduped_evals, evals[:10])
+    assert np.isclose(duplicate_rate(doubled), 4 / 14)
+
+    # Rounding either side of 0 gives -0.0 and 0.0, which are still equal
+    near = np.repeat(population[:1], 2, axis=0)
+    near[:, 1] = [0.01, -0.01]
+    np.testing.assert_array_equal(unique_indices(near, tolerance=0.1), [0])
+
+    # Better offspring identical to a chromosome replace exactly that one
+    population, evals = population[:3], evals[:3]
+    new_population, new_evals = crowding_replacement(
+        population, evals, population[[2]], [-1.0], crowding_factor=30, rng=0
+    )
+    np.testing.assert_array_equal(new_evals, [0, 1, -1])
+    np.testing.assert_array_equal(new_population, population)
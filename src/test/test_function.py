@@ -1,5 +1,6 @@
 # Test functions.py
 from function import *
+from rng import get_rng, seed
 import pytest
 
 
@@ -30,3 +31,85 @@ def test_rosenbrocks_function():
     X = np.array([[1, 2]])
     y = f(X)
     assert y[0] == (1 - 1) ** 2 + 100 * (2 - 1 ** 2) ** 2
+
+
+@pytest.mark.parametrize("executor", ["process", "thread"])
+def test_parallel_function(executor):
+    X = np.random.random_sample((50, 2))
+    with ParallelFunc(
+        RosenbrocksFunc(), n_workers=2, n_chunks=3, executor=executor
+    ) as f:
+        np.testing.assert_allclose(f(X), RosenbrocksFunc()(X))
+        assert [(a, b) for a, b, _ in f.chunk_timings] == [(0, 16), (16, 33), (33, 50)]
+
+
+def test_parallel_function_repickles_after_fit():
+    X = np.random.random_sample((40, 4))
+    labels = (X[:, 0] > 0.5).astype(int)
+    surrogate = LogRegUserPreferenceFunc()
+    with ParallelFunc(surrogate, n_workers=2) as f:
+        f(X)
+        key, _ = f._pickled_function()
+        f(X)
+        assert f._pickled_function()[0] == key  # Pickled once
+        f.fit(X, labels)
+        np.testing.assert_allclose(f(X), surrogate(X))
+        assert f._pickled_function()[0] != key
+
+
+def test_parallel_function_wraps_online_surrogates():
+    X = np.random.random_sample((40, 4))
+    labels = (X[:, 0] > 0.5).astype(int)
+    surrogate = SGDUserPreferenceFunc()
+    seed(5)
+    expected = get_rng().random()
+    seed(5)
+    with ParallelFunc(surrogate, n_workers=2) as f:
+        assert get_rng().random() == expected  # Shared Generator untouched
+        assert f.online
+        f.partial_fit(X, labels)
+        np.testing.assert_allclose(f(X), surrogate(X))
+
+
+def test_sgd_user_preference_function():
+    f = SGDUserPreferenceFunc()
+    assert f.online
+    X = np.random.random_sample((20, 4))
+
+    f.partial_fit(X[:5], np.ones(5, dtype=int))
+    assert not f.is_fitted  # Only seen likes so far
+    f.partial_fit(X[5:], (X[5:, 0] > 0.5).astype(int))
+    assert f.is_fitted
+
+    y = f(X)
+    assert y.shape == (20,)
+    assert np.all((y >= 0) & (y <= 1))
+
+
+def test_cached_function():
+    f = CachedFunc(RosenbrocksFunc(), maxsize=3)
+    X = np.array([[1.0, 2.0], [0.0, 0.0], [1.0, 2.0]])
+    np.testing.assert_array_equal(f(X), RosenbrocksFunc()(X))
+    assert f.cache_info() == CacheInfo(hits=1, misses=2, maxsize=3, currsize=2)
+
+    f(X)
+    assert f.cache_info().hits == 4
+
+    f(np.array([[3.0, 3.0], [4.0, 4.0]]))  # Evicts the least recently used
+    assert f.cache_info().currsize == 3
+
+
+def test_cached_function_invalidated_on_refit():
+    surrogate = LogRegUserPreferenceFunc()
+    f = CachedFunc(surrogate)
+    X = np.random.random_sample((10, 3))
+    labels = (X[:, 0] > 0.5).astype(int)
+    labels[:2] = [0, 1]
+
+    f.fit(X, labels)
+    y = f(X)
+    np.testing.assert_array_equal(f(X), y)
+    assert f.cache_info().hits == 10
+
+    surrogate.fit(X, 1 - labels)  # Refit directly on the wrapped function
+    np.testing.assert_allclose(f(X), surrogate(X))
@@ -0,0 +1,150 @@
+# Test genetic.py
+from genetic import *
+from profiling import PHASES, RecordingObserver
+import pytest
+import tracemalloc
+
+
+def test_batch_music_dynamics_shapes():
+    population = batch_init_chromosome(50)
+    assert population.shape == (50, CHROMOSOME_DIM)
+
+    y = np.random.random_sample(50)
+    parent_idxs = batch_roulette_wheel_selection(y, 50)
+    assert parent_idxs.shape == (50, 2)
+    assert np.argmax(y) not in parent_idxs  # Worst individual has zero mass
+
+    children = batch_mutate(
+        batch_crossover(population[parent_idxs[:, 0]], population[parent_idxs[:, 1]])
+    )
+    assert children.shape == (50, CHROMOSOME_DIM)
+    assert np.all(np.isin(children[:, 0], np.arange(N_INSTRUMENTS)))
+    assert np.all(np.isin(children[:, EXPRESSION_DIM + 1 :], [0, 1]))
+
+
+def test_batch_crossover_keeps_bars_together():
+    P1 = np.zeros((100, CHROMOSOME_DIM))
+    P2 = np.ones((100, CHROMOSOME_DIM))
+    children = batch_crossover(P1, P2)
+    bars = children[:, EXPRESSION_DIM + 1 :].reshape(100, N_BARS, BAR_SIZE)
+    assert np.all(bars.min(axis=2) == bars.max(axis=2))
+
+
+@pytest.mark.parametrize(
+    "function, dynamics, batch_dynamics",
+    [
+        (RosenbrocksFunc, rosenbrock_problem, rosenbrock_batch_problem),
+        (BoothsFunc, booths_problem, booths_batch_problem),
+    ],
+)
+def test_batch_dynamics_match_scalar(function, dynamics, batch_dynamics):
+    scalar = genetic_algorithm(function, dynamics, max_iters=100, rng=222)
+    batch = genetic_algorithm(function, batch_dynamics, max_iters=100, rng=222)
+
+    # Both should find the neighbourhood of the global minimum
+    f = function()
+    assert np.min(f(scalar.populations[-1])) < 0.1
+    assert np.min(f(batch.populations[-1])) < 0.1
+
+
+@pytest.mark.parametrize(
+    "selection",
+    [
+        batch_roulette_wheel_selection,
+        batch_stochastic_universal_sampling,
+        batch_truncation_selection,
+        batch_tournament_selection,
+    ],
+)
+def test_batch_selection(selection):
+    y = np.random.random_sample(40)
+    parent_idxs = selection(y, 25)
+    assert parent_idxs.shape == (25, 2)
+    assert np.all((parent_idxs >= 0) & (parent_idxs < 40))
+
+    # Equal fitness shouldn't break proportionate selection
+    assert selection(np.ones(10), 5).shape == (5, 2)
+
+
+class _TopSpin(np.random.Generator):
+    # Draws 1.0, as a draw just under 1 can round to times the total mass
+    def random(self, size=None):
+        return np.ones(size) if size is not None else 1.0
+
+
+@pytest.mark.parametrize(
+    "selection", [batch_roulette_wheel_selection, batch_stochastic_universal_sampling]
+)
+def test_batch_selection_top_of_wheel(selection):
+    y = np.array([1.0, 0.0, 2.0, 3.0])  # The last one has no mass
+    parent_idxs = selection(y, 2, rng=_TopSpin(np.random.PCG64(0)))
+    assert parent_idxs.max() == 2
+
+
+def test_batch_truncation_selection_picks_from_top():
+    y = np.arange(100)[::-1].astype(float)
+    parent_idxs = batch_truncation_selection(y, 200, sample_size=5)
+    assert set(parent_idxs.flatten()) <= set(range(95, 100))
+
+
+def test_scalar_dynamics_accept_batched_selection():
+    dynamics = music_dynamics._replace(selection=batch_tournament_selection)
+    population = init_population(dynamics, 10)
+    new_population, _, _ = genetic_algorithm_step(
+        population, UniformRandomFunc(), dynamics=dynamics, pop_size=10
+    )
+    assert new_population.shape == population.shape
+
+
+def test_operators_without_rng_argument():
+    dynamics = music_dynamics._replace(
+        init=lambda: init_chromosome(),
+        selection=lambda y: roulette_wheel_selection(y),
+        crossover=lambda c1, c2: crossover(c1, c2),
+        mutate=lambda c: mutate(c),
+    )
+    population = init_population(dynamics, 10, rng=0)
+    new_population, _, _ = genetic_algorithm_step(
+        population, UniformRandomFunc(), dynamics=dynamics, pop_size=10, rng=0
+    )
+    assert new_population.shape == population.shape
+
+
+def test_seeded_runs_are_reproducible():
+    a = genetic_algorithm(RosenbrocksFunc, rosenbrock_batch_problem, 10, rng=7)
+    b = genetic_algorithm(RosenbrocksFunc, rosenbrock_batch_problem, 10, rng=7)
+    for x, y in zip(a.populations, b.populations):
+        np.testing.assert_array_equal(x, y)
+
+
+def test_step_observer():
+    observer = RecordingObserver(track_allocations=True)
+    genetic_algorithm(RosenbrocksFunc, rosenbrock_problem, 3, observer=observer)
+    tracemalloc.stop()
+    assert len(observer.profiles) == 3
+    profile = observer.profiles[0]
+    assert list(profile.seconds) == PHASES
+    assert all(allocated >= 0 for allocated in profile.allocated.values())
+    assert profile.best <= profile.mean
+    assert profile.diversity > 0
+
+
+def test_landscape(tmp_path):
+    surface = landscape(BoothsFunc, resolution=20, cache_dir=str(tmp_path))
+    assert surface.Z.shape == (20, 20)
+    x = np.array([[surface.X1[3, 5], surface.X2[3, 5]]])
+    assert surface.Z[3, 5] == BoothsFunc()(x)
+    assert landscape(BoothsFunc, resolution=20) is surface  # Memoized
+
+    from genetic import _landscapes
+
+    _landscapes.clear()
+    loaded = landscape(BoothsFunc, resolution=20, cache_dir=str(tmp_path))
+    np.testing.assert_array_equal(loaded.Z, surface.Z)
+
+
+def test_plot_populations_saves(tmp_path):
+    history = genetic_algorithm(BoothsFunc, booths_problem, max_iters=4, rng=0)
+    path = tmp_path / "populations.png"
+    plot_populations(history, BoothsFunc, generations=[0, 2, 4], save_path=str(path))
+    assert path.exists()
@@ -0,0 +1,67 @@
+# Test history.py
+from history import *
+from genetic import genetic_algorithm, genetic_algorithm_iter, rosenbrock_problem
+from function import RosenbrocksFunc
+
+
+def run(sink, max_iters=10):
+    return genetic_algorithm(
+        RosenbrocksFunc, rosenbrock_problem, max_iters=max_iters, sink=sink
+    )
+
+
+def test_keep_all_sink():
+    history = run(KeepAllSink())
+    assert len(history.populations) == 11
+    assert len(history.evals) == len(history.argsorts) == 10
+    assert history.generations is None
+
+
+def test_every_kth_sink():
+    history = run(EveryKthSink(4))
+    assert history.generations == [0, 4, 8]
+    assert len(history.populations) == len(history.evals) == 3
+
+
+def test_ring_buffer_sink():
+    history = run(RingBufferSink(3))
+    assert history.generations == [8, 9, 10]
+    assert len(history.evals) == 2  # Final generation isn't evaluated
+
+
+def test_disk_sink(tmp_path):
+    history = run(DiskSink(str(tmp_path)))
+    assert len(history.populations) == 11
+    assert history.populations[-1].shape == (20, 2)
+    np.testing.assert_array_equal(history.argsorts[3], np.argsort(history.evals[3]))
+
+
+def test_genetic_algorithm_iter():
+    generations = list(genetic_algorithm_iter(RosenbrocksFunc, rosenbrock_problem, 3))
+    assert [g.generation for g in generations] == [0, 1, 2, 3]
+    np.testing.assert_allclose(
+        generations[1].evals, RosenbrocksFunc()(generations[1].population)
+    )
+    assert generations[-1].evals is None
+
+
+def test_memmap_sink(tmp_path):
+    path = str(tmp_path / "run.gahist")
+    history = run(MemmapSink(path, n_gens=11, dtype=np.float32), max_iters=10)
+    assert history.populations.shape == (11, 20, 2)
+    assert history.populations.dtype == np.float32
+    assert len(history.evals) == 10
+
+    reopened = open_history(path)
+    np.testing.assert_array_equal(reopened.populations[7], history.populations[7])
+    np.testing.assert_array_equal(reopened.argsorts[3], np.argsort(reopened.evals[3]))
+
+
+def test_memmap_sink_partial_run(tmp_path):
+    path = str(tmp_path / "run.gahist")
+    sink = MemmapSink(path, n_gens=100)
+    for generation in genetic_algorithm_iter(RosenbrocksFunc, rosenbrock_problem, 4):
+        sink.record(*generation)
+    # Readers only see what's been written so far
+    assert len(open_history(path).populations) == 5
+    assert len(open_history(path).evals) == 4
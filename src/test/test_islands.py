@@ -0,0 +1,46 @@
+# Test islands.py
+from islands import *
+from function import RosenbrocksFunc
+from genetic import rosenbrock_batch_problem
+from population import compact_music_dynamics
+import pytest
+
+
+def test_migration_sources():
+    assert migration_sources("ring", 3) == [[2], [0], [1]]
+    assert migration_sources("full", 3) == [[1, 2], [0, 2], [0, 1]]
+    with pytest.raises(ValueError):
+        migration_sources("star", 3)
+
+
+def test_migrate():
+    populations = [np.full((4, 2), i, dtype=float) for i in range(3)]
+    final_evals = [np.arange(4, dtype=float) for _ in range(3)]
+    migrate(populations, final_evals, migration_sources("ring", 3), n_migrants=1)
+    # The worst individual (index 3) of each island came from its predecessor
+    assert [p[3, 0] for p in populations] == [2, 0, 1]
+    assert [p[0, 0] for p in populations] == [0, 1, 2]
+
+
+@pytest.mark.parametrize(
+    "function, dynamics",
+    [
+        (RosenbrocksFunc, rosenbrock_batch_problem),
+        (UniformRandomFunc, compact_music_dynamics),
+    ],
+)
+def test_island_genetic_algorithm(function, dynamics):
+    history = island_genetic_algorithm(
+        function,
+        dynamics,
+        max_iters=7,
+        pop_size=10,
+        n_islands=3,
+        migration_interval=3,
+        topology="full",
+        n_workers=2,
+    )
+    assert len(history.populations) == 8
+    assert len(history.evals) == 7
+    assert len(history.populations[-1]) == 30
+    assert history.evals[0].shape == (30,)
@@ -0,0 +1,53 @@
+# Test osc.py
+from osc import *
+from genetic import batch_init_chromosome, get_expression, get_timing
+from population import Population
+import pytest
+
+
+@pytest.fixture
+def sink():
+    sink = UDPSink()
+    yield sink
+    sink.close()
+
+
+def test_encode_matches_generic_encoder():
+    chromosome = batch_init_chromosome(1)[0]
+    args = (
+        [int(chromosome[0])]
+        + get_expression(chromosome).astype(np.float32).tolist()
+        + get_timing(chromosome).tolist()
+    )
+    encoded = ChromosomeEncoder().encode_message(chromosome)
+    assert bytes(encoded) == encode_message(ADDR_NEXT, args)
+
+
+def test_send_population_in_bundles(sink):
+    population = batch_init_chromosome(50)
+    transport = OSCTransport(sink.ip, sink.port, max_datagram_size=2048)
+    n_sent = transport.send_population(Population.from_array(population))
+    transport.close()
+
+    messages = []
+    for _ in range(n_sent):
+        datagram = sink.receive()
+        assert len(datagram) <= 2048
+        messages.extend(decode(datagram))
+    assert n_sent > 1 and len(messages) == 50
+    for (address, params), chromosome in zip(messages, population):
+        assert address == ADDR_NEXT
+        assert params[0] == chromosome[0]
+        np.testing.assert_allclose(params[1:17], chromosome[1:17], rtol=1e-6)
+        assert params[17:] == get_timing(chromosome).tolist()
+
+
+def test_send_message_and_bundle(sink):
+    transport = OSCTransport(sink.ip, sink.port)
+    transport.send_message(ADDR_PUSH, [])
+    assert decode(sink.receive()) == [(ADDR_PUSH, [])]
+    transport.send_bundle(
+        [encode_message(ADDR_CLEAR), encode_message("/setFreq", 2.5)], timetag()
+    )
+    assert decode(sink.receive()) == [(ADDR_CLEAR, []), ("/setFreq", [2.5])]
+    transport.close()
@@ -0,0 +1,44 @@
+# Test plot.py
+from plot import *
+
+
+def test_projection_cache():
+    rng = np.random.default_rng(0)
+    X = rng.random((40, 33))
+    projection = Projection()
+    X_proj = projection.project(X)
+    assert X_proj.shape == (40, 2)
+
+    # Same data, so no refit; training points land on their own embedding
+    X_again, Y_proj = projection.project(X.copy(), X[:5])
+    assert projection.n_fits == 1 and X_again is X_proj
+    assert not X_proj.flags.writeable  # Shared, so callers can't corrupt it
+    np.testing.assert_allclose(Y_proj, X_proj[:5])
+
+    projection.project(X[:-1])
+    assert projection.n_fits == 2
+
+
+def test_projection_pca_fallback():
+    # Too few points for t-SNE, so they're projected with PCA
+    X = np.random.default_rng(0).random((3, 33))
+    X_proj, Y_proj = Projection().project(X, X[:1])
+    assert X_proj.shape == (3, 2)
+    np.testing.assert_allclose(Y_proj, X_proj[:1])
+
+
+def test_voronoi_background():
+    rng = np.random.default_rng(0)
+    X_proj = rng.normal(size=(500, 2))
+    labels = (X_proj[:, 0] * X_proj[:, 1] > 0).astype(int)
+
+    xx, yy, exact = voronoi_background(X_proj, labels, 100, min_resolution=100)
+    knn = KNeighborsClassifier(n_neighbors=1).fit(X_proj, labels)
+    expected = knn.predict(np.c_[xx.ravel(), yy.ravel()]).reshape(100, 100)
+    np.testing.assert_array_equal(exact, expected)
+
+    # Coarse to fine only misses a few cells; out of time, it's coarser still
+    _, _, refined = voronoi_background(X_proj, labels, 100, min_resolution=16)
+    assert np.mean(refined == exact) > 0.99
+    _, _, rushed = voronoi_background(X_proj, labels, 100, time_budget=0)
+    assert rushed.shape == (100, 100) and np.mean(rushed == exact) > 0.9
@@ -0,0 +1,59 @@
+# Test population.py
+from population import *
+from genetic import batch_init_chromosome, genetic_algorithm, get_timing
+from function import UniformRandomFunc
+import pytest
+
+
+def test_round_trip():
+    dense = batch_init_chromosome(30)
+    population = Population.from_array(dense)
+    assert len(population) == 30
+    np.testing.assert_allclose(population.to_array(), dense, atol=1e-7)
+    np.testing.assert_array_equal(population.timing, dense[:, EXPRESSION_DIM + 1 :])
+    np.testing.assert_array_equal(get_timing(population[3]), get_timing(dense[3]))
+    assert population.nbytes * 3 < dense.nbytes
+    assert np.asarray(population, dtype=np.float32).dtype == np.float32
+    with pytest.raises(ValueError):
+        population.__array__(copy=False)
+    np.testing.assert_allclose(population[-1], dense[-1], atol=1e-7)
+    with pytest.raises(IndexError):
+        population[30]
+
+
+def test_bytes_round_trip():
+    population = compact_init_chromosome(7)
+    data = population.to_bytes()
+    assert len(data) == 7 * RECORD_DTYPE.itemsize == 7 * 67
+    np.testing.assert_array_equal(Population.from_bytes(data), population)
+
+
+def test_views_are_zero_copy():
+    population = compact_init_chromosome(10)
+    subset = population[2:5]
+    subset.expression[0] = 0.5
+    assert np.all(population.expression[2] == 0.5)
+
+
+def test_compact_crossover_keeps_bars_together():
+    P1 = Population.from_array(np.zeros((50, CHROMOSOME_DIM)))
+    P2 = Population.from_array(np.ones((50, CHROMOSOME_DIM)))
+    children = compact_crossover(P1, P2)
+    bars = children.timing.reshape(50, N_BARS, BAR_SIZE)
+    assert np.all(bars.min(axis=2) == bars.max(axis=2))
+
+
+def test_compact_mutate_flips_timing():
+    population = Population.from_array(np.zeros((50, CHROMOSOME_DIM)))
+    compact_mutate(population, m_ins_prob=0, m_exp_prob=0, m_tim_prob=1)
+    assert np.all(population.timing == 1)
+    assert np.all(population.instrument == 0)
+
+
+def test_compact_music_dynamics():
+    history = genetic_algorithm(
+        UniformRandomFunc, compact_music_dynamics, max_iters=5, pop_size=16
+    )
+    assert len(history.populations) == 6
+    assert isinstance(history.populations[-1], Population)
+    assert np.asarray(history.populations[-1]).shape == (16, CHROMOSOME_DIM)
@@ -0,0 +1,32 @@
+# Test render.py
+from render import *
+from genetic import genetic_algorithm, music_batch_dynamics
+
+
+def test_render_population():
+    population = batch_init_chromosome(5, rng=0)
+    samples = render_population(population, n_loops=2, rng=0, chunk_size=2)
+    L = step_samples()
+    assert samples.shape[0] == 5 and samples.shape[1] > 2 * TIMING_DIM * L
+    assert np.abs(samples).max() <= 1
+    single = render_chromosome(population[3], n_loops=2, rng=0)
+    np.testing.assert_array_equal(samples[3], single)
+
+    silent = population.copy()
+    silent[:, EXPRESSION_DIM + 1 :] = 0
+    assert not render_population(silent, rng=0).any()
+
+
+def test_write_wav(tmp_path):
+    paths = write_population_wavs(str(tmp_path), batch_init_chromosome(2), rng=0)
+    assert len(paths) == 2
+    with wave.open(paths[0]) as wav:
+        assert wav.getframerate() == SAMPLE_RATE
+        assert wav.getnframes() == render_population(batch_init_chromosome(1)).shape[1]
+
+
+def test_audio_feature_func():
+    f = AudioFeatureFunc([0.05, 2000.0, np.nan])
+    history = genetic_algorithm(f, music_batch_dynamics, max_iters=2, pop_size=8, rng=0)
+    assert history.evals[0].shape == (8,)
+    assert np.isfinite(history.evals[-1]).all()
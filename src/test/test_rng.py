@@ -0,0 +1,33 @@
+# Test rng.py
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from rng import *
+
+
+def test_get_rng():
+    rng = np.random.default_rng(0)
+    assert get_rng(rng) is rng
+    assert get_rng(5).random() == np.random.default_rng(5).random()
+    seed(3)
+    a = get_rng().random()
+    seed(3)
+    assert get_rng().random() == a
+
+
+def test_spawn_is_reproducible_and_independent():
+    a = [r.random(4) for r in spawn(11, 3)]
+    b = [r.random(4) for r in spawn(11, 3)]
+    np.testing.assert_array_equal(a, b)
+    assert not np.array_equal(a[0], a[1])
+
+
+def _draw(_):
+    time.sleep(0.1)  # So that each worker takes one
+    return get_rng().random()
+
+
+def test_workers_get_their_own_streams():
+    with ProcessPoolExecutor(2, **worker_initializer(spawn(0, 2))) as pool:
+        draws = list(pool.map(_draw, range(2)))
+    assert draws[0] != draws[1]
@@ -0,0 +1,54 @@
+# Test sequencer.py
+from sequencer import *
+from genetic import init_chromosome
+from osc import UDPSink, bundle_timetag, decode
+import pytest
+
+
+@pytest.fixture
+def sink():
+    sink = UDPSink()
+    yield sink
+    sink.close()
+
+
+def test_schedule_within_lookahead(sink):
+    chromosome = init_chromosome(density=1.0)
+    sequencer = Sequencer(OSCTransport(sink.ip, sink.port), lookahead=1.0)
+    sequencer.set_part("cur", chromosome)
+    sequencer.start_time = 100.0
+
+    sequencer.schedule(now=99.5)  # Steps in [100, 100.5)
+    n_steps = int(np.ceil(0.5 / sequencer.step_duration))
+    assert sequencer.n_sent == n_steps
+    for step in range(n_steps):
+        datagram = sink.receive()
+        assert bundle_timetag(datagram) == timetag(sequencer.step_time(step))
+        assert decode(datagram)[0][1][0] == get_instrument(chromosome)
+
+    stats = sequencer.stats(now=99.5)
+    assert stats.queue_depth == n_steps and stats.n_late == 0
+
+    # Steps that have sounded are dropped by scheduling alone
+    sequencer.schedule(now=101.0)
+    assert sequencer.in_flight[0] > 101.0
+
+
+def test_late_and_dropped_steps(sink):
+    sequencer = Sequencer(OSCTransport(sink.ip, sink.port), lookahead=0.5)
+    sequencer.set_part("cur", init_chromosome(density=1.0))
+    sequencer.start_time = 0.0
+    sequencer.schedule(now=0.75)  # Stalled: [0, 0.25) dropped, [0.25, 0.75) late
+    stats = sequencer.stats(now=0.75)
+    assert stats.n_dropped > 0 and stats.n_late > 0
+    assert 0 < stats.max_lateness <= 0.5
+
+
+def test_thread(sink):
+    sequencer = Sequencer(OSCTransport(sink.ip, sink.port), lookahead=0.2, tick=0.01)
+    sequencer.set_part("cur", init_chromosome(density=1.0))
+    sequencer.start()
+    time.sleep(0.3)
+    sequencer.stop()
+    assert sequencer.n_sent > 0
+    assert sequencer.stats().lead <= 0.2
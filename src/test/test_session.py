@@ -0,0 +1,78 @@
+# Test session.py
+import numpy as np
+
+from population import Population
+from session import *
+
+
+def test_eviction_and_rehydration(tmp_path):
+    manager = SessionManager(memory_budget=1, spill_dir=str(tmp_path))
+    first = manager.create(pop_size=10, seed=0)
+    first.rate(0, [[0, 1], [1, 0]])
+    twin = Session(pop_size=10, seed=0)
+    twin.rate(0, [[0, 1], [1, 0]])
+
+    # Over budget, so creating another evicts the least recently used
+    second = manager.create(pop_size=10, seed=1)
+    assert not first.resident and second.resident
+    assert manager.n_resident == 1 and len(manager) == 2
+    assert len(list(tmp_path.iterdir())) == 1
+
+    # Loaded back transparently, picking up exactly where it left off
+    assert manager.get(first.id) is first
+    assert first.resident and not second.resident
+    for session in [first, twin]:
+        assert session.begin_advance()
+        session.advance()
+    assert first.status()["n_ratings"] == 2
+    np.testing.assert_array_equal(first.current()[1], twin.current()[1])
+
+    manager.delete(second.id)
+    assert len(list(tmp_path.iterdir())) == 0
+
+
+def test_direct_loads_are_accounted(tmp_path):
+    manager = SessionManager(memory_budget=1, spill_dir=str(tmp_path))
+    first = manager.create(pop_size=10, seed=0)
+    second = manager.create(pop_size=10, seed=1)
+    assert not first.resident and manager.n_resident == 1
+
+    # Loaded back by its own method rather than through the manager
+    first.current()
+    assert first.resident and manager.n_resident == 2
+    assert manager.resident_bytes == first.nbytes + second.nbytes
+
+    # So it's evicted again once another session is used
+    manager.get(second.id)
+    assert not first.resident and manager.n_resident == 1
+    assert manager.resident_bytes == second.nbytes
+
+
+def test_nbytes_of_compact_populations():
+    session = Session(pop_size=10, seed=0)
+    assert isinstance(session.population, Population)
+    # Counted as stored, not as the 4x larger float64 layout
+    expected = session.population.nbytes + session.dataset.nbytes
+    assert session.nbytes == expected + session.stats.nbytes
+
+
+def test_busy_sessions_stay_resident(tmp_path):
+    manager = SessionManager(memory_budget=1, spill_dir=str(tmp_path))
+    first = manager.create(pop_size=10)
+    assert first.begin_advance()
+    manager.create(pop_size=10)
+    assert first.resident
+
+
+def test_failed_advance_is_reported():
+    session = Session(pop_size=10, seed=0)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("no luck")
+
+    session.step = fail
+    assert session.begin_advance()
+    session.advance()
+    status = session.status()
+    assert status["error"] == "RuntimeError: no luck"
+    assert status["generation"] == 0 and not status["advancing"]
@@ -0,0 +1,54 @@
+# Test stats.py
+from itertools import combinations
+
+from stats import *
+from genetic import batch_init_chromosome, genetic_algorithm, music_dynamics
+from function import UniformRandomFunc
+from history import KeepAllSink
+from population import Population, compact_init_chromosome
+
+
+def test_diversity_matches_pairwise():
+    population = compact_init_chromosome(30, rng=0)
+    timing = unpack_timing(population.timing_bits)
+    expression = population.expression.astype(np.float64)
+    pairs = list(combinations(range(30), 2))
+
+    hamming = np.mean([np.sum(timing[i] != timing[j]) for i, j in pairs])
+    squared = np.mean([np.sum((expression[i] - expression[j]) ** 2) for i, j in pairs])
+    assert np.isclose(mean_hamming_distance(population.timing_bits), hamming)
+    assert np.isclose(rms_euclidean_distance(expression), np.sqrt(squared))
+
+
+def test_population_stats():
+    stats = PopulationStats(capacity=1)
+    population = compact_init_chromosome(10, rng=0)
+    stats.record(0, population)
+    stats.record(1, Population.concatenate([population, population]))
+    stats.record(2, batch_init_chromosome(10, rng=1))  # Dense arrays work too
+
+    assert len(stats) == 3
+    np.testing.assert_array_equal(stats["generation"], [0, 1, 2])
+    np.testing.assert_array_equal(stats["instrument_counts"].sum(axis=1), [10, 20, 10])
+    np.testing.assert_allclose(stats["duplicate_rate"], [0, 0.5, 0])
+    # Doubling a population only adds the zero distances between the copies
+    hamming = stats["hamming_diversity"]
+    assert np.isclose(hamming[1], hamming[0] * 18 / 19)
+
+    # Latest records are copies, unaffected by the array growing
+    latest = stats.latest()
+    stats.record(3, population)
+    assert latest["generation"] == 2
+
+    populations = [population, population]
+    stats = PopulationStats.from_populations(populations, np.array([4, 7]))
+    np.testing.assert_array_equal(stats["generation"], [4, 7])
+
+
+def test_stats_sink():
+    sink = StatsSink(KeepAllSink())
+    history = genetic_algorithm(
+        UniformRandomFunc, music_dynamics, max_iters=5, pop_size=8, sink=sink, rng=0
+    )
+    assert len(sink.stats) == len(history.populations) == 6
+    assert sink.stats.latest()["generation"] == 5